@@ -0,0 +1,250 @@
+"""
+Ingestion guard for the detection endpoints.
+
+UploadLimitMiddleware rejects request bodies larger than MAX_UPLOAD_BYTES
+with 413. It checks Content-Length up front and counts bytes as they arrive,
+so an oversized upload is never spooled in full. Multipart uploads over
+UPLOAD_SPOOL_BYTES are spooled to a temp file (in $TMPDIR) instead of
+being held in memory.
+
+AdmissionController bounds how many detections run at once. A request
+waits in a short queue for one of MAX_CONCURRENT_DETECTIONS slots, which
+the endpoint takes once the upload is received, around detection only. It
+is turned away with 429 when the queue is full (already before its body is
+read), or with 503 when no slot frees up within ADMISSION_TIMEOUT seconds.
+Both responses carry a Retry-After estimated from recent detection times. Background jobs take
+the same slots, but wait for as long as it takes; a job is turned away with
+429 at submission instead when MAX_QUEUED_JOBS jobs are already queued.
+"""
+import asyncio
+import json
+import logging
+import math
+import os
+import time
+from contextlib import asynccontextmanager
+
+from fastapi import HTTPException
+from starlette.formparsers import MultiPartParser
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# --- Ingestion Limits ---
+# Largest request body accepted by the upload endpoints (default 1 GiB)
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(1024 ** 3)))
+# Uploads bigger than this are spooled to disk while they are received
+UPLOAD_SPOOL_BYTES = int(os.getenv("UPLOAD_SPOOL_BYTES", str(8 * 1024 ** 2)))
+# Detections running at once, and requests allowed to wait for one
+MAX_CONCURRENT_DETECTIONS = int(os.getenv("MAX_CONCURRENT_DETECTIONS", "2"))
+MAX_QUEUED_DETECTIONS = int(os.getenv("MAX_QUEUED_DETECTIONS", "8"))
+# Submitted jobs allowed to wait for a slot
+MAX_QUEUED_JOBS = int(os.getenv("MAX_QUEUED_JOBS", "32"))
+# Seconds a request waits for a slot before getting a 503
+ADMISSION_TIMEOUT = float(os.getenv("ADMISSION_TIMEOUT", "30"))
+# Retry-After (seconds) suggested before any detection has finished
+ADMISSION_RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", "5"))
+
+# Requests the limits apply to: (method, path)
+UPLOAD_ROUTES = {("POST", "/predict/"), ("POST", "/jobs/"), ("POST", "/stream/sessions")}
+ADMITTED_ROUTES = {("POST", "/predict/")}
+JOB_ROUTES = {("POST", "/jobs/")}
+
+
+def configure_spooling(spool_bytes=UPLOAD_SPOOL_BYTES):
+    """Sets the size above which multipart uploads go to a temp file (Starlette's default is 1 MB)."""
+    MultiPartParser.spool_max_size = spool_bytes
+
+
+class Saturated(Exception):
+    """Raised when a detection can't be admitted; carries the HTTP status and Retry-After."""
+
+    def __init__(self, status_code, detail, retry_after):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    A counting semaphore for detections with a bounded wait queue. Counts
+    are kept per kind ("request" or "job") for the /metrics gauges.
+    """
+
+    def __init__(self, slots=MAX_CONCURRENT_DETECTIONS, max_queued=MAX_QUEUED_DETECTIONS, timeout=ADMISSION_TIMEOUT,
+                 max_queued_jobs=MAX_QUEUED_JOBS):
+        self.slots = max(1, slots)
+        self.max_queued = max_queued
+        self.max_queued_jobs = max_queued_jobs
+        self.timeout = timeout
+        self._semaphore = asyncio.Semaphore(self.slots)
+        self.active = 0
+        self.waiting = {"request": 0, "job": 0}
+        # Smoothed seconds a detection holds its slot, for Retry-After
+        self._hold_seconds = None
+
+    def retry_after(self):
+        """Seconds until a retry has a fair chance: the queue ahead drained across the slots."""
+        hold = self._hold_seconds if self._hold_seconds is not None else ADMISSION_RETRY_AFTER
+        ahead = sum(self.waiting.values()) + 1
+        return min(300, max(1, math.ceil(hold * ahead / self.slots)))
+
+    def _reject(self, status_code, reason, detail):
+        metrics.inc("ev_admission_rejected_total", reason=reason)
+        logger.warning(f"Rejected detection ({reason}): {self.active} running, {self.waiting['request']} requests "
+                       f"and {self.waiting['job']} jobs waiting.")
+        raise Saturated(status_code, detail, self.retry_after())
+
+    def check_request_queue(self):
+        """Raises Saturated (429) when every slot is taken and max_queued requests are already waiting."""
+        if self._semaphore.locked() and self.waiting["request"] >= self.max_queued:
+            self._reject(429, "queue_full", "Too many detections queued; retry later.")
+
+    def check_job_queue(self):
+        """Raises Saturated (429) when max_queued_jobs jobs are already waiting for a slot."""
+        if self.waiting["job"] >= self.max_queued_jobs:
+            self._reject(429, "job_queue_full", "Too many detection jobs queued; retry later.")
+
+    def reserve_job(self):
+        """
+        Counts a submitted job as queued, or raises Saturated (429) when the
+        job queue is full. The job's slot(reserved=True) takes the reservation
+        over; release_job() gives it back if the job never gets that far.
+        """
+        self.check_job_queue()
+        self.waiting["job"] += 1
+
+    def release_job(self):
+        self.waiting["job"] -= 1
+
+    @asynccontextmanager
+    async def slot(self, kind="request", reserved=False):
+        """
+        Holds a detection slot for the block. Requests are rejected (Saturated)
+        when the queue is full or the wait exceeds the timeout; jobs just wait.
+        reserved=True for a job already counted as queued by reserve_job().
+        """
+        if kind == "request":
+            self.check_request_queue()
+        if not reserved:
+            self.waiting[kind] += 1
+        queued = time.perf_counter()
+        try:
+            if kind == "request":
+                await asyncio.wait_for(self._semaphore.acquire(), self.timeout)
+            else:
+                await self._semaphore.acquire()
+        except asyncio.TimeoutError:
+            self._reject(503, "timeout", f"No detection slot freed up within {self.timeout:g}s; retry later.")
+        finally:
+            self.waiting[kind] -= 1
+        metrics.observe("ev_admission_wait_seconds", time.perf_counter() - queued, kind=kind)
+
+        self.active += 1
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._semaphore.release()
+            held = time.perf_counter() - started
+            self._hold_seconds = held if self._hold_seconds is None else 0.8 * self._hold_seconds + 0.2 * held
+
+    def gauges(self):
+        """Point-in-time values for GET /metrics."""
+        return {
+            "ev_admission_slots": self.slots,
+            "ev_admission_active": self.active,
+            "ev_admission_queue_depth": {(("kind", kind),): count for kind, count in self.waiting.items()},
+        }
+
+
+# --- ASGI Middleware ---
+async def _send_error(send, status_code, detail, headers=()):
+    body = json.dumps({"detail": detail}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status_code,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()), *headers],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+def _route(scope):
+    return scope.get("method"), scope.get("path")
+
+
+class UploadLimitMiddleware:
+    """Answers 413 for request bodies to UPLOAD_ROUTES larger than max_bytes."""
+
+    def __init__(self, app, max_bytes=MAX_UPLOAD_BYTES, routes=UPLOAD_ROUTES):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.routes = routes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or _route(scope) not in self.routes:
+            await self.app(scope, receive, send)
+            return
+
+        detail = f"Upload exceeds the {self.max_bytes:,} byte limit."
+        headers = dict(scope.get("headers", []))
+        content_length = headers.get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > self.max_bytes:
+            metrics.inc("ev_admission_rejected_total", reason="too_large")
+            await _send_error(send, 413, detail)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    metrics.inc("ev_admission_rejected_total", reason="too_large")
+                    # FastAPI passes HTTPExceptions raised while reading the body straight through
+                    raise HTTPException(status_code=413, detail=detail)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+async def _send_saturated(send, saturated):
+    await _send_error(send, saturated.status_code, saturated.detail,
+                      headers=[(b"retry-after", str(saturated.retry_after).encode())])
+
+
+class AdmissionMiddleware:
+    """
+    Turns requests to ADMITTED_ROUTES away before their body is read while
+    the detection queue is full, so saturated servers don't receive uploads
+    they would reject. It holds no slot: the endpoint takes one around
+    detection, after the upload is received. Submissions to JOB_ROUTES are
+    turned away the same way while the job queue is full; the endpoint
+    reserves the job's place in the queue.
+    """
+
+    def __init__(self, app, controller, routes=ADMITTED_ROUTES, job_routes=JOB_ROUTES):
+        self.app = app
+        self.controller = controller
+        self.routes = routes
+        self.job_routes = job_routes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        route = _route(scope)
+        try:
+            if route in self.job_routes:
+                self.controller.check_job_queue()
+            if route in self.routes:
+                self.controller.check_request_queue()
+        except Saturated as saturated:
+            await _send_saturated(send, saturated)
+            return
+        await self.app(scope, receive, send)
@@ -1,95 +1,59 @@
 import pandas as pd
 import numpy as np
-import joblib
+import dos_windows
+import geo_detection
+from conflict_engine import conflict_flags
+from dos_windows import DOS_WINDOW_DETECTION, WINDOW_KEYS, window_flags
+from geo_detection import GEO_DETECTION, GEO_CHECKS, GEO_COLUMNS, FANOUT_WINDOW_MINUTES, geo_columns, geo_flags, hash_ids
+from compiled_forest import CompiledIsolationForest
+from metrics import stage, merge_timings
+from model_registry import ModelRegistry, MODEL_FILES
 from pathlib import Path
 import os
+import hashlib
+import json
+import tempfile
+import weakref
 import logging # Use logging instead of print for consistency
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG) # Set to DEBUG to see more info
 logger = logging.getLogger(__name__)
 
-# --- Path Calculation ---
-# This assumes anomaly_detector.py is in the 'backend' folder
-# and the main project structure is 'ev-anamoly-detection/ev-anomaly-detection/'
-try:
-    script_dir = Path(__file__).resolve().parent
-    logger.debug(f"anomaly_detector.py script directory: {script_dir}")
-    # Go up one level (to ev-anomaly-detection), then into 'ev-anomaly-detection' subfolder
-    project_root = script_dir.parent
-    logger.debug(f"Calculated project root directory: {project_root}")
-    # Construct the model directory path relative to the project structure
-    model_dir = project_root / 'ev-anomaly-detection' / 'models'
-    logger.debug(f"Expecting models directory at: {model_dir}")
-
-    # --- Debugging: Check if paths exist and list contents ---
-    logger.debug(f"Does script_dir exist? {script_dir.exists()}")
-    logger.debug(f"Does project_root exist? {project_root.exists()}")
-    logger.debug(f"Does model_dir exist? {model_dir.exists()}")
-    if model_dir.exists():
-        logger.debug(f"Contents of model_dir ({model_dir}): {[p for p in model_dir.iterdir()]}")
-    else:
-        logger.error(f"model_dir ({model_dir}) does not exist.")
-        raise FileNotFoundError(f"Models directory was NOT found at the calculated path: {model_dir}")
-
-except Exception as e:
-    logger.error(f"Error calculating paths: {e}")
-    raise
-
-# --- Load Models and Scalers ---
-try:
-    # Check individual file existence before loading
-    dos_model_path = model_dir / "dos_model.pkl"
-    dos_scaler_path = model_dir / "dos_scaler.pkl"
-    fraud_model_path = model_dir / "fraud_model.pkl"
-    fraud_scaler_path = model_dir / "fraud_scaler.pkl"
-
-    required_files = [dos_model_path, dos_scaler_path, fraud_model_path, fraud_scaler_path]
-    missing_files = [f for f in required_files if not f.exists()]
-
-    if missing_files:
-        logger.error(f"Missing required model/scaler files: {[str(f) for f in missing_files]}")
-        raise FileNotFoundError(f"Missing required model/scaler files in {model_dir}")
-
-    dos_model = joblib.load(dos_model_path)
-    dos_scaler = joblib.load(dos_scaler_path)
-    logger.debug("DoS model and scaler loaded.")
-
-    fraud_model = joblib.load(fraud_model_path)
-    fraud_scaler = joblib.load(fraud_scaler_path)
-    logger.debug("Fraud model and scaler loaded.")
-
-except FileNotFoundError as e: # Catch specific error first
-     logger.error(f"Could not find required model/scaler files. Details: {e}")
-     raise RuntimeError(f"Models not found in '{model_dir}'. Please ensure the Jupyter notebook was run successfully and models exist there.") from e
-except Exception as e:
-    logger.error(f"An unexpected error occurred loading models: {e}")
-    raise RuntimeError(f"Failed to load models from '{model_dir}'.") from e
+# --- Model Registry ---
+# Models live in ev-anomaly-detection/models next to this backend folder,
+# unless MODEL_DIR points elsewhere. They are loaded on first use.
+model_dir = Path(os.getenv("MODEL_DIR", Path(__file__).resolve().parent.parent / 'ev-anomaly-detection' / 'models'))
+# "r" memory-maps the arrays in the model pickles so forked workers share them
+MODEL_MMAP_MODE = os.getenv("MODEL_MMAP_MODE") or None
+# Seconds between checks for new model files; 0 disables hot reload
+MODEL_RELOAD_CHECK_SECONDS = float(os.getenv("MODEL_RELOAD_CHECK_SECONDS", "30"))
+
+model_registry = ModelRegistry(model_dir, mmap_mode=MODEL_MMAP_MODE, check_interval=MODEL_RELOAD_CHECK_SECONDS)
+
+
+def __getattr__(name):
+    """Keeps anomaly_detector.dos_model etc. working; they now load lazily."""
+    if name in MODEL_FILES:
+        return model_registry.get(name)
+    if name == "MODEL_VERSION":
+        return model_registry.version
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 # --- Anomaly Detection Functions ---
 
+# Columns needed by the multi-user conflict check
+CONFLICT_COLUMNS = ['session_id', 'user_id', 'start_time', 'end_time']
+
 def detect_multi_user_conflict(df):
-    """Identifies sessions where a user's new session starts before their previous one ends."""
+    """Identifies sessions where a user's new session starts before one of their earlier ones ends."""
     logger.debug("Starting multi-user conflict detection.")
-    required_cols = ['user_id', 'start_time', 'end_time', 'session_id']
-    if not all(col in df.columns for col in required_cols):
-        logger.warning(f"Skipping multi-user conflict: Missing one of {required_cols}")
+    if not all(col in df.columns for col in CONFLICT_COLUMNS):
+        logger.warning(f"Skipping multi-user conflict: Missing one of {CONFLICT_COLUMNS}")
         return []
 
     try:
-        # Ensure correct data types (make copies to avoid SettingWithCopyWarning)
-        df_sorted = df.copy()
-        df_sorted['start_time'] = pd.to_datetime(df_sorted['start_time'], errors='coerce')
-        df_sorted['end_time'] = pd.to_datetime(df_sorted['end_time'], errors='coerce')
-        df_sorted = df_sorted.dropna(subset=['start_time', 'end_time']) # Drop rows where conversion failed
-
-        df_sorted = df_sorted.sort_values(by=['user_id', 'start_time'])
-
-        conflicts = df_sorted[
-            (df_sorted['user_id'] == df_sorted['user_id'].shift(1)) &
-            (df_sorted['start_time'] < df_sorted['end_time'].shift(1))
-        ]
-        conflict_ids = conflicts['session_id'].tolist()
+        flags = conflict_flags(df['user_id'], df['start_time'], df['end_time'])
+        conflict_ids = df['session_id'][flags].tolist()
         logger.debug(f"Found {len(conflict_ids)} multi-user conflicts.")
         return conflict_ids
     except Exception as e:
@@ -97,21 +61,53 @@ def detect_multi_user_conflict(df):
         return []
 
 
-def find_anomalies(df: pd.DataFrame) -> dict:
-    """
-    Main function to run all anomaly detection checks on a DataFrame.
-    Returns a dictionary: {"anomalies": list, "info": list}.
-    """
-    logger.info("Starting find_anomalies function.")
-    # --- ADDED DEBUGGING ---
-    logger.debug(f"Received DataFrame columns: {df.columns.tolist()}")
-    logger.debug(f"Data types:\n{df.dtypes}")
-    # -----------------------
+# Features scored by each IsolationForest model
+DOS_FEATURES = ['cpu_usage_percent', 'packets_per_sec']
+FRAUD_FEATURES = ['energy_kWh', 'amount_INR']
 
-    all_anomalies = []
-    info_messages = []
-    processed_session_ids = set() # Track processed IDs to avoid duplicates
+# Checks in anomaly_type order; a combined label joins the ones that flagged a session
+CHECKS = ['dos_attack', 'billing_fraud', 'multi_user_conflict'] + GEO_CHECKS
+
+# Combined anomaly_type label for each flag combination, indexed by
+# dos + 2 * fraud + 4 * conflict + 8 * travel + 16 * fanout
+_ANOMALY_TYPE_LABELS = np.array([
+    '+'.join(check for bit, check in enumerate(CHECKS) if combo >> bit & 1)
+    for combo in range(2 ** len(CHECKS))
+], dtype=object)
+
+
+# --- Detection Version ---
+# Bump when a code change alters what find_anomalies returns (checks, fields,
+# labels), so results cached by an older version are never served again
+DETECTION_VERSION = 1
 
+
+def detection_fingerprint(**extra):
+    """
+    Short hash of DETECTION_VERSION, the detection settings read from the
+    environment and any `extra` settings (e.g. the column mapping). Cached
+    results are only valid for the fingerprint they were computed under.
+    """
+    settings = {
+        "version": DETECTION_VERSION,
+        "checks": CHECKS,
+        "geo": [geo_detection.GEO_DETECTION, geo_detection.TRAVEL_MAX_KMH, geo_detection.TRAVEL_MIN_KM,
+                geo_detection.TRAVEL_MIN_GAP_MINUTES, geo_detection.FANOUT_WINDOW_MINUTES,
+                geo_detection.FANOUT_MAX_IPS, geo_detection.FANOUT_MAX_CHARGERS],
+        "dos_windows": [dos_windows.DOS_WINDOW_DETECTION, dos_windows.DOS_WINDOWS, dos_windows.DOS_WINDOW_MIN_SESSIONS,
+                        dos_windows.DOS_WINDOW_MAX_SESSIONS_PER_MIN, dos_windows.DOS_WINDOW_MAX_PACKETS],
+        **extra,
+    }
+    return hashlib.sha256(json.dumps(settings, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+def anomaly_type_labels(anomaly_type):
+    """Returns every stored anomaly_type label that includes the given check."""
+    return [label for label in _ANOMALY_TYPE_LABELS[1:] if anomaly_type in label.split('+')]
+
+
+def prepare_frame(df):
+    """Checks the essential columns and converts the time columns in place."""
     # --- Essential Column Check ---
     # These are absolutely needed for any processing
     essential_cols = ['session_id', 'start_time', 'end_time', 'user_id']
@@ -130,138 +126,459 @@ def find_anomalies(df: pd.DataFrame) -> dict:
         logger.error(msg)
         raise ValueError(msg)
 
-    # 1. 💻 DoS Attack Detection
-    dos_features = ['cpu_usage_percent', 'packets_per_sec']
-    if all(col in df.columns for col in dos_features):
-        logger.info("Attempting DoS detection...")
-        try:
-            # Select and ensure numeric type, coercing errors
-            X_dos = df[dos_features].apply(pd.to_numeric, errors='coerce')
-            valid_dos_rows = X_dos.dropna()
-
-            if not valid_dos_rows.empty:
-                X_dos_scaled = dos_scaler.transform(valid_dos_rows)
-                dos_predictions = dos_model.predict(X_dos_scaled)
-
-                # Map predictions back to original DataFrame index
-                dos_anomaly_indices = valid_dos_rows.index[dos_predictions == -1]
-                dos_anomalies_df = df.loc[dos_anomaly_indices]
-
-                logger.info(f"DoS model predicted {len(dos_anomalies_df)} anomalies.")
-
-                for index, row in dos_anomalies_df.iterrows():
-                    session_id = row['session_id']
-                    if session_id not in processed_session_ids:
-                         all_anomalies.append({
-                            'session_id': session_id,
-                            'anomaly_type': 'dos_attack',
-                            'timestamp': row['start_time'], # Keep as datetime for now
-                            'details': f"CPU: {row.get('cpu_usage_percent', 'N/A')}%, Packets: {row.get('packets_per_sec', 'N/A')}/sec"
-                        })
-                         processed_session_ids.add(session_id)
-            else:
-                 logger.warning("No valid numeric data found for DoS detection after coercion.")
-
-        except Exception as e:
-            logger.error(f"Error during DoS detection: {e}")
-            info_messages.append(f"DoS detection failed: {e}")
-    else:
-        msg = f"Skipping DoS detection: Missing one or more required columns ({dos_features})"
+
+# Score with scaler+forest pairs compiled to lookup tables (exact same results);
+# set COMPILED_SCORING=0 to call sklearn directly
+COMPILED_SCORING = os.getenv("COMPILED_SCORING", "1") != "0"
+# Threads per compiled scoring call (row blocks are scored in parallel)
+SCORING_THREADS = int(os.getenv("SCORING_THREADS", "1"))
+
+# Compiled pairs keyed by the loaded model object, so a hot reload recompiles
+_compiled_scorers = weakref.WeakKeyDictionary()
+
+
+def _predictor(model, scaler, name):
+    """Returns predict(raw_features) for a model/scaler pair, compiled when possible."""
+    if COMPILED_SCORING:
+        scaler_ref, compiled = _compiled_scorers.get(model, (None, None))
+        if scaler_ref is None or scaler_ref() is not scaler:
+            try:
+                compiled = CompiledIsolationForest(model, scaler, n_jobs=SCORING_THREADS)
+            except (TypeError, ValueError) as e:
+                logger.warning(f"⚠️ Using sklearn scoring for {name}: {e}")
+                compiled = None
+            _compiled_scorers[model] = (weakref.ref(scaler), compiled)
+        if compiled is not None:
+            return compiled.predict
+    return lambda X: model.predict(scaler.transform(X))
+
+
+def _score_model(df, features, scaler, model, name, info_messages):
+    """
+    Scores the rows of df that have numeric values for all features.
+    Returns a boolean Series aligned to df.index that is True for rows the
+    model predicts as anomalies.
+    """
+    flagged = pd.Series(False, index=df.index)
+    if not all(col in df.columns for col in features):
+        msg = f"Skipping {name} detection: Missing one or more required columns ({features})"
         logger.warning(msg)
         info_messages.append(msg)
+        return flagged
+
+    logger.info(f"Attempting {name} detection...")
+    try:
+        # Select and ensure numeric type, coercing errors
+        X = df[features].apply(pd.to_numeric, errors='coerce')
+        valid_rows = X.dropna()
+
+        if not valid_rows.empty:
+            predictions = _predictor(model, scaler, name)(valid_rows)
+            # Map predictions back to original DataFrame index
+            flagged.loc[valid_rows.index[predictions == -1]] = True
+            logger.info(f"{name} model predicted {int(flagged.sum())} anomalies.")
+        else:
+            logger.warning(f"No valid numeric data found for {name} detection after coercion.")
+    except Exception as e:
+        logger.error(f"Error during {name} detection: {e}")
+        info_messages.append(f"{name} detection failed: {e}")
+        flagged[:] = False
+    return flagged
+
 
+def score_rows(df, info_messages, timings=None, model_versions=None):
+    """
+    Runs the row-local model checks on a prepared DataFrame.
+    Returns (dos_mask, fraud_mask), boolean Series aligned to df.index.
+    Stage times are added to `timings` if a dict is given, and the version
+    of the models used to `model_versions` if a set is given.
+    """
+    with stage(timings, "model_load"):
+        version, (dos_scaler, dos_model, fraud_scaler, fraud_model) = model_registry.get_versioned(
+            "dos_scaler", "dos_model", "fraud_scaler", "fraud_model"
+        )
+    if model_versions is not None:
+        model_versions.add(version)
+    # 1. 💻 DoS Attack Detection
+    with stage(timings, "dos_scoring"):
+        dos_mask = _score_model(df, DOS_FEATURES, dos_scaler, dos_model, "DoS", info_messages)
     # 2. 💳 Billing Fraud Detection
-    fraud_features = ['energy_kWh', 'amount_INR']
-    if all(col in df.columns for col in fraud_features):
-        logger.info("Attempting Billing Fraud detection...")
-        try:
-             # Select and ensure numeric type, coercing errors
-            X_fraud = df[fraud_features].apply(pd.to_numeric, errors='coerce')
-            valid_fraud_rows = X_fraud.dropna()
-
-            if not valid_fraud_rows.empty:
-                X_fraud_scaled = fraud_scaler.transform(valid_fraud_rows)
-                fraud_predictions = fraud_model.predict(X_fraud_scaled)
-
-                # Map predictions back to original DataFrame index
-                fraud_anomaly_indices = valid_fraud_rows.index[fraud_predictions == -1]
-                fraud_anomalies_df = df.loc[fraud_anomaly_indices]
-
-                logger.info(f"Fraud model predicted {len(fraud_anomalies_df)} anomalies.")
-
-                for index, row in fraud_anomalies_df.iterrows():
-                    session_id = row['session_id']
-                    if session_id not in processed_session_ids:
-                         all_anomalies.append({
-                            'session_id': session_id,
-                            'anomaly_type': 'billing_fraud',
-                            'timestamp': row['start_time'], # Keep as datetime
-                            'details': f"Energy: {row.get('energy_kWh', 'N/A')} kWh, Amount: {row.get('amount_INR', 'N/A')} INR"
-                        })
-                         processed_session_ids.add(session_id)
-                    else:
-                        # Optionally: Add fraud details if session already flagged by DoS
-                        for existing_anomaly in all_anomalies:
-                            if existing_anomaly['session_id'] == session_id:
-                                existing_anomaly['details'] += f"; Fraud: Energy: {row.get('energy_kWh', 'N/A')} kWh, Amount: {row.get('amount_INR', 'N/A')} INR"
-                                existing_anomaly['anomaly_type'] += '+billing_fraud' # Combine types
-                                break
-            else:
-                 logger.warning("No valid numeric data found for Fraud detection after coercion.")
-
-        except Exception as e:
-            logger.error(f"Error during Billing Fraud detection: {e}")
-            info_messages.append(f"Billing Fraud detection failed: {e}")
-    else:
-        msg = f"Skipping Billing Fraud detection: Missing one or more required columns ({fraud_features})"
-        logger.warning(msg)
-        info_messages.append(msg)
+    with stage(timings, "fraud_scoring"):
+        fraud_mask = _score_model(df, FRAUD_FEATURES, fraud_scaler, fraud_model, "Billing Fraud", info_messages)
+    return dos_mask, fraud_mask
 
-    # 3. 👥 Multi-User Conflict Detection
+
+def _conflict_mask(df, info_messages):
+    """Returns a boolean Series marking the rows of df in a multi-user conflict."""
     logger.info("Attempting Multi-User Conflict detection...")
     try:
-        conflict_session_ids = detect_multi_user_conflict(df)
-        conflict_anomalies_df = df[df['session_id'].isin(conflict_session_ids)]
-
-        logger.info(f"Logic found {len(conflict_anomalies_df)} multi-user conflicts.")
-
-        for index, row in conflict_anomalies_df.iterrows():
-            session_id = row['session_id']
-            if session_id not in processed_session_ids:
-                all_anomalies.append({
-                    'session_id': session_id,
-                    'anomaly_type': 'multi_user_conflict',
-                    'timestamp': row['start_time'], # Keep as datetime
-                    'details': f"User: {row.get('user_id', 'N/A')}, Start: {row.get('start_time', 'N/A')}, End: {row.get('end_time', 'N/A')}"
-                })
-                processed_session_ids.add(session_id)
-            else:
-                 # Optionally: Add conflict details if session already flagged
-                 for existing_anomaly in all_anomalies:
-                     if existing_anomaly['session_id'] == session_id:
-                         existing_anomaly['details'] += f"; Conflict: User: {row.get('user_id', 'N/A')}"
-                         existing_anomaly['anomaly_type'] += '+multi_user_conflict' # Combine types
-                         break
+        # Works on the three time/user columns only; prepare_frame already parsed the times
+        conflict_mask = pd.Series(conflict_flags(df['user_id'], df['start_time'], df['end_time']), index=df.index)
+        logger.info(f"Logic found {int(conflict_mask.sum())} multi-user conflicts.")
+        return conflict_mask
     except Exception as e:
         logger.error(f"Error during Multi-User Conflict processing: {e}")
         info_messages.append(f"Multi-User Conflict detection failed: {e}")
+        return pd.Series(False, index=df.index)
 
 
-    # --- Timestamp Formatting for JSON ---
-    logger.debug(f"Total anomalies detected before final formatting: {len(all_anomalies)}")
-    final_anomalies = []
-    for anomaly in all_anomalies:
-         # Check if 'timestamp' is a valid datetime object before formatting
-        if isinstance(anomaly.get('timestamp'), pd.Timestamp):
-            anomaly['timestamp'] = anomaly['timestamp'].isoformat()
+def _geo_flags(df, info_messages):
+    """
+    Runs the impossible-travel and fan-out checks over a frame with the
+    GEO_COLUMNS; returns geo_flags' frame, or None when they are off or the
+    frame has none of the columns.
+    """
+    if not GEO_DETECTION or not any(col in df.columns for col in GEO_COLUMNS):
+        return None
+    logger.info("Attempting geo/IP detection...")
+    try:
+        geo = geo_flags(df)
+        logger.info(f"Logic found {int(geo['impossible_travel'].sum())} impossible-travel sessions "
+                    f"and {int(geo['ip_charger_fanout'].sum())} IP/charger fan-out sessions.")
+        return geo
+    except Exception as e:
+        logger.error(f"Error during geo/IP processing: {e}")
+        info_messages.append(f"Geo/IP detection failed: {e}")
+        return None
+
+
+def _dos_windows(df, info_messages):
+    """
+    Runs the windowed DoS check over a frame with the hashed IP/charger
+    columns and _pps; returns window_flags' frame, or None when it is off or
+    the frame has neither key.
+    """
+    if not DOS_WINDOW_DETECTION or not any(col in df.columns for col in WINDOW_KEYS.values()):
+        return None
+    logger.info("Attempting windowed DoS detection...")
+    try:
+        windows = window_flags(df)
+        logger.info(f"Logic found {int(windows['dos_window'].sum())} sessions in IP/charger floods.")
+        return windows
+    except Exception as e:
+        logger.error(f"Error during windowed DoS processing: {e}")
+        info_messages.append(f"Windowed DoS detection failed: {e}")
+        return None
+
+
+def _with_detection_columns(df, columns):
+    """
+    df[columns] plus what the file-wide checks need from df's other columns:
+    the GEO_COLUMNS (when geo detection is on), and the IP/charger hashes and
+    packets_per_sec as _pps (when windowed DoS detection is on).
+    """
+    frame = df[columns]
+    geo = geo_columns(df, locations=GEO_DETECTION) if GEO_DETECTION or DOS_WINDOW_DETECTION else None
+    if geo is None:
+        return frame
+    frame = frame.join(geo)
+    if DOS_WINDOW_DETECTION and 'packets_per_sec' in df.columns:
+        frame['_pps'] = pd.to_numeric(df['packets_per_sec'], errors='coerce').astype(np.float64)
+    return frame
+
+
+def _as_strings(series):
+    """Formats values the way str() does, keeping datetimes in Timestamp form."""
+    if pd.api.types.is_datetime64_any_dtype(series):
+        text = series.dt.strftime('%Y-%m-%d %H:%M:%S')
+        microsecond = series.dt.microsecond.fillna(0).astype(np.int64)
+        fraction = microsecond != 0
+        text[fraction] = text[fraction] + '.' + microsecond[fraction].astype(str).str.zfill(6)
+        return text.fillna('NaT').astype(object)
+    return series.astype(str).astype(object)
+
+
+def _iso_timestamps(series):
+    """Formats a datetime Series like Timestamp.isoformat(), marking NaT values."""
+    text = _as_strings(series).str.replace(' ', 'T', n=1, regex=False)
+    missing = series.isna()
+    if missing.any():
+        logger.warning(f"Invalid or missing timestamp for {int(missing.sum())} sessions")
+        text[missing] = "Invalid/Missing Timestamp"
+    return text
+
+
+def assemble_anomalies(df, dos_mask, fraud_mask, conflict_mask, geo=None, windows=None):
+    """
+    Builds the anomaly dicts for every flagged row in one vectorized pass.
+
+    Each session is reported once with the combined anomaly_type (e.g.
+    'dos_attack+billing_fraud'). Rows are ordered as DoS hits, then fraud-only
+    hits, then conflict-only, travel-only and fan-out-only hits. When a
+    session_id appears on several flagged rows, its first flagged row is
+    reported. `geo` is geo_flags' frame for df, if the geo checks ran, and
+    `windows` window_flags' frame; its floods are reported as dos_attack.
+    """
+    window_mask = windows['dos_window'] if windows is not None else pd.Series(False, index=df.index)
+    if geo is not None:
+        travel_mask, fanout_mask = geo['impossible_travel'], geo['ip_charger_fanout']
+    else:
+        travel_mask = fanout_mask = pd.Series(False, index=df.index)
+    flagged_mask = dos_mask | window_mask | fraud_mask | conflict_mask | travel_mask | fanout_mask
+    if not flagged_mask.any():
+        return []
+
+    flagged = df.loc[flagged_mask]
+    row_dos = dos_mask[flagged_mask].to_numpy()
+    window = window_mask[flagged_mask].to_numpy()
+    dos = row_dos | window
+    fraud = fraud_mask[flagged_mask].to_numpy()
+    conflict = conflict_mask[flagged_mask].to_numpy()
+    travel = travel_mask[flagged_mask].to_numpy()
+    fanout = fanout_mask[flagged_mask].to_numpy()
+    combo = (dos.astype(np.int8) + 2 * fraud.astype(np.int8) + 4 * conflict.astype(np.int8)
+             + 8 * travel.astype(np.int8) + 16 * fanout.astype(np.int8))
+
+    # Details of each check, in the same wording as the anomaly_type parts
+    user = _as_strings(flagged['user_id'])
+    details = pd.Series('', index=flagged.index, dtype=object)
+    if row_dos.any():
+        dos_details = "CPU: " + _as_strings(flagged['cpu_usage_percent']) + "%, Packets: " + _as_strings(flagged['packets_per_sec']) + "/sec"
+        details = details.where(~row_dos, dos_details)
+    if window.any():
+        figures = windows.loc[flagged_mask]
+        window_details = ("Flood: " + figures['window_key'] + ", " + _as_strings(figures['window_sessions'])
+                          + " sessions, " + _as_strings(figures['window_packets'].round(1)) + " packets/sec in "
+                          + _as_strings(figures['window_minutes']) + " min")
+        details = details.where(~window, (details + "; ").where(details != '', '') + window_details)
+    if fraud.any():
+        fraud_details = "Energy: " + _as_strings(flagged['energy_kWh']) + " kWh, Amount: " + _as_strings(flagged['amount_INR']) + " INR"
+        details = details.where(~fraud, details.where(~dos, details + "; Fraud: ").where(dos, '') + fraud_details)
+    if conflict.any():
+        conflict_only = conflict & ~dos & ~fraud
+        conflict_details = "User: " + user + ", Start: " + _as_strings(flagged['start_time']) + ", End: " + _as_strings(flagged['end_time'])
+        details = details.where(~conflict, details + "; Conflict: User: " + user)
+        details = details.where(~conflict_only, conflict_details)
+    if travel.any():
+        figures = geo.loc[flagged_mask]
+        travel_details = ("Distance: " + _as_strings(figures['travel_km'].round(1)) + " km, Gap: "
+                          + _as_strings(figures['travel_minutes'].round(1)) + " min, Speed: "
+                          + _as_strings(figures['travel_kmh'].round(1)) + " km/h")
+        details = details.where(~travel, (details + "; Travel: ").where(details != '', '') + travel_details)
+    if fanout.any():
+        figures = geo.loc[flagged_mask]
+        fanout_details = ("IPs: " + _as_strings(figures['fanout_ips']) + ", Chargers: "
+                          + _as_strings(figures['fanout_chargers']) + f" in {FANOUT_WINDOW_MINUTES} min")
+        details = details.where(~fanout, (details + "; Fan-out: ").where(details != '', '') + fanout_details)
+
+    result = pd.DataFrame({
+        'session_id': flagged['session_id'],
+        'user_id': flagged['user_id'].astype(object).where(flagged['user_id'].notna(), None),
+        'anomaly_type': _ANOMALY_TYPE_LABELS[combo],
+        'timestamp': _iso_timestamps(flagged['start_time']),
+        'details': details,
+        # First check that flagged the row, used only for ordering
+        '_order': np.select([dos, fraud, conflict, travel], [0, 1, 2, 3], 4),
+    })
+    result = result.sort_values('_order', kind='stable').drop_duplicates(subset='session_id', keep='first')
+    return result.drop(columns='_order').to_dict('records')
+
+
+def find_anomalies(df: pd.DataFrame, detect_conflicts: bool = True, timings: dict = None) -> dict:
+    """
+    Main function to run all anomaly detection checks on a DataFrame.
+    Returns a dictionary: {"anomalies": list, "info": list}.
+
+    Pass detect_conflicts=False to score only the row-local DoS and fraud
+    checks (used when the caller runs conflict and geo detection over the
+    full file).
+    Pass a dict as `timings` to get the seconds spent in each stage.
+    """
+    logger.info("Starting find_anomalies function.")
+    logger.debug(f"Received DataFrame columns: {df.columns.tolist()}")
+    logger.debug(f"Data types:\n{df.dtypes}")
+
+    info_messages = []
+    with stage(timings, "prepare_frame"):
+        prepare_frame(df)
+
+    dos_mask, fraud_mask = score_rows(df, info_messages, timings)
+
+    # 3. 👥 Multi-User Conflict Detection
+    with stage(timings, "conflict_detection"):
+        if detect_conflicts:
+            conflict_mask = _conflict_mask(df, info_messages)
         else:
-             # Handle cases where timestamp might be missing or invalid
-             anomaly['timestamp'] = "Invalid/Missing Timestamp"
-             logger.warning(f"Invalid or missing timestamp for session {anomaly.get('session_id', 'Unknown')}")
-        final_anomalies.append(anomaly)
+            conflict_mask = pd.Series(False, index=df.index)
+
+    # 4. 🌍 Impossible Travel and IP/Charger Fan-out, 🌊 IP/Charger Floods
+    geo = windows = None
+    if detect_conflicts:
+        with stage(timings, "geo_parse"):
+            geo_frame = _with_detection_columns(df, ['user_id', 'start_time', 'end_time'])
+        with stage(timings, "geo_detection"):
+            geo = _geo_flags(geo_frame, info_messages)
+        with stage(timings, "dos_windows"):
+            windows = _dos_windows(geo_frame, info_messages)
+
+    with stage(timings, "assemble_anomalies"):
+        anomalies = assemble_anomalies(df, dos_mask, fraud_mask, conflict_mask, geo, windows)
+    logger.info(f"find_anomalies finished. Returning {len(anomalies)} anomalies and {len(info_messages)} info messages.")
+    return {"anomalies": anomalies, "info": info_messages}
 
-    logger.info(f"find_anomalies finished. Returning {len(final_anomalies)} anomalies and {len(info_messages)} info messages.")
-    return {"anomalies": final_anomalies, "info": info_messages}
 
-    
+# Columns of a chunk kept only for the rows that end up flagged
+ID_COLUMNS = ['session_id', 'user_id']
 
+
+def score_chunk(chunk: pd.DataFrame, offset: int = 0, spill_dir: str = None) -> dict:
+    """
+    Runs the row-local DoS and fraud checks on one chunk of a larger file.
+    `offset` is the file position of the chunk's first row.
+
+    Only what the final combine step needs is returned: a compact
+    conflict_frame of every row (user_id as a 64-bit hash in _user, the
+    start/end times, plus the parsed GEO_COLUMNS and _pps when geo or
+    windowed DoS detection is on) and the formatted features of the flagged
+    rows. The ID_COLUMNS are only needed for the rows that get flagged;
+    with a spill_dir they are written there and "ids" is the file's path,
+    otherwise "ids" is the DataFrame. The result is small and picklable, so
+    chunks can be scored in worker processes.
+    """
+    logger.info(f"Scoring chunk at row {offset} ({len(chunk)} rows).")
+    # Number rows across the whole file so chunks can be joined back up
+    chunk.index = pd.RangeIndex(offset, offset + len(chunk))
+
+    info_messages = []
+    timings = {}
+    model_versions = set()
+    with stage(timings, "prepare_frame"):
+        prepare_frame(chunk)
+    dos_mask, fraud_mask = score_rows(chunk, info_messages, timings, model_versions)
+
+    flagged = None
+    flagged_mask = dos_mask | fraud_mask
+    with stage(timings, "format_flagged"):
+        if flagged_mask.any():
+            feature_cols = [col for col in DOS_FEATURES + FRAUD_FEATURES if col in chunk.columns]
+            # Format the feature values now, before the join introduces NaN
+            flagged = chunk.loc[flagged_mask, feature_cols].apply(_as_strings)
+            flagged['_dos'] = dos_mask[flagged_mask]
+            flagged['_fraud'] = fraud_mask[flagged_mask]
+
+    # Geo strings are parsed here, in the worker, so the combine step only gets numeric columns
+    with stage(timings, "geo_parse"):
+        conflict_frame = _with_detection_columns(chunk, ['start_time', 'end_time'])
+        conflict_frame.insert(0, '_user', hash_ids(chunk['user_id']))
+
+    ids = chunk[ID_COLUMNS]
+    if spill_dir is not None:
+        with stage(timings, "spill_ids"):
+            path = os.path.join(spill_dir, f"ids-{offset:012d}.pkl")
+            ids.to_pickle(path)
+            ids = path
+
+    return {
+        "rows": len(chunk),
+        "offset": offset,
+        "conflict_frame": conflict_frame,
+        "flagged_frame": flagged,
+        "ids": ids,
+        "info": info_messages,
+        "timings": timings,
+        "model_version": model_versions.pop(),
+    }
+
+
+def _user_codes(hashes):
+    """Dense user codes for user_id hashes, as floats with NaN for missing users (hash 0)."""
+    codes, _ = pd.factorize(hashes)
+    codes = codes.astype(np.float64)
+    codes[hashes == 0] = np.nan
+    return codes
+
+
+def _flagged_ids(chunk_results, rows):
+    """The ID_COLUMNS of the given file positions, read back one chunk at a time."""
+    pieces = []
+    for chunk_result in chunk_results:
+        offset = chunk_result["offset"]
+        wanted = rows[(rows >= offset) & (rows < offset + chunk_result["rows"])]
+        if len(wanted) == 0:
+            continue
+        ids = chunk_result["ids"]
+        if isinstance(ids, str):
+            ids = pd.read_pickle(ids)
+        pieces.append(ids.loc[wanted])
+    return pd.concat(pieces) if pieces else pd.DataFrame(columns=ID_COLUMNS, index=rows)
+
+
+def combine_chunk_results(chunk_results) -> dict:
+    """
+    Joins the score_chunk results of a whole file, runs conflict, geo and
+    windowed DoS detection across all of its rows and assembles the final anomaly list.
+    Only the flagged rows' IDs are loaded, so memory stays at the compact
+    per-row columns plus the flagged rows.
+    Returns a dictionary: {"anomalies": list, "info": list, "total_sessions": int,
+    "timings": dict, "model_version": str or None}, with each stage's seconds
+    summed over the chunks. model_version is the version every chunk was
+    scored with, or None if the models were reloaded part-way through.
+    """
+    info_messages = []
+    timings = {}
+    model_versions = {chunk_result.get("model_version") for chunk_result in chunk_results}
+    model_version = model_versions.pop() if len(model_versions) == 1 else None
+    for chunk_result in chunk_results:
+        merge_timings(timings, chunk_result.get("timings", {}))
+        for msg in chunk_result["info"]:
+            if msg not in info_messages:
+                info_messages.append(msg)
+    total_sessions = sum(chunk_result["rows"] for chunk_result in chunk_results)
+    if not chunk_results:
+        return {"anomalies": [], "info": info_messages, "total_sessions": 0, "timings": timings, "model_version": None}
+
+    with stage(timings, "combine_chunks"):
+        df = pd.concat([chunk_result["conflict_frame"] for chunk_result in chunk_results])
+        df.insert(0, 'user_id', _user_codes(df.pop('_user').to_numpy(np.uint64)))
+        flagged_frames = [chunk_result["flagged_frame"] for chunk_result in chunk_results
+                          if chunk_result["flagged_frame"] is not None]
+        if flagged_frames:
+            df = df.join(pd.concat(flagged_frames))
+        dos_mask = df['_dos'].fillna(False).astype(bool) if '_dos' in df.columns else pd.Series(False, index=df.index)
+        fraud_mask = df['_fraud'].fillna(False).astype(bool) if '_fraud' in df.columns else pd.Series(False, index=df.index)
+
+    with stage(timings, "conflict_detection"):
+        conflict_mask = _conflict_mask(df, info_messages)
+    with stage(timings, "geo_detection"):
+        geo = _geo_flags(df, info_messages)
+    with stage(timings, "dos_windows"):
+        windows = _dos_windows(df, info_messages)
+    with stage(timings, "assemble_anomalies"):
+        flagged_mask = dos_mask | fraud_mask | conflict_mask
+        for frame, column in ((geo, 'impossible_travel'), (geo, 'ip_charger_fanout'), (windows, 'dos_window')):
+            if frame is not None:
+                flagged_mask |= frame[column]
+        flagged = df.loc[flagged_mask].drop(columns='user_id')
+        flagged = flagged.join(_flagged_ids(chunk_results, flagged.index.to_numpy()))
+        anomalies = assemble_anomalies(
+            flagged, dos_mask[flagged_mask], fraud_mask[flagged_mask], conflict_mask[flagged_mask],
+            geo.loc[flagged_mask] if geo is not None else None,
+            windows.loc[flagged_mask] if windows is not None else None,
+        )
+    logger.info(f"Combined {len(chunk_results)} chunks: {total_sessions} sessions, {len(anomalies)} anomalies.")
+    return {
+        "anomalies": anomalies, "info": info_messages, "total_sessions": total_sessions,
+        "timings": timings, "model_version": model_version,
+    }
+
+
+def find_anomalies_in_chunks(chunks) -> dict:
+    """
+    Runs find_anomalies over an iterable of DataFrame chunks (e.g. the reader
+    returned by pd.read_csv(..., chunksize=N)) so only one chunk of the full
+    file is in memory at a time.
+
+    DoS and fraud scoring are row-local and run per chunk; only the rows they
+    flag are kept. Conflict and geo detection need every session of a user,
+    so the numeric columns they use are kept from each chunk and checked once
+    at the end. Each chunk's IDs are spilled to a temporary directory and read
+    back for the flagged rows only.
+    Returns a dictionary: {"anomalies": list, "info": list, "total_sessions": int}.
+    """
+    chunk_results = []
+    offset = 0
+    with tempfile.TemporaryDirectory(prefix="ev_ids_") as spill_dir:
+        for chunk in chunks:
+            chunk_results.append(score_chunk(chunk, offset, spill_dir))
+            offset += len(chunk)
+        return combine_chunk_results(chunk_results)
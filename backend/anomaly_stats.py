@@ -0,0 +1,344 @@
+"""
+Dashboard statistics over the stored anomalies.
+
+Every batch of anomalies written to MongoDB is also folded into a small
+rollup collection (ROLLUP_COLLECTION). It holds one document per hour and
+per day of session start, per user, and one running total. Sessions are
+kept as a per-day top-K: prune_session_rollups trims each day of session
+start back to STATS_SESSION_TOP_K session documents (every
+STATS_PRUNE_INTERVAL_SECONDS in the API, and after a backfill or rebuild),
+so the session rollups grow with the number of days rather than with the
+number of sessions, while writes stay a single bulk write. Every anomaly of a
+session falls on the session's start day, which makes the top-N sessions
+exact for N <= STATS_SESSION_TOP_K (a session pruned from its day restarts
+its count if it is flagged again later). Each document has a count and a
+count per anomaly_type. The /stats/ endpoints only read these documents,
+through index-backed aggregation pipelines, so a dashboard query costs
+O(buckets) however long the anomaly history gets.
+"""
+import logging
+import os
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+
+import pymongo
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+# --- Stats Settings ---
+ROLLUP_COLLECTION = os.getenv("ROLLUP_COLLECTION", "anomaly_rollups")
+# Most histogram buckets and top-N rows one request may return
+STATS_MAX_BUCKETS = int(os.getenv("STATS_MAX_BUCKETS", "10000"))
+STATS_MAX_TOP = int(os.getenv("STATS_MAX_TOP", "1000"))
+# Session rollups kept per day of session start (the rest are pruned)
+STATS_SESSION_TOP_K = int(os.getenv("STATS_SESSION_TOP_K", str(STATS_MAX_TOP)))
+# Seconds between session rollup prunes in the API
+STATS_PRUNE_INTERVAL_SECONDS = float(os.getenv("STATS_PRUNE_INTERVAL_SECONDS", "300"))
+# Anomalies read per rollup update when rebuilding from the anomalies collection
+ROLLUP_REBUILD_BATCH = int(os.getenv("ROLLUP_REBUILD_BATCH", "10000"))
+
+# Histogram granularities and the top-N dimensions (-> field reported for the key)
+BUCKETS = ('hour', 'day')
+TOP_DIMENSIONS = {'user': 'user_id', 'session': 'session_id'}
+
+ROLLUP_INDEXES = [
+    ([("dim", pymongo.ASCENDING), ("key", pymongo.ASCENDING)], {"unique": True}),
+    # Top-N: highest counts first, ties by key
+    ([("dim", pymongo.ASCENDING), ("count", pymongo.DESCENDING), ("key", pymongo.ASCENDING)], {}),
+    # Per-day session pruning: the top-K sessions of one day
+    ([("dim", pymongo.ASCENDING), ("day", pymongo.ASCENDING), ("count", pymongo.DESCENDING), ("key", pymongo.ASCENDING)], {}),
+]
+
+# Fields of an anomaly the rollups need
+_ROLLUP_FIELDS = {"_id": 0, "anomaly_type": 1, "timestamp": 1, "detection_timestamp": 1, "user_id": 1, "session_id": 1}
+
+
+def rollup_collection(collection):
+    """The rollup collection that sits next to an anomalies collection."""
+    return collection.database[ROLLUP_COLLECTION]
+
+
+def _label(anomaly_type):
+    # Labels become field names under by_type, which can't contain dots
+    return str(anomaly_type or 'unknown').replace('.', '_')
+
+
+def _hour_and_day(doc):
+    """Hour and day bucket of the session start, or of detection if the start is unknown."""
+    value = doc.get('timestamp')
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            value = None
+    if not isinstance(value, datetime):
+        value = doc.get('detection_timestamp')
+    if not isinstance(value, datetime):
+        return None, None
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    hour = value.replace(minute=0, second=0, microsecond=0)
+    return hour, hour.replace(hour=0)
+
+
+def summarize(docs):
+    """Folds anomaly documents into {(dim, key): Counter of anomaly_type}."""
+    rollups = defaultdict(Counter)
+    for doc in docs:
+        label = _label(doc.get('anomaly_type'))
+        keys = [('total', 'all')]
+        hour, day = _hour_and_day(doc)
+        if hour is not None:
+            keys += [('hour', hour), ('day', day)]
+        if doc.get('user_id') is not None:
+            keys.append(('user', doc['user_id']))
+        if doc.get('session_id') is not None:
+            keys.append(('session', doc['session_id']))
+        for key in keys:
+            rollups[key][label] += 1
+    return rollups
+
+
+def _session_days(docs):
+    """Day of session start (the top-K bucket) per session_id."""
+    return {doc['session_id']: _hour_and_day(doc)[1] for doc in docs if doc.get('session_id') is not None}
+
+
+def _prune_sessions(rollups, days):
+    """Keeps the STATS_SESSION_TOP_K highest-count sessions of each day, deleting the rest."""
+    for day in days:
+        cutoff = next(iter(
+            rollups.find({"dim": "session", "day": day}, {"_id": 0, "count": 1, "key": 1})
+            .sort([("count", pymongo.DESCENDING), ("key", pymongo.ASCENDING)])
+            .skip(STATS_SESSION_TOP_K - 1).limit(1)
+        ), None)
+        if cutoff is None:
+            continue
+        rollups.delete_many({"dim": "session", "day": day, "$or": [
+            {"count": {"$lt": cutoff["count"]}},
+            {"count": cutoff["count"], "key": {"$gt": cutoff["key"]}},
+        ]})
+
+
+def prune_session_rollups(collection):
+    """
+    Trims every day over STATS_SESSION_TOP_K session rollups back to its
+    top-K; returns the number of days trimmed. One aggregation finds the
+    days over the cap, so only those cost further round trips.
+    """
+    rollups = rollup_collection(collection)
+    over_cap = [row["_id"] for row in rollups.aggregate([
+        {"$match": {"dim": "session"}},
+        {"$group": {"_id": "$day", "sessions": {"$sum": 1}}},
+        {"$match": {"sessions": {"$gt": STATS_SESSION_TOP_K}}},
+    ])]
+    _prune_sessions(rollups, over_cap)
+    if over_cap:
+        logger.info(f"Pruned session rollups of {len(over_cap)} days to their top {STATS_SESSION_TOP_K}.")
+    return len(over_cap)
+
+
+def update_rollups(collection, docs, sign=1):
+    """
+    Adds anomaly documents just inserted into `collection` to its rollups, in
+    one bulk write (session rollups are trimmed later, by
+    prune_session_rollups). sign=-1 takes out documents that are being deleted.
+    """
+    rollups = summarize(docs)
+    if not rollups:
+        return
+    session_days = _session_days(docs)
+    operations = []
+    for (dim, key), counts in rollups.items():
+        increments = {"count": sign * sum(counts.values())}
+        increments.update({f"by_type.{label}": sign * n for label, n in counts.items()})
+        if dim == 'session':
+            # A session pruned from its day has no rollup left to take anomalies out of
+            update = {"$inc": increments, "$set": {"day": session_days[key]}}
+            operations.append(UpdateOne({"dim": dim, "key": key}, update, upsert=sign > 0))
+        else:
+            operations.append(UpdateOne({"dim": dim, "key": key}, {"$inc": increments}, upsert=True))
+    target = rollup_collection(collection)
+    target.bulk_write(operations, ordered=False)
+    if sign < 0:
+        target.delete_many({"dim": "session", "count": {"$lte": 0}})
+
+
+def rebuild_rollups(collection):
+    """
+    Recomputes the rollups from every document in the anomalies collection;
+    returns the number of anomalies counted. Anomalies written while this
+    runs may be counted twice, so run it when uploads are quiet.
+    """
+    rollup_collection(collection).delete_many({})
+    counted = 0
+    batch = []
+    for doc in collection.find({}, _ROLLUP_FIELDS).batch_size(ROLLUP_REBUILD_BATCH):
+        batch.append(doc)
+        if len(batch) >= ROLLUP_REBUILD_BATCH:
+            update_rollups(collection, batch)
+            counted += len(batch)
+            batch = []
+    if batch:
+        update_rollups(collection, batch)
+        counted += len(batch)
+    prune_session_rollups(collection)
+    logger.info(f"Rebuilt anomaly rollups from {counted} anomalies.")
+    return counted
+
+
+def ensure_rollups(collection):
+    """
+    Creates the rollup indexes, and builds the rollups once if the anomalies
+    collection already has history that was never rolled up, or whose
+    session rollups predate the per-day top-K.
+    """
+    rollups = rollup_collection(collection)
+    for keys, options in ROLLUP_INDEXES:
+        rollups.create_index(keys, **options)
+    if rollups.find_one({"dim": "total"}) is None and collection.find_one({}, {"_id": 1}) is not None:
+        logger.info("No anomaly rollups yet; building them from the stored anomalies.")
+        rebuild_rollups(collection)
+    elif rollups.find_one({"dim": "session", "day": {"$exists": False}}, {"_id": 1}) is not None:
+        logger.info("Session rollups have no day bucket; rebuilding them as a per-day top-K.")
+        rebuild_rollups(collection)
+
+
+# --- Queries ---
+def count_by_check(by_type):
+    """Per-check counts from per-label counts ('dos_attack+billing_fraud' counts for both)."""
+    checks = Counter()
+    for label, n in by_type.items():
+        for check in label.split('+'):
+            checks[check] += n
+    return dict(checks)
+
+
+def _matching(by_type, anomaly_type):
+    """Anomalies in by_type whose label includes the `anomaly_type` check."""
+    return sum(n for label, n in by_type.items() if anomaly_type in label.split('+'))
+
+
+def _time_range(since, until):
+    """Rollup key range for [since, until); since is widened to the start of its hour."""
+    key_range = {}
+    # Rollup keys are naive UTC, like the datetimes MongoDB returns
+    since, until = (
+        value.astimezone(timezone.utc).replace(tzinfo=None) if value is not None and value.tzinfo else value
+        for value in (since, until)
+    )
+    if since is not None:
+        key_range["$gte"] = since.replace(minute=0, second=0, microsecond=0)
+    if until is not None:
+        key_range["$lt"] = until
+    return key_range
+
+
+def _summary(total, by_type):
+    return {"total": total, "by_type": by_type, "by_check": count_by_check(by_type)}
+
+
+def _histogram(bucket, rows, anomaly_type):
+    buckets = []
+    for row in rows:
+        by_type = row.get("by_type", {})
+        count = _matching(by_type, anomaly_type) if anomaly_type else row["count"]
+        buckets.append({"start": row["key"], "count": count, "by_type": by_type})
+    return {"bucket": bucket, "buckets": buckets}
+
+
+def _top(dim, rows):
+    field = TOP_DIMENSIONS[dim]
+    return {"by": dim, "top": [{field: row["key"], "count": row["count"], "by_type": row.get("by_type", {})} for row in rows]}
+
+
+def _check_bucket(bucket):
+    if bucket not in BUCKETS:
+        raise ValueError(f"Unknown histogram bucket '{bucket}'; use one of {', '.join(BUCKETS)}.")
+
+
+def _check_dimension(dim):
+    if dim not in TOP_DIMENSIONS:
+        raise ValueError(f"Unknown top-N dimension '{dim}'; use one of {', '.join(TOP_DIMENSIONS)}.")
+
+
+class MongoAnomalyStats:
+    """Answers the /stats/ queries from the rollup collection of an anomalies collection."""
+
+    def __init__(self, collection):
+        self.rollups = rollup_collection(collection)
+
+    def summary(self, since=None, until=None):
+        """Anomaly counts per anomaly_type and per check, over all time or an hour-aligned range."""
+        if since is None and until is None:
+            total = self.rollups.find_one({"dim": "total"}, {"_id": 0, "count": 1, "by_type": 1}) or {}
+            return _summary(total.get("count", 0), total.get("by_type", {}))
+        pipeline = [
+            {"$match": {"dim": "hour", "key": _time_range(since, until)}},
+            {"$project": {"by_type": {"$objectToArray": "$by_type"}}},
+            {"$unwind": "$by_type"},
+            {"$group": {"_id": "$by_type.k", "count": {"$sum": "$by_type.v"}}},
+        ]
+        by_type = {row["_id"]: row["count"] for row in self.rollups.aggregate(pipeline)}
+        return _summary(sum(by_type.values()), by_type)
+
+    def histogram(self, bucket="hour", since=None, until=None, anomaly_type=None, limit=STATS_MAX_BUCKETS):
+        """Anomalies per hour or day of session start, oldest first."""
+        _check_bucket(bucket)
+        match = {"dim": bucket}
+        key_range = _time_range(since, until)
+        if key_range:
+            match["key"] = key_range
+        pipeline = [
+            {"$match": match},
+            {"$sort": {"key": pymongo.ASCENDING}},
+            {"$limit": limit},
+            {"$project": {"_id": 0, "key": 1, "count": 1, "by_type": 1}},
+        ]
+        return _histogram(bucket, self.rollups.aggregate(pipeline), anomaly_type)
+
+    def top(self, dim="user", limit=10):
+        """The users or sessions with the most anomalies (sessions from the per-day top-K)."""
+        _check_dimension(dim)
+        pipeline = [
+            {"$match": {"dim": dim}},
+            {"$sort": {"count": pymongo.DESCENDING, "key": pymongo.ASCENDING}},
+            {"$limit": limit},
+            {"$project": {"_id": 0, "key": 1, "count": 1, "by_type": 1}},
+        ]
+        return _top(dim, self.rollups.aggregate(pipeline))
+
+
+class InMemoryAnomalyStats:
+    """The same queries over a list of anomaly documents (the fallback buffer while MongoDB is down)."""
+
+    def __init__(self, docs):
+        self._rows = defaultdict(list)
+        for (dim, key), counts in summarize(docs).items():
+            self._rows[dim].append({"key": key, "count": sum(counts.values()), "by_type": dict(counts)})
+
+    def summary(self, since=None, until=None):
+        rows = self._rows['total'] if since is None and until is None else self._in_range('hour', since, until)
+        by_type = Counter()
+        for row in rows:
+            by_type.update(row["by_type"])
+        return _summary(sum(by_type.values()), dict(by_type))
+
+    def histogram(self, bucket="hour", since=None, until=None, anomaly_type=None, limit=STATS_MAX_BUCKETS):
+        _check_bucket(bucket)
+        rows = sorted(self._in_range(bucket, since, until), key=lambda row: row["key"])
+        return _histogram(bucket, rows[:limit], anomaly_type)
+
+    def top(self, dim="user", limit=10):
+        _check_dimension(dim)
+        rows = sorted(self._rows[dim], key=lambda row: (-row["count"], str(row["key"])))
+        return _top(dim, rows[:limit])
+
+    def _in_range(self, dim, since, until):
+        key_range = _time_range(since, until)
+        return [
+            row for row in self._rows[dim]
+            if ("$gte" not in key_range or row["key"] >= key_range["$gte"])
+            and ("$lt" not in key_range or row["key"] < key_range["$lt"])
+        ]
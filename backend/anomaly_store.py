@@ -0,0 +1,276 @@
+"""
+Idempotent storage of detected anomalies in the `anomalies` collection.
+
+An anomaly is identified by (session_id, anomaly_type). A unique index on
+that key is created at startup. Writes are unordered bulk_write upserts that
+only set fields on insert, so uploading an overlapping export again (or
+resubmitting it as a background job) stores nothing new and the first
+detection of each anomaly is kept. upsert_anomalies() returns the documents
+that were actually inserted, and only those are added to the /stats/ rollups.
+
+Retention keeps the collection and its working set small:
+ANOMALY_RETENTION_DAYS sets a TTL index on detection_timestamp. With
+ANOMALY_ARCHIVE_AFTER_DAYS set, older anomalies are moved into monthly
+archive collections (anomalies_archive_YYYY_MM) instead, and the TTL applies
+to those. The rollups keep counting expired and archived anomalies, so
+/stats/ covers the whole history while /logs/ serves the hot collection.
+Every stored key is also recorded in a key registry (anomalies_keys), which
+is never archived or expired, so an anomaly that has left the hot collection
+is not stored and counted a second time when its export is uploaded again.
+"""
+import logging
+import os
+from datetime import datetime, timedelta
+
+import pymongo
+from pymongo import DeleteOne, UpdateOne
+from pymongo.errors import BulkWriteError, OperationFailure, PyMongoError
+
+from anomaly_stats import rollup_collection, update_rollups
+
+logger = logging.getLogger(__name__)
+
+# --- Storage Settings ---
+MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/")
+# Days an anomaly is kept after detection_timestamp; 0 keeps them forever
+ANOMALY_RETENTION_DAYS = int(os.getenv("ANOMALY_RETENTION_DAYS", "0"))
+# Days before anomalies move to monthly archive collections; 0 keeps them in the hot collection
+ANOMALY_ARCHIVE_AFTER_DAYS = int(os.getenv("ANOMALY_ARCHIVE_AFTER_DAYS", "0"))
+# Seconds between archive runs, and anomalies moved per batch
+ARCHIVE_INTERVAL_SECONDS = float(os.getenv("ARCHIVE_INTERVAL_SECONDS", "3600"))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "10000"))
+
+ANOMALY_KEY = ["session_id", "anomaly_type"]
+ANOMALY_KEY_INDEX = "anomaly_key"
+RETENTION_INDEX = "retention_ttl"
+
+_DUPLICATE_KEY = 11000
+_KEY_PROJECTION = {"_id": 0, **{field: 1 for field in ANOMALY_KEY}}
+
+
+def _key(doc):
+    return tuple(doc.get(field) for field in ANOMALY_KEY)
+
+
+def key_registry(collection):
+    """The collection recording every anomaly key ever stored in `collection`."""
+    return collection.database[f"{collection.name}_keys"]
+
+
+def _registered(collection, keys):
+    """The subset of keys already in the registry."""
+    session_ids = list({key[0] for key in keys})
+    registered = key_registry(collection).find({"session_id": {"$in": session_ids}}, _KEY_PROJECTION)
+    return {_key(doc) for doc in registered} & set(keys)
+
+
+def _register(collection, docs):
+    """
+    Adds the keys of stored anomalies to the registry. Failures are only
+    logged: while the anomaly is in the hot collection its unique index still
+    prevents a second copy, and the key is registered by the next write of it.
+    """
+    registry = key_registry(collection)
+    try:
+        registry.bulk_write([
+            UpdateOne(dict(zip(ANOMALY_KEY, _key(doc))), {"$setOnInsert": {"registered_at": datetime.now()}}, upsert=True)
+            for doc in docs
+        ], ordered=False)
+    except BulkWriteError as bwe:
+        if any(error.get("code") != _DUPLICATE_KEY for error in bwe.details.get("writeErrors", [])):
+            logger.error(f"Failed to register stored anomaly keys: {bwe.details.get('writeErrors', [])[:1]}")
+    except PyMongoError as e:
+        logger.error(f"Failed to register {len(docs)} stored anomaly keys: {e}")
+
+
+def _upsert(doc):
+    """An upsert that inserts doc unless an anomaly with its key is already stored."""
+    return UpdateOne(dict(zip(ANOMALY_KEY, _key(doc))), {"$setOnInsert": doc}, upsert=True)
+
+
+def upsert_anomalies(collection, docs):
+    """
+    Stores anomaly documents with one unordered bulk_write of upserts;
+    returns the ones that were new. Keys already in the registry (stored
+    before, maybe archived or expired since) are skipped. Unordered:
+    documents that fail are logged and skipped, the rest are still written.
+    Duplicate key errors only mean a concurrent write stored the anomaly first.
+    """
+    unique = list({_key(doc): doc for doc in reversed(docs)}.values())[::-1]
+    if not unique:
+        return []
+    registered = _registered(collection, [_key(doc) for doc in unique])
+    unique = [doc for doc in unique if _key(doc) not in registered]
+    if not unique:
+        return []
+    failed = set()
+    try:
+        result = collection.bulk_write([_upsert(doc) for doc in unique], ordered=False)
+        upserted = result.upserted_ids
+    except BulkWriteError as bwe:
+        errors = [error for error in bwe.details.get("writeErrors", []) if error.get("code") != _DUPLICATE_KEY]
+        if errors:
+            logger.error(f"{len(errors)} of {len(unique)} anomalies failed to store: {errors[:1]}")
+        failed = {error["index"] for error in errors}
+        upserted = {item["index"]: item["_id"] for item in bwe.details.get("upserted", [])}
+    _register(collection, [doc for index, doc in enumerate(unique) if index not in failed])
+    inserted = []
+    for index, _id in upserted.items():
+        unique[index]["_id"] = _id
+        inserted.append(unique[index])
+    return inserted
+
+
+def delete_anomalies(collection, query):
+    """
+    Deletes the anomalies matching query, takes them out of the rollups and
+    unregisters their keys, so they can be stored again. Returns the number deleted.
+    """
+    docs = list(collection.find(query))
+    if not docs:
+        return 0
+    collection.delete_many({"_id": {"$in": [doc["_id"] for doc in docs]}})
+    if rollup_collection(collection).find_one({"dim": "total"}) is not None:
+        update_rollups(collection, docs, sign=-1)
+    registry = key_registry(collection)
+    for start in range(0, len(docs), ARCHIVE_BATCH_SIZE):
+        registry.bulk_write([DeleteOne(dict(zip(ANOMALY_KEY, _key(doc)))) for doc in docs[start:start + ARCHIVE_BATCH_SIZE]])
+    return len(docs)
+
+
+# --- Indexes ---
+def remove_duplicates(collection):
+    """
+    Deletes all but the oldest copy of each anomaly key (left by writes that
+    came before the unique index) and takes them out of the rollups. Returns
+    the number deleted.
+    """
+    groups = collection.aggregate([
+        {"$sort": {"_id": pymongo.ASCENDING}},
+        {"$group": {"_id": {field: f"${field}" for field in ANOMALY_KEY}, "ids": {"$push": "$_id"}, "n": {"$sum": 1}}},
+        {"$match": {"n": {"$gt": 1}}},
+    ], allowDiskUse=True)
+    rolled_up = rollup_collection(collection).find_one({"dim": "total"}) is not None
+    removed = 0
+    batch = []
+
+    def delete(ids):
+        if rolled_up:
+            update_rollups(collection, list(collection.find({"_id": {"$in": ids}})), sign=-1)
+        return collection.delete_many({"_id": {"$in": ids}}).deleted_count
+
+    for group in groups:
+        batch.extend(group["ids"][1:])
+        if len(batch) >= ARCHIVE_BATCH_SIZE:
+            removed += delete(batch)
+            batch = []
+    if batch:
+        removed += delete(batch)
+    return removed
+
+
+def ensure_retention_index(collection, days, field="detection_timestamp"):
+    """TTL index on `field` expiring after `days` days; days=0 removes it."""
+    existing = collection.index_information().get(RETENTION_INDEX)
+    seconds = int(timedelta(days=days).total_seconds())
+    if existing is not None and (existing.get("expireAfterSeconds") != seconds or existing.get("key") != [(field, 1)]):
+        collection.drop_index(RETENTION_INDEX)
+        existing = None
+    if days and existing is None:
+        collection.create_index(field, name=RETENTION_INDEX, expireAfterSeconds=seconds)
+        logger.info(f"Documents in '{collection.name}' expire {days} days after {field}.")
+
+
+def register_stored_keys(collection):
+    """Fills an empty key registry from the hot collection and its archives; returns the keys registered."""
+    registry = key_registry(collection)
+    if registry.find_one() is not None:
+        return 0
+    database = collection.database
+    sources = [collection] + [
+        database[name] for name in sorted(database.list_collection_names())
+        if name.startswith(f"{collection.name}_archive_")
+    ]
+    registered = 0
+    for source in sources:
+        batch = []
+        for doc in source.find({}, _KEY_PROJECTION):
+            batch.append(doc)
+            if len(batch) >= ARCHIVE_BATCH_SIZE:
+                _register(collection, batch)
+                registered += len(batch)
+                batch = []
+        if batch:
+            _register(collection, batch)
+            registered += len(batch)
+    if registered:
+        logger.info(f"Registered the keys of {registered} stored anomalies.")
+    return registered
+
+
+def ensure_anomaly_indexes(collection):
+    """
+    Creates the unique anomaly key index, removing duplicates first if the
+    collection has any, the key registry and the retention TTL index.
+    """
+    keys = [(field, pymongo.ASCENDING) for field in ANOMALY_KEY]
+    existing = collection.index_information().get(ANOMALY_KEY_INDEX)
+    if existing is not None and [field for field, _ in existing["key"]] != ANOMALY_KEY:
+        # An index on an older key (e.g. one that included job_id)
+        collection.drop_index(ANOMALY_KEY_INDEX)
+    try:
+        collection.create_index(keys, name=ANOMALY_KEY_INDEX, unique=True)
+    except OperationFailure as e:
+        if e.code != _DUPLICATE_KEY:
+            raise
+        logger.warning("Stored anomalies have duplicates; keeping the first copy of each.")
+        removed = remove_duplicates(collection)
+        logger.info(f"Removed {removed} duplicate anomalies.")
+        collection.create_index(keys, name=ANOMALY_KEY_INDEX, unique=True)
+    key_registry(collection).create_index(keys, name=ANOMALY_KEY_INDEX, unique=True)
+    register_stored_keys(collection)
+    # With archiving on, anomalies expire from the archives instead
+    ensure_retention_index(collection, 0 if ANOMALY_ARCHIVE_AFTER_DAYS else ANOMALY_RETENTION_DAYS)
+
+
+# --- Archive ---
+def archive_collection(collection, detected):
+    """The archive collection for anomalies detected in the month of `detected` (a datetime)."""
+    return collection.database[f"{collection.name}_archive_{detected:%Y_%m}"]
+
+
+def archive_anomalies(collection, now=None):
+    """
+    Moves anomalies detected more than ANOMALY_ARCHIVE_AFTER_DAYS ago into
+    their monthly archive collections, oldest first. Safe to rerun after an
+    interruption: copies keep their _id, so a batch copied but not yet
+    deleted is not archived twice. Returns the number moved.
+    """
+    if not ANOMALY_ARCHIVE_AFTER_DAYS:
+        return 0
+    cutoff = (now or datetime.now()) - timedelta(days=ANOMALY_ARCHIVE_AFTER_DAYS)
+    moved = 0
+    while True:
+        batch = list(
+            collection.find({"detection_timestamp": {"$lt": cutoff}})
+            .sort("detection_timestamp", pymongo.ASCENDING)
+            .limit(ARCHIVE_BATCH_SIZE)
+        )
+        if not batch:
+            break
+        months = {}
+        for doc in batch:
+            months.setdefault(f"{doc['detection_timestamp']:%Y_%m}", []).append(doc)
+        for docs in months.values():
+            archive = archive_collection(collection, docs[0]["detection_timestamp"])
+            ensure_retention_index(archive, ANOMALY_RETENTION_DAYS)
+            try:
+                archive.insert_many(docs, ordered=False)
+            except BulkWriteError as bwe:
+                if any(error.get("code") != _DUPLICATE_KEY for error in bwe.details.get("writeErrors", [])):
+                    raise
+        collection.delete_many({"_id": {"$in": [doc["_id"] for doc in batch]}})
+        moved += len(batch)
+    if moved:
+        logger.info(f"Archived {moved} anomalies detected before {cutoff:%Y-%m-%d}.")
+    return moved
@@ -0,0 +1,165 @@
+import asyncio
+import logging
+import os
+import time
+
+from fastapi.concurrency import run_in_threadpool
+from pymongo.errors import PyMongoError
+
+from anomaly_store import upsert_anomalies
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# --- Writer Settings ---
+# Documents per bulk_write of upserts
+WRITE_BATCH_SIZE = int(os.getenv("WRITE_BATCH_SIZE", "1000"))
+# Batches buffered before enqueue() makes callers wait (backpressure)
+WRITE_BUFFER_BATCHES = int(os.getenv("WRITE_BUFFER_BATCHES", "100"))
+# Seconds between attempts to replay the fallback buffer into MongoDB
+REPLAY_INTERVAL = float(os.getenv("REPLAY_INTERVAL", "10"))
+# Most documents kept in the fallback buffer while MongoDB is down; oldest are dropped
+FALLBACK_LIMIT = int(os.getenv("FALLBACK_LIMIT", "100000"))
+
+
+class AnomalyWriter:
+    """
+    Write-behind persistence for detected anomalies.
+
+    enqueue() splits documents into bounded batches on a queue and returns
+    once they are queued; a background task writes each batch with
+    anomaly_store.upsert_anomalies, so anomalies that are already stored are
+    skipped. Batches that can't be written because MongoDB is unreachable go
+    to the `fallback` list (main.in_memory_log_store) and are replayed,
+    oldest first, once get_collection() returns a live collection. After
+    every successful write, on_insert(collection, inserted_docs) is called
+    with the newly inserted documents (the dashboard rollups are maintained
+    this way).
+    """
+
+    def __init__(self, get_collection, fallback, on_insert=None):
+        self._get_collection = get_collection
+        self.fallback = fallback
+        self._on_insert = on_insert
+        self._queue = asyncio.Queue(maxsize=WRITE_BUFFER_BATCHES)
+        self._task = None
+        self._last_replay = 0.0
+        self.written = 0
+        self.duplicates = 0
+        self.dropped = 0
+
+    @property
+    def pending_batches(self):
+        return self._queue.qsize()
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"Anomaly writer started (batch size {WRITE_BATCH_SIZE}, buffer {WRITE_BUFFER_BATCHES} batches).")
+
+    async def enqueue(self, docs):
+        """Queues documents for writing; waits while the buffer is full."""
+        for start in range(0, len(docs), WRITE_BATCH_SIZE):
+            await self._queue.put(docs[start:start + WRITE_BATCH_SIZE])
+
+    async def flush(self):
+        """Waits until every queued batch has been written (or buffered)."""
+        if self._task is not None:
+            await self._queue.join()
+
+    async def stop(self):
+        """Flushes queued batches and makes a last replay attempt (called on shutdown)."""
+        if self._task is None:
+            return
+        await self._queue.join()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        if self.fallback:
+            await self._replay()
+        if self.fallback:
+            logger.warning(f"Shutting down with {len(self.fallback)} anomalies not written to MongoDB.")
+        logger.info(f"Anomaly writer stopped after writing {self.written} anomalies.")
+
+    async def _run(self):
+        while True:
+            try:
+                batch = await asyncio.wait_for(self._queue.get(), timeout=REPLAY_INTERVAL)
+            except asyncio.TimeoutError:
+                batch = None
+
+            if batch is not None:
+                try:
+                    await self._write(batch)
+                except Exception as e:
+                    # Never let one batch stop the writer task: enqueue() and stop() wait on it
+                    self.dropped += len(batch)
+                    logger.error(f"Dropped {len(batch)} anomalies that failed to write: {e}", exc_info=True)
+                finally:
+                    self._queue.task_done()
+
+            if self.fallback and time.monotonic() - self._last_replay >= REPLAY_INTERVAL:
+                try:
+                    await self._replay()
+                except Exception as e:
+                    logger.error(f"Replaying buffered anomalies failed: {e}", exc_info=True)
+
+    async def _insert(self, batch):
+        """
+        Upserts one batch; returns False if MongoDB is unavailable, so the
+        batch should be kept for a later attempt. A batch MongoDB can't store
+        for any other reason (e.g. bson's InvalidDocument for a value BSON
+        has no type for) would fail again on every replay, so it is dropped.
+        """
+        collection = await run_in_threadpool(self._get_collection)
+        if collection is None:
+            return False
+        try:
+            start = time.perf_counter()
+            inserted = await run_in_threadpool(upsert_anomalies, collection, batch)
+            metrics.observe_stages({"upsert_anomalies": time.perf_counter() - start}, rows=len(batch))
+        except PyMongoError as db_e:
+            logger.error(f"Failed to store anomalies in MongoDB: {db_e}")
+            return False
+        except Exception as e:
+            self.dropped += len(batch)
+            logger.error(f"Dropped {len(batch)} anomalies MongoDB can't store: {e}", exc_info=True)
+            return True
+        self.written += len(inserted)
+        self.duplicates += len(batch) - len(inserted)
+        if self._on_insert is not None and inserted:
+            try:
+                await run_in_threadpool(self._on_insert, collection, inserted)
+            except Exception as e:
+                # The anomalies are stored; only what's derived from them is behind.
+                # Never let this stop the writer task.
+                logger.error(f"Post-insert update failed for {len(inserted)} anomalies: {e}", exc_info=True)
+        return True
+
+    async def _write(self, batch):
+        if not await self._insert(batch):
+            self._buffer(batch)
+
+    def _buffer(self, batch):
+        self.fallback.extend(batch)
+        overflow = len(self.fallback) - FALLBACK_LIMIT
+        if overflow > 0:
+            del self.fallback[:overflow]
+            self.dropped += overflow
+            logger.warning(f"Fallback buffer full, dropped {overflow} oldest anomalies.")
+        logger.warning(f"DB unavailable, buffered {len(batch)} anomalies in memory ({len(self.fallback)} pending).")
+
+    async def _replay(self):
+        """Writes buffered anomalies back into MongoDB, oldest first."""
+        self._last_replay = time.monotonic()
+        replayed = 0
+        while self.fallback:
+            batch = self.fallback[:WRITE_BATCH_SIZE]
+            if not await self._insert(batch):
+                break
+            del self.fallback[:len(batch)]
+            replayed += len(batch)
+        if replayed:
+            logger.info(f"Replayed {replayed} buffered anomalies into MongoDB ({len(self.fallback)} still pending).")
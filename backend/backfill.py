@@ -0,0 +1,539 @@
+"""
+Offline batch scoring for backfills of archived charging exports.
+
+    python backend/backfill.py exports/2024/ --parquet results/
+    python backend/backfill.py "exports/**/*.csv.gz" --mongo --workers 16
+    python backend/backfill.py exports/2024/ --parquet results/ --work-dir /scratch/backfill
+
+Files (any /predict/ upload format; directories and globs are expanded) are
+scored on a process pool in three resumable phases:
+
+1. Score: each file is read in chunks of --chunk-size and run through the
+   DoS and fraud models (score_chunk). Flagged rows are spilled to the work
+   directory. So are the user_id/start_time/end_time columns (and parsed
+   geo/IP/charger columns) of every row, split into --partitions partitions
+   by a hash of user_id, and again by the hashed IP address and charger ID.
+2. Conflicts: each partition holds every session of its users from every
+   file, so multi-user conflicts, impossible travel and IP/charger fan-out
+   are found across file boundaries, exactly as if all the files had been
+   uploaded as one. IP/charger floods are found the same way over every
+   session of the partition's IPs and chargers.
+3. Write: each file's anomalies are assembled like /predict/ assembles them
+   and written to a Parquet part file, or loaded into the Mongo `anomalies`
+   collection (tagged with backfill_source).
+
+Progress is checkpointed in the work directory after every file and
+partition. Rerunning the same command resumes where it stopped. Files that
+changed or were added are scored again, and then every file's results are
+rewritten, since new sessions can create conflicts in other files. Writing
+a file's results replaces whatever an earlier run wrote for it.
+"""
+import argparse
+import glob
+import json
+import logging
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+# Make the backend modules importable the same way main.py does
+backend_dir = os.path.dirname(os.path.abspath(__file__))
+if backend_dir not in sys.path:
+    sys.path.insert(0, backend_dir)
+
+from anomaly_detector import (
+    CONFLICT_COLUMNS, assemble_anomalies, model_registry, score_chunk,
+)
+from anomaly_stats import ensure_rollups, prune_session_rollups, update_rollups
+from anomaly_store import MONGO_URI, delete_anomalies, ensure_anomaly_indexes, upsert_anomalies
+from anomaly_writer import WRITE_BATCH_SIZE
+from conflict_engine import conflict_flags
+from dos_windows import DOS_WINDOW_DETECTION, WINDOW_KEY_NAMES, WINDOW_KEYS, WINDOW_RESULT_COLUMNS, window_flags
+from geo_detection import GEO_CHECKS, GEO_COLUMNS, GEO_DETECTION, geo_flags
+from detection_pool import DETECTION_WORKERS
+from log_queries import ensure_log_indexes
+from column_resolver import resolve_column_names
+from upload_formats import PREDICT_CHUNK_SIZE, SUPPORTED_UPLOADS, expand_inputs, read_upload_file, upload_format
+
+logger = logging.getLogger(__name__)
+
+# --- Backfill Settings ---
+# User partitions for cross-file conflict detection; more partitions, less memory per task
+BACKFILL_PARTITIONS = int(os.getenv("BACKFILL_PARTITIONS", "16"))
+BACKFILL_WORK_DIR = os.getenv("BACKFILL_WORK_DIR", "backfill_work")
+
+CHECKPOINT_VERSION = 1
+
+
+# --- Inputs ---
+def _signature(path):
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime": stat.st_mtime}
+
+
+# --- Checkpoint ---
+class Checkpoint:
+    """
+    The backfill's progress, saved as JSON in the work directory after every
+    step. Files keep the id they were first registered with; spill files are
+    named by it.
+    """
+
+    def __init__(self, work_dir, partitions):
+        self.path = os.path.join(work_dir, "checkpoint.json")
+        self.state = {
+            "version": CHECKPOINT_VERSION, "partitions": partitions, "target": None,
+            "files": {}, "scored": {}, "failed": {},
+            "conflict_set": None, "partitions_done": [], "written": {},
+        }
+        if os.path.exists(self.path):
+            with open(self.path) as checkpoint_file:
+                self.state = json.load(checkpoint_file)
+            if self.state.get("version") != CHECKPOINT_VERSION:
+                raise SystemExit(f"{self.path} was written by another backfill version; use a new --work-dir.")
+
+    def __getitem__(self, key):
+        return self.state[key]
+
+    def save(self):
+        temporary = self.path + ".tmp"
+        with open(temporary, "w") as checkpoint_file:
+            json.dump(self.state, checkpoint_file, indent=1)
+        os.replace(temporary, self.path)
+
+    def register(self, paths):
+        """Adds new files and forgets the scores of files that changed; returns the changed paths."""
+        files = self.state["files"]
+        changed = []
+        for path in paths:
+            signature = _signature(path)
+            entry = files.get(path)
+            if entry is None:
+                files[path] = {"id": max((f["id"] for f in files.values()), default=-1) + 1, **signature}
+            elif {"size": entry["size"], "mtime": entry["mtime"]} != signature:
+                entry.update(signature)
+                self.state["scored"].pop(path, None)
+                changed.append(path)
+        return changed
+
+    def set_target(self, target):
+        if self.state["target"] != target:
+            self.state["target"] = target
+            self.state["written"] = {}
+
+    def invalidate_conflicts(self):
+        self.state["conflict_set"] = None
+        self.state["partitions_done"] = []
+        self.state["written"] = {}
+
+    def set_conflict_set(self, file_ids):
+        """Phases 2 and 3 are redone whenever the set of scored files changes."""
+        if self.state["conflict_set"] != file_ids:
+            self.invalidate_conflicts()
+            self.state["conflict_set"] = file_ids
+
+
+# --- Work Directory Layout ---
+def _flagged_path(work_dir, file_id):
+    return os.path.join(work_dir, "flagged", f"{file_id:05d}.pkl")
+
+
+def _piece_path(work_dir, partition, file_id, chunk_no):
+    return os.path.join(work_dir, "users", f"p{partition:03d}", f"{file_id:05d}-{chunk_no:05d}.pkl")
+
+
+def _hits_path(work_dir, file_id, partition):
+    return os.path.join(work_dir, "conflicts", f"{file_id:05d}-p{partition:03d}.pkl")
+
+
+def _key_piece_path(work_dir, partition, file_id, chunk_no, kind):
+    return os.path.join(work_dir, "keys", f"p{partition:03d}", f"{file_id:05d}-{chunk_no:05d}-{kind}.pkl")
+
+
+def _window_hits_path(work_dir, file_id, partition):
+    return os.path.join(work_dir, "windows", f"{file_id:05d}-p{partition:03d}.pkl")
+
+
+def _remove(pattern):
+    for path in glob.glob(pattern):
+        os.remove(path)
+
+
+def _forget_file(work_dir, file_id):
+    """Removes a file's spills (before it is scored again)."""
+    _remove(_flagged_path(work_dir, file_id))
+    _remove(os.path.join(work_dir, "users", "p*", f"{file_id:05d}-*.pkl"))
+    _remove(os.path.join(work_dir, "keys", "p*", f"{file_id:05d}-*.pkl"))
+
+
+# --- Phase 1: Score ---
+def _user_keys(user_id):
+    """
+    user_id as text, so the same user matches across files whose readers
+    typed it differently (1001, 1001.0 and '1001'); missing stays None.
+    """
+    codes, uniques = pd.factorize(user_id)
+
+    def key(user):
+        if isinstance(user, (float, np.floating)) and float(user).is_integer():
+            return str(int(user))
+        return str(user)
+
+    keys = np.array([key(user) for user in uniques] + [None], dtype=object)
+    return keys[codes]  # code -1 (missing) picks the trailing None
+
+
+def _partition_of(keys, partitions):
+    return (pd.util.hash_array(keys.astype(str)) % np.uint64(partitions)).astype(np.int64)
+
+
+def score_file(path, file_id, work_dir, chunk_size, partitions):
+    """
+    Phase 1 for one file, in a worker: scores every chunk and spills the
+    flagged rows and the per-partition conflict columns. Returns the row
+    count and info messages.
+    """
+    fmt = upload_format(path)
+    info_messages = []
+    flagged_frames = []
+    offset = 0
+    for chunk_no, chunk in enumerate(read_upload_file(path, fmt, resolve_column_names, chunk_size)):
+        result = score_chunk(chunk, offset)
+        offset += result["rows"]
+        info_messages.extend(msg for msg in result["info"] if msg not in info_messages)
+        rows = result["conflict_frame"].drop(columns="_user").join(result["ids"])
+        if result["flagged_frame"] is not None:
+            flagged_frames.append(rows.loc[result["flagged_frame"].index, CONFLICT_COLUMNS].join(result["flagged_frame"]))
+
+        keys = _user_keys(rows["user_id"])
+        known = pd.notna(keys)
+        users = rows.loc[known].assign(user_key=keys[known], file_id=file_id)
+        for partition, piece in users.groupby(_partition_of(keys[known], partitions), sort=False):
+            target = _piece_path(work_dir, partition, file_id, chunk_no)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            piece.to_pickle(target)
+
+        if DOS_WINDOW_DETECTION:
+            # Floods are per IP/charger, so those sessions are also partitioned by key
+            for kind, column in WINDOW_KEYS.items():
+                if column not in rows.columns:
+                    continue
+                key = rows[column].to_numpy(np.uint64)
+                keyed = rows.loc[key != 0, CONFLICT_COLUMNS + [column] + (["_pps"] if "_pps" in rows.columns else [])]
+                keyed = keyed.assign(file_id=file_id)
+                for partition, piece in keyed.groupby((key[key != 0] % np.uint64(partitions)).astype(np.int64), sort=False):
+                    target = _key_piece_path(work_dir, partition, file_id, chunk_no, kind)
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    piece.to_pickle(target)
+
+    flagged_target = _flagged_path(work_dir, file_id)
+    os.makedirs(os.path.dirname(flagged_target), exist_ok=True)
+    (pd.concat(flagged_frames) if flagged_frames else pd.DataFrame(columns=CONFLICT_COLUMNS)).to_pickle(flagged_target)
+    return {"rows": offset, "info": info_messages}
+
+
+# --- Phase 2: Conflicts ---
+def partition_conflicts(partition, work_dir, file_ids):
+    """
+    Phase 2 for one partition, in a worker: runs conflict and geo detection
+    over the partition's users, and windowed DoS detection over its IPs and
+    chargers, with their sessions from every scored file. Spills the flagged
+    rows, with what flagged them, per file. Returns the number of flagged rows.
+    """
+    _remove(os.path.join(work_dir, "conflicts", f"*-p{partition:03d}.pkl"))
+    _remove(os.path.join(work_dir, "windows", f"*-p{partition:03d}.pkl"))
+    flagged = partition_windows(partition, work_dir, file_ids)
+    pieces = sorted(glob.glob(os.path.join(work_dir, "users", f"p{partition:03d}", "*.pkl")))
+    pieces = [piece for piece in pieces if int(os.path.basename(piece)[:5]) in file_ids]
+    if not pieces:
+        return flagged
+    # Pieces are named file-then-chunk, so rows stay in file order like a single upload
+    users = pd.concat([pd.read_pickle(piece) for piece in pieces])
+    flags = conflict_flags(users["user_key"], users["start_time"], users["end_time"])
+    hit = flags.copy()
+    geo = None
+    if GEO_DETECTION and any(col in users.columns for col in GEO_COLUMNS):
+        geo = geo_flags(users.assign(user_id=users["user_key"]))
+        for check in GEO_CHECKS:
+            hit |= geo[check].to_numpy()
+    # Row labels repeat across files, so the flag columns are added by position
+    hits = users.loc[hit, CONFLICT_COLUMNS + ["file_id"]].assign(_conflict=flags[hit])
+    if geo is not None:
+        hits = hits.assign(**{col: values.to_numpy()[hit] for col, values in geo.items()})
+    os.makedirs(os.path.join(work_dir, "conflicts"), exist_ok=True)
+    for file_id, file_hits in hits.groupby("file_id", sort=False):
+        file_hits.drop(columns="file_id").to_pickle(_hits_path(work_dir, int(file_id), partition))
+    return flagged + int(hit.sum())
+
+
+def partition_windows(partition, work_dir, file_ids):
+    """Runs window_flags over each key of one partition; spills the flood rows per file."""
+    if not DOS_WINDOW_DETECTION:
+        return 0
+    hits = []
+    for kind in WINDOW_KEYS:
+        pieces = sorted(glob.glob(os.path.join(work_dir, "keys", f"p{partition:03d}", f"*-{kind}.pkl")))
+        pieces = [piece for piece in pieces if int(os.path.basename(piece)[:5]) in file_ids]
+        if not pieces:
+            continue
+        keyed = pd.concat([pd.read_pickle(piece) for piece in pieces])
+        windows = window_flags(keyed, keys=[kind])
+        hit = windows["dos_window"].to_numpy()
+        hits.append(keyed.loc[hit, CONFLICT_COLUMNS + ["file_id"]].assign(
+            **{col: values.to_numpy()[hit] for col, values in windows.items()}))
+    hits = pd.concat(hits) if hits else None
+    if hits is None or hits.empty:
+        return 0
+    os.makedirs(os.path.join(work_dir, "windows"), exist_ok=True)
+    for file_id, file_hits in hits.groupby("file_id", sort=False):
+        file_hits.drop(columns="file_id").to_pickle(_window_hits_path(work_dir, int(file_id), partition))
+    return len(hits)
+
+
+# --- Phase 3: Assemble ---
+def assemble_file(file_id, work_dir):
+    """Phase 3 for one file, in a worker: builds its anomaly list from the phase 1 and 2 spills."""
+    flagged = pd.read_pickle(_flagged_path(work_dir, file_id))
+    hit_paths = glob.glob(os.path.join(work_dir, "conflicts", f"{file_id:05d}-p*.pkl"))
+    hits = pd.concat([pd.read_pickle(path) for path in hit_paths]) if hit_paths else flagged.iloc[:0][CONFLICT_COLUMNS]
+    window_paths = glob.glob(os.path.join(work_dir, "windows", f"{file_id:05d}-p*.pkl"))
+    floods = pd.concat([pd.read_pickle(path) for path in window_paths]) if window_paths else None
+    if floods is not None:
+        # A session can flood both as an IP and as a charger; window_flags reports the IP
+        rank = floods['window_key'].map({name: i for i, name in enumerate(WINDOW_KEY_NAMES.values())})
+        floods = floods.iloc[np.argsort(rank.to_numpy(), kind='stable')]
+        floods = floods[~floods.index.duplicated()]
+
+    hits_only = pd.concat([hits[CONFLICT_COLUMNS]] + ([floods[CONFLICT_COLUMNS]] if floods is not None else []))
+    hits_only = hits_only.loc[~hits_only.index.isin(flagged.index) & ~hits_only.index.duplicated()]
+    df = pd.concat([flagged, hits_only]).sort_index() if len(hits_only) else flagged.sort_index()
+    if df.empty:
+        return []
+    dos_mask = df['_dos'].fillna(False).astype(bool) if '_dos' in df.columns else pd.Series(False, index=df.index)
+    fraud_mask = df['_fraud'].fillna(False).astype(bool) if '_fraud' in df.columns else pd.Series(False, index=df.index)
+    found = hits.drop(columns=CONFLICT_COLUMNS).reindex(df.index)
+    if '_conflict' in found.columns:
+        conflict_mask = found['_conflict'].fillna(False).astype(bool)
+    else:
+        # Spilled before geo detection, when every hit was a conflict
+        conflict_mask = pd.Series(df.index.isin(hits.index), index=df.index)
+    geo = None
+    if all(check in found.columns for check in GEO_CHECKS):
+        counts = ['fanout_ips', 'fanout_chargers']
+        geo = found.fillna({**{check: False for check in GEO_CHECKS}, **{col: 0 for col in counts}})
+        geo = geo.astype({**{check: bool for check in GEO_CHECKS}, **{col: np.int64 for col in counts}})
+    windows = None
+    if floods is not None:
+        windows = floods[WINDOW_RESULT_COLUMNS].reindex(df.index).fillna(
+            {'dos_window': False, 'window_key': '', 'window_minutes': 0, 'window_sessions': 0, 'window_packets': 0.0})
+        windows = windows.astype({'dos_window': bool, 'window_minutes': np.int64, 'window_sessions': np.int64})
+    return assemble_anomalies(df, dos_mask, fraud_mask, conflict_mask, geo, windows)
+
+
+def _init_worker():
+    model_registry.load_all()
+
+
+# --- Targets ---
+class ParquetTarget:
+    """Writes each file's anomalies to <out_dir>/part-<file id>.parquet."""
+
+    def __init__(self, out_dir):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise SystemExit("Parquet output needs pyarrow (pip install pyarrow).")
+        self.out_dir = os.path.abspath(out_dir)
+        os.makedirs(self.out_dir, exist_ok=True)
+
+    @property
+    def name(self):
+        return f"parquet:{self.out_dir}"
+
+    def write(self, path, file_id, anomalies):
+        target = os.path.join(self.out_dir, f"part-{file_id:05d}.parquet")
+        if not anomalies:
+            _remove(target)
+            return
+        frame = pd.DataFrame(anomalies)
+        frame['user_id'] = frame['user_id'].astype(str).where(frame['user_id'].notna(), None)
+        frame['source_file'] = path
+        frame.to_parquet(target + ".tmp", index=False)
+        os.replace(target + ".tmp", target)
+
+    def close(self):
+        pass
+
+
+class MongoTarget:
+    """
+    Bulk-loads anomalies into the anomalies collection, tagged with
+    backfill_source, and keeps the /stats/ rollups in step. Anomalies that
+    are already stored (e.g. from a /predict/ upload of the same export)
+    are left as they are.
+    """
+
+    def __init__(self, uri, database, collection):
+        import pymongo
+        self.client = pymongo.MongoClient(uri, serverSelectionTimeoutMS=5000)
+        self.client.server_info()
+        self.collection = self.client[database][collection]
+        ensure_anomaly_indexes(self.collection)
+        ensure_log_indexes(self.collection)
+        ensure_rollups(self.collection)
+        self.collection.create_index("backfill_source", sparse=True)
+        self.uri = f"{uri.rstrip('/')}/{database}.{collection}"
+
+    @property
+    def name(self):
+        return f"mongo:{self.uri}"
+
+    def write(self, path, file_id, anomalies):
+        # Replace what an earlier (maybe interrupted) run loaded for this file
+        delete_anomalies(self.collection, {"backfill_source": path})
+        detection_timestamp = datetime.now()
+        for start in range(0, len(anomalies), WRITE_BATCH_SIZE):
+            batch = [
+                {**anomaly, "detection_timestamp": detection_timestamp, "backfill_source": path}
+                for anomaly in anomalies[start:start + WRITE_BATCH_SIZE]
+            ]
+            update_rollups(self.collection, upsert_anomalies(self.collection, batch))
+        prune_session_rollups(self.collection)
+
+    def close(self):
+        self.client.close()
+
+
+# --- Driver ---
+def _rate(rows, seconds):
+    return f"{rows:,} rows in {seconds:.1f}s ({rows / seconds:,.0f} rows/s)" if seconds > 0 else f"{rows:,} rows"
+
+
+def run(paths, target, work_dir, workers, chunk_size, partitions):
+    """Runs (or resumes) a backfill; returns the number of files that failed to score."""
+    os.makedirs(work_dir, exist_ok=True)
+    checkpoint = Checkpoint(work_dir, partitions)
+    partitions = checkpoint["partitions"]
+    for path in checkpoint.register(paths):
+        logger.info(f"{path} changed since it was scored; scoring it again.")
+        _forget_file(work_dir, checkpoint["files"][path]["id"])
+    checkpoint.set_target(target.name)
+    checkpoint.save()
+    file_id = {path: checkpoint["files"][path]["id"] for path in paths}
+    started = time.perf_counter()
+
+    with ProcessPoolExecutor(max_workers=max(1, workers), initializer=_init_worker) as executor:
+        # Phase 1
+        to_score = [path for path in paths if path not in checkpoint["scored"]]
+        print(f"Phase 1: scoring {len(to_score)} of {len(paths)} files ({len(paths) - len(to_score)} already scored).")
+        phase_started = time.perf_counter()
+        scored_rows = 0
+        rescored = False
+        futures = {}
+        for path in to_score:
+            _forget_file(work_dir, file_id[path])
+            futures[executor.submit(score_file, path, file_id[path], work_dir, chunk_size, partitions)] = path
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                logger.error(f"❌ Failed to score {path}: {e}")
+                checkpoint["failed"][path] = str(e)
+            else:
+                if not rescored:
+                    # A new score changes the conflicts of every file
+                    checkpoint.invalidate_conflicts()
+                    rescored = True
+                checkpoint["failed"].pop(path, None)
+                checkpoint["scored"][path] = result
+                scored_rows += result["rows"]
+                print(f"  scored {path}: {result['rows']:,} rows")
+            checkpoint.save()
+        if to_score:
+            print(f"Phase 1 done: {_rate(scored_rows, time.perf_counter() - phase_started)}.")
+
+        scored = [path for path in paths if path in checkpoint["scored"]]
+        ids = sorted(file_id[path] for path in scored)
+        checkpoint.set_conflict_set(ids)
+        checkpoint.save()
+
+        # Phase 2
+        to_check = [p for p in range(partitions) if p not in checkpoint["partitions_done"]]
+        print(f"Phase 2: conflict detection over {len(to_check)} of {partitions} user partitions.")
+        phase_started = time.perf_counter()
+        futures = {executor.submit(partition_conflicts, p, work_dir, set(ids)): p for p in to_check}
+        for future in as_completed(futures):
+            conflicts = future.result()
+            checkpoint["partitions_done"].append(futures[future])
+            checkpoint.save()
+            logger.debug(f"Partition {futures[future]}: {conflicts} conflicts or geo hits.")
+        print(f"Phase 2 done in {time.perf_counter() - phase_started:.1f}s.")
+
+        # Phase 3
+        to_write = [path for path in scored if path not in checkpoint["written"]]
+        print(f"Phase 3: writing {len(to_write)} of {len(scored)} files to {target.name}.")
+        phase_started = time.perf_counter()
+        futures = {executor.submit(assemble_file, file_id[path], work_dir): path for path in to_write}
+        for future in as_completed(futures):
+            path = futures[future]
+            anomalies = future.result()
+            target.write(path, file_id[path], anomalies)
+            checkpoint["written"][path] = len(anomalies)
+            checkpoint.save()
+            print(f"  wrote {path}: {len(anomalies):,} anomalies")
+        print(f"Phase 3 done in {time.perf_counter() - phase_started:.1f}s.")
+
+    total_rows = sum(checkpoint["scored"][path]["rows"] for path in scored)
+    total_anomalies = sum(checkpoint["written"].get(path, 0) for path in scored)
+    print(f"Backfill of {len(scored)} files ({total_rows:,} rows): {total_anomalies:,} anomalies.")
+    print(f"This run: {_rate(scored_rows, time.perf_counter() - started)} end to end.")
+    failed = {path: error for path, error in checkpoint["failed"].items() if path in file_id}
+    for path, error in failed.items():
+        print(f"FAILED {path}: {error}")
+    return len(failed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('inputs', nargs='+', help=f"Files, directories or globs of {SUPPORTED_UPLOADS} files")
+    output = parser.add_mutually_exclusive_group(required=True)
+    output.add_argument('--parquet', metavar='OUT_DIR', help="Write one Parquet part file per input here")
+    output.add_argument('--mongo', action='store_true', help="Load the anomalies into MongoDB")
+    parser.add_argument('--mongo-uri', default=MONGO_URI)
+    parser.add_argument('--database', default="ev_anomaly_db")
+    parser.add_argument('--collection', default="anomalies")
+    parser.add_argument('--work-dir', default=BACKFILL_WORK_DIR, help="Checkpoint and spill files; reuse it to resume")
+    parser.add_argument('--workers', type=int, default=DETECTION_WORKERS or 1)
+    parser.add_argument('--chunk-size', type=int, default=PREDICT_CHUNK_SIZE)
+    parser.add_argument('--partitions', type=int, default=BACKFILL_PARTITIONS,
+                        help="User partitions for conflict detection (fixed once a work dir exists)")
+    parser.add_argument('--clean', action='store_true', help="Delete the work dir after a fully successful run")
+    args = parser.parse_args()
+
+    # Per-chunk INFO logs of the detector would drown the progress report
+    logging.getLogger().setLevel(logging.WARNING)
+    logger.setLevel(logging.INFO)
+    paths = expand_inputs(args.inputs)
+    if not paths:
+        raise SystemExit(f"No {SUPPORTED_UPLOADS} files found in {args.inputs}.")
+
+    target = ParquetTarget(args.parquet) if args.parquet else MongoTarget(args.mongo_uri, args.database, args.collection)
+    try:
+        failed = run(paths, target, args.work_dir, args.workers, args.chunk_size, args.partitions)
+    finally:
+        target.close()
+    if failed:
+        sys.exit(1)
+    if args.clean:
+        shutil.rmtree(args.work_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+Benchmarks multi-user conflict detection at increasing sizes on synthetic
+sessions (int ids, one year of start times, 5-120 minute sessions).
+
+Usage:
+    python backend/benchmarks/bench_conflicts.py --sizes 1000000 10000000 30000000
+
+Compares conflict_flags (full sort and assume_sorted), ConflictTracker fed in
+chunks, and the previous copy + sort_values + shift check (up to --legacy-max
+rows). Peak memory is the process's max RSS so far.
+"""
+import argparse
+import resource
+
+import numpy as np
+import pandas as pd
+
+from common import quiet_logging, timed
+
+from conflict_engine import conflict_flags, ConflictTracker
+
+YEAR_SECONDS = 365 * 24 * 3600
+
+
+def synthetic_sessions(rows, users, seed=0):
+    rng = np.random.default_rng(seed)
+    start = pd.Timestamp('2025-01-01') + pd.to_timedelta(rng.integers(0, YEAR_SECONDS, rows), unit='s')
+    duration = pd.to_timedelta(rng.integers(5, 120, rows), unit='m')
+    return pd.DataFrame({
+        'session_id': np.arange(rows),
+        'user_id': rng.integers(0, users, rows),
+        'start_time': start,
+        'end_time': start + duration,
+    })
+
+
+def legacy_conflicts(df):
+    """The previous check: copy, re-parse, full sort, compare with the preceding row only."""
+    df_sorted = df.copy()
+    df_sorted['start_time'] = pd.to_datetime(df_sorted['start_time'], errors='coerce')
+    df_sorted['end_time'] = pd.to_datetime(df_sorted['end_time'], errors='coerce')
+    df_sorted = df_sorted.dropna(subset=['start_time', 'end_time'])
+    df_sorted = df_sorted.sort_values(by=['user_id', 'start_time'])
+    conflicts = df_sorted[
+        (df_sorted['user_id'] == df_sorted['user_id'].shift(1)) &
+        (df_sorted['start_time'] < df_sorted['end_time'].shift(1))
+    ]
+    return conflicts['session_id'].tolist()
+
+
+def tracked_conflicts(df, chunk_size):
+    tracker = ConflictTracker()
+    found = 0
+    for start in range(0, len(df), chunk_size):
+        chunk = df.iloc[start:start + chunk_size]
+        found += int(tracker.update(chunk['user_id'], chunk['start_time'], chunk['end_time'], assume_sorted=True).sum())
+    return found
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1_000_000, 10_000_000, 30_000_000])
+    parser.add_argument('--users', type=int, default=50_000, help="Distinct users")
+    parser.add_argument('--chunk-size', type=int, default=1_000_000, help="Rows per ConflictTracker update")
+    parser.add_argument('--legacy-max', type=int, default=10_000_000, help="Largest size to time the legacy check at")
+    args = parser.parse_args()
+
+    quiet_logging()
+    print(f"{'rows':>12} {'method':<22} {'seconds':>8} {'rows/s':>14} {'conflicts':>10} {'peak MB':>8}")
+    for rows in args.sizes:
+        df = synthetic_sessions(rows, args.users)
+
+        def report(method, seconds, conflicts):
+            print(f"{rows:>12,} {method:<22} {seconds:>8.2f} {rows / seconds:>14,.0f} {conflicts:>10,} {peak_rss_mb():>8,.0f}")
+
+        seconds, flags = timed(conflict_flags, df['user_id'], df['start_time'], df['end_time'])
+        report("conflict_flags", seconds, int(flags.sum()))
+
+        df = df.sort_values('start_time', ignore_index=True)
+        seconds, flags = timed(conflict_flags, df['user_id'], df['start_time'], df['end_time'], assume_sorted=True)
+        report("  assume_sorted", seconds, int(flags.sum()))
+
+        seconds, found = timed(tracked_conflicts, df, args.chunk_size)
+        report("ConflictTracker", seconds, found)
+
+        if rows <= args.legacy_max:
+            seconds, ids = timed(legacy_conflicts, df)
+            report("legacy (adjacent only)", seconds, len(ids))
+        del df
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+Benchmarks windowed DoS detection against the per-row DoS model it runs
+alongside, on synthetic sessions: --ips IP addresses and --chargers
+chargers spread over --days days, with normal packets_per_sec.
+
+Usage:
+    python backend/benchmarks/bench_dos_windows.py --sizes 1000000 10000000
+    python backend/benchmarks/bench_dos_windows.py --sizes 1000000 --partition-rows 250000
+
+Times the per-row DoS scoring (_score_model with the loaded dos_model),
+window_counts for one key, window_flags for both keys, a pandas
+groupby().rolling() over the IPs for comparison (up to --legacy-max rows)
+and the streaming WindowTracker in 500-row batches (up to --stream-max
+rows). Peak memory is the process's max RSS so far.
+"""
+import argparse
+import resource
+
+import numpy as np
+import pandas as pd
+
+from common import quiet_logging, timed
+
+import anomaly_detector as ad
+import dos_windows
+from dos_windows import DOS_WINDOWS, WindowTracker, window_counts, window_flags
+from geo_detection import hash_ids
+
+
+def synthetic_sessions(rows, ips, chargers, days, seed=0):
+    rng = np.random.default_rng(seed)
+    start = pd.Timestamp('2025-01-01') + pd.to_timedelta(np.sort(rng.integers(0, days * 86400, rows)), unit='s')
+    return pd.DataFrame({
+        'session_id': np.arange(rows),
+        'user_id': rng.integers(0, max(rows // 20, 1), rows),
+        'start_time': start,
+        'end_time': start + pd.to_timedelta(rng.integers(15, 120, rows), unit='m'),
+        'cpu_usage_percent': rng.uniform(10, 60, rows).round(1),
+        'packets_per_sec': rng.integers(50, 200, rows),
+        'ip_address': rng.integers(0, ips, rows),
+        'charger_id': rng.integers(0, chargers, rows),
+    })
+
+
+def pandas_rolling(frame):
+    """The obvious pandas version: a time-based rolling count and sum per IP."""
+    rolled = frame.groupby('_ip').rolling(f'{DOS_WINDOWS[0]}min', on='start_time')['_pps']
+    return rolled.count(), rolled.sum()
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1_000_000, 10_000_000])
+    parser.add_argument('--ips', type=int, default=1_000_000)
+    parser.add_argument('--chargers', type=int, default=20_000)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--partition-rows', type=int, default=dos_windows.DOS_WINDOW_PARTITION_ROWS,
+                        help="DOS_WINDOW_PARTITION_ROWS for the run")
+    parser.add_argument('--legacy-max', type=int, default=1_000_000, help="Largest size to time pandas rolling at")
+    parser.add_argument('--stream-max', type=int, default=200_000, help="Largest size to time the WindowTracker at")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    quiet_logging()
+    dos_windows.DOS_WINDOW_PARTITION_ROWS = args.partition_rows
+    scaler, model = ad.model_registry.get_many('dos_scaler', 'dos_model')
+    print(f"{'rows':>12} {'stage':<24} {'seconds':>8} {'rows/s':>14} {'flagged':>10} {'peak MB':>8}")
+    for rows in args.sizes:
+        df = synthetic_sessions(rows, args.ips, args.chargers, args.days, args.seed)
+
+        def report(name, seconds, flagged=None):
+            flagged = f"{flagged:>10,}" if flagged is not None else f"{'-':>10}"
+            print(f"{rows:>12,} {name:<24} {seconds:>8.2f} {rows / seconds:>14,.0f} {flagged} {peak_rss_mb():>8,.0f}")
+
+        seconds, dos_mask = timed(ad._score_model, df, ad.DOS_FEATURES, scaler, model, "DoS", [])
+        report("per-row DoS model", seconds, int(dos_mask.sum()))
+
+        frame = df[['start_time']].assign(_ip=hash_ids(df['ip_address']), _charger=hash_ids(df['charger_id']),
+                                          _pps=df['packets_per_sec'].astype(np.float64))
+        start = frame['start_time'].to_numpy().view(np.int64)
+        seconds, _ = timed(window_counts, frame['_ip'].to_numpy(), start, frame['_pps'].to_numpy())
+        report("window_counts (IP)", seconds)
+        seconds, windows = timed(window_flags, frame)
+        report("window_flags (both)", seconds, int(windows['dos_window'].sum()))
+        if rows <= args.legacy_max:
+            seconds, _ = timed(pandas_rolling, frame)
+            report(f"  pandas rolling (IP, {DOS_WINDOWS[0]}m)", seconds)
+        if rows <= args.stream_max:
+            tracker = WindowTracker()
+            batches = range(0, rows, 500)
+            seconds, _ = timed(lambda: [tracker.update(df.iloc[i:i + 500]) for i in batches])
+            report("WindowTracker (500/batch)", seconds)
+        del df, frame, windows
+
+
+if __name__ == '__main__':
+    main()
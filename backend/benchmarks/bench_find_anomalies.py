@@ -0,0 +1,141 @@
+"""
+Benchmarks find_anomalies against the previous row-by-row result assembly
+(iterrows plus a linear scan of the results for sessions flagged twice),
+extended with the user_id field and the travel, fan-out and windowed DoS
+checks so the two outputs can still be compared.
+
+Usage:
+    python generate_data.py                     # or any session export
+    python backend/benchmarks/bench_find_anomalies.py --csv data/ev_charging_data.csv --rows 1000000
+    python backend/benchmarks/bench_find_anomalies.py --rows 1000000 --no-legacy
+
+Without --csv the bundled sample is tiled up to --rows rows. The legacy path
+is quadratic in the number of doubly flagged sessions, so it can take a very
+long time on 1M rows; use --legacy-rows to time it on a prefix instead.
+"""
+import argparse
+
+import pandas as pd
+
+from common import load_sessions, quiet_logging, timed
+
+import anomaly_detector as ad
+from column_resolver import standardize_columns
+
+
+def _append_or_merge(all_anomalies, processed_session_ids, row, anomaly_type, details, merged_details):
+    """Adds a new anomaly for row's session, or merges the check into the one already reported."""
+    session_id = row['session_id']
+    if session_id not in processed_session_ids:
+        all_anomalies.append({
+            'session_id': session_id,
+            'user_id': row['user_id'] if pd.notna(row['user_id']) else None,
+            'anomaly_type': anomaly_type,
+            'timestamp': row['start_time'],
+            'details': details,
+        })
+        processed_session_ids.add(session_id)
+    else:
+        for existing_anomaly in all_anomalies:
+            if existing_anomaly['session_id'] == session_id:
+                existing_anomaly['details'] += merged_details
+                existing_anomaly['anomaly_type'] += '+' + anomaly_type
+                break
+
+
+def legacy_find_anomalies(df):
+    """
+    The pre-vectorization result assembly, kept here for comparison. The
+    travel, fan-out and windowed DoS flags come from the same detectors as
+    find_anomalies; only the per-row assembly of the records is the old one.
+    """
+    ad.prepare_frame(df)
+    info_messages = []
+    dos_mask, fraud_mask = ad.score_rows(df, info_messages)
+    frame = ad._with_detection_columns(df, ['user_id', 'start_time', 'end_time'])
+    geo = ad._geo_flags(frame, info_messages)
+    windows = ad._dos_windows(frame, info_messages)
+    window_mask = windows['dos_window'] if windows is not None else pd.Series(False, index=df.index)
+    all_anomalies = []
+    processed_session_ids = set()
+
+    for index, row in df.loc[dos_mask | window_mask].iterrows():
+        session_id = row['session_id']
+        if session_id not in processed_session_ids:
+            details = []
+            if dos_mask[index]:
+                details.append(f"CPU: {row.get('cpu_usage_percent', 'N/A')}%, Packets: {row.get('packets_per_sec', 'N/A')}/sec")
+            if window_mask[index]:
+                flood = windows.loc[index]
+                details.append(f"Flood: {flood['window_key']}, {flood['window_sessions']} sessions, "
+                               f"{round(flood['window_packets'], 1)} packets/sec in {flood['window_minutes']} min")
+            all_anomalies.append({
+                'session_id': session_id,
+                'user_id': row['user_id'] if pd.notna(row['user_id']) else None,
+                'anomaly_type': 'dos_attack',
+                'timestamp': row['start_time'],
+                'details': '; '.join(details),
+            })
+            processed_session_ids.add(session_id)
+
+    for index, row in df.loc[fraud_mask].iterrows():
+        fraud_details = f"Energy: {row.get('energy_kWh', 'N/A')} kWh, Amount: {row.get('amount_INR', 'N/A')} INR"
+        _append_or_merge(all_anomalies, processed_session_ids, row, 'billing_fraud', fraud_details, "; Fraud: " + fraud_details)
+
+    conflict_ids = ad.detect_multi_user_conflict(df)
+    for index, row in df[df['session_id'].isin(conflict_ids)].iterrows():
+        _append_or_merge(
+            all_anomalies, processed_session_ids, row, 'multi_user_conflict',
+            f"User: {row.get('user_id', 'N/A')}, Start: {row.get('start_time', 'N/A')}, End: {row.get('end_time', 'N/A')}",
+            f"; Conflict: User: {row.get('user_id', 'N/A')}",
+        )
+
+    if geo is not None:
+        for index, row in df.loc[geo['impossible_travel']].iterrows():
+            figures = geo.loc[index]
+            travel_details = (f"Distance: {round(figures['travel_km'], 1)} km, Gap: {round(figures['travel_minutes'], 1)} min, "
+                              f"Speed: {round(figures['travel_kmh'], 1)} km/h")
+            _append_or_merge(all_anomalies, processed_session_ids, row, 'impossible_travel',
+                             travel_details, "; Travel: " + travel_details)
+        for index, row in df.loc[geo['ip_charger_fanout']].iterrows():
+            figures = geo.loc[index]
+            fanout_details = (f"IPs: {figures['fanout_ips']}, Chargers: {figures['fanout_chargers']} "
+                              f"in {ad.FANOUT_WINDOW_MINUTES} min")
+            _append_or_merge(all_anomalies, processed_session_ids, row, 'ip_charger_fanout',
+                             fanout_details, "; Fan-out: " + fanout_details)
+
+    for anomaly in all_anomalies:
+        if isinstance(anomaly.get('timestamp'), pd.Timestamp):
+            anomaly['timestamp'] = anomaly['timestamp'].isoformat()
+        else:
+            anomaly['timestamp'] = "Invalid/Missing Timestamp"
+    return {"anomalies": all_anomalies, "info": info_messages}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--csv', help="Session CSV to score (default: tiled bundled sample)")
+    parser.add_argument('--rows', type=int, default=1_000_000, help="Rows to score")
+    parser.add_argument('--legacy-rows', type=int, help="Rows to score with the legacy path (default: --rows)")
+    parser.add_argument('--no-legacy', action='store_true', help="Skip the legacy path")
+    args = parser.parse_args()
+
+    quiet_logging()
+    df = standardize_columns(load_sessions(args.csv, args.rows))
+    print(f"Loaded {len(df):,} rows")
+
+    seconds, result = timed(ad.find_anomalies, df.copy())
+    print(f"vectorized: {seconds:8.2f}s  {len(df) / seconds:12,.0f} rows/s  {len(result['anomalies']):,} anomalies")
+
+    if args.no_legacy:
+        return
+    legacy_df = df.head(args.legacy_rows) if args.legacy_rows else df
+    legacy_seconds, legacy_result = timed(legacy_find_anomalies, legacy_df.copy())
+    print(f"legacy:     {legacy_seconds:8.2f}s  {len(legacy_df) / legacy_seconds:12,.0f} rows/s  {len(legacy_result['anomalies']):,} anomalies")
+
+    if len(legacy_df) == len(df):
+        print(f"speedup: {legacy_seconds / seconds:.1f}x, identical output: {legacy_result == result}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+Benchmarks the geo/IP detection stage at increasing sizes on sessions from
+generate_data.py (random worldwide "lat,lon" strings and IPv4 addresses).
+
+Usage:
+    python backend/benchmarks/bench_geo_detection.py --sizes 1000000 5000000
+    python backend/benchmarks/bench_geo_detection.py --sizes 1000000 --users 50000
+
+Times parse_lat_lon (with pyarrow when installed, and the pure-Python
+fallback), the str.split parse it replaces (up to --legacy-max rows),
+hash_ids, and geo_flags with each check alone and both together. Peak
+memory is the process's max RSS so far.
+"""
+import argparse
+import resource
+
+import numpy as np
+import pandas as pd
+
+from common import generated_sessions, quiet_logging, timed
+
+import geo_detection
+from geo_detection import geo_columns, geo_flags, hash_ids, parse_lat_lon
+
+
+def split_parse(values):
+    """The obvious pandas parse: split each string, then convert both halves."""
+    parts = values.str.split(',', expand=True)
+    return pd.to_numeric(parts[0], errors='coerce').to_numpy(), pd.to_numeric(parts[1], errors='coerce').to_numpy()
+
+
+def python_parse(values):
+    """parse_lat_lon as it runs without pyarrow."""
+    arrow, geo_detection.pa = geo_detection.pa, None
+    try:
+        return parse_lat_lon(values)
+    finally:
+        geo_detection.pa = arrow
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1_000_000, 5_000_000])
+    parser.add_argument('--users', type=int, default=50_000, help="Distinct users (0 keeps generate_data.py's 51)")
+    parser.add_argument('--legacy-max', type=int, default=1_000_000, help="Largest size to time the str.split parse at")
+    parser.add_argument('--seed', type=int, default=0, help="generate_data.py seed")
+    args = parser.parse_args()
+
+    quiet_logging()
+    print(f"{'rows':>12} {'stage':<26} {'seconds':>8} {'rows/s':>14} {'flagged':>10} {'peak MB':>8}")
+    for rows in args.sizes:
+        df = generated_sessions(rows, seed=args.seed)
+        if args.users:
+            df['user_id'] = np.random.default_rng(args.seed).integers(0, args.users, rows)
+
+        def report(name, seconds, flagged=None):
+            flagged = f"{flagged:>10,}" if flagged is not None else f"{'-':>10}"
+            print(f"{rows:>12,} {name:<26} {seconds:>8.2f} {rows / seconds:>14,.0f} {flagged} {peak_rss_mb():>8,.0f}")
+
+        if geo_detection.pa is not None:
+            seconds, _ = timed(parse_lat_lon, df['geo_location'])
+            report("parse_lat_lon (pyarrow)", seconds)
+        seconds, _ = timed(python_parse, df['geo_location'])
+        report("parse_lat_lon (python)", seconds)
+        if rows <= args.legacy_max:
+            seconds, _ = timed(split_parse, df['geo_location'])
+            report("  str.split (legacy)", seconds)
+        seconds, _ = timed(hash_ids, df['ip_address'])
+        report("hash_ids", seconds)
+
+        frame = df[['user_id', 'start_time', 'end_time']].join(geo_columns(df))
+        for name, checks in (("impossible_travel", ['impossible_travel']), ("ip_charger_fanout", ['ip_charger_fanout']),
+                             ("geo_flags (both)", geo_detection.GEO_CHECKS)):
+            seconds, flags = timed(geo_flags, frame, checks)
+            report(name, seconds, int(flags[checks].any(axis=1).sum()))
+        del df, frame
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""
+Benchmarks IsolationForest scoring: scaler.transform + model.predict against
+the compiled lookup-table scorer, and checks that both give identical
+decision_function values and predictions.
+
+Usage:
+    python backend/benchmarks/bench_scoring.py --rows 1000000
+    python backend/benchmarks/bench_scoring.py --csv data/ev_charging_data.csv --threads 1 4
+
+Without --csv the bundled sample is tiled up to --rows rows. Uniform random
+rows spanning each feature's range are appended (--random-rows) so the
+check also covers values the sample never hits.
+"""
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from common import load_sessions, quiet_logging, timed
+
+import anomaly_detector as ad
+from compiled_forest import CompiledIsolationForest
+from column_resolver import standardize_columns
+
+PAIRS = [
+    ("DoS", ad.DOS_FEATURES, "dos_scaler", "dos_model"),
+    ("Fraud", ad.FRAUD_FEATURES, "fraud_scaler", "fraud_model"),
+]
+
+
+def feature_matrix(df, features, random_rows, seed=0):
+    X = df[features].apply(pd.to_numeric, errors='coerce').dropna().to_numpy(dtype=np.float64)
+    rng = np.random.default_rng(seed)
+    low, high = X.min(axis=0), X.max(axis=0)
+    span = high - low
+    extra = rng.uniform(low - span, high + span, size=(random_rows, len(features)))
+    return np.concatenate([X, extra])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--csv', help="Session CSV to score (default: tiled bundled sample)")
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--random-rows', type=int, default=100_000)
+    parser.add_argument('--threads', type=int, nargs='+', default=[1], help="n_jobs values for the compiled scorer")
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    quiet_logging()
+    df = standardize_columns(load_sessions(args.csv, args.rows))
+
+    print(f"{'model':<6} {'method':<20} {'rows':>10} {'seconds':>8} {'rows/s':>14} {'exact':>6}")
+    for name, features, scaler_name, model_name in PAIRS:
+        scaler, model = ad.model_registry.get_many(scaler_name, model_name)
+        X = feature_matrix(df, features, args.random_rows)
+
+        def report(method, seconds, exact=""):
+            print(f"{name:<6} {method:<20} {len(X):>10,} {seconds:>8.2f} {len(X) / seconds:>14,.0f} {exact:>6}")
+
+        seconds, compiled = timed(CompiledIsolationForest, model, scaler)
+        print(f"{name:<6} {'compile':<20} {'':>10} {seconds:>8.2f}")
+
+        seconds, expected = timed(lambda: model.decision_function(scaler.transform(X)), repeat=args.repeat)
+        report("sklearn", seconds)
+        expected_labels = np.where(expected < 0, -1, 1)
+
+        for threads in args.threads:
+            compiled.n_jobs = threads
+            seconds, decision = timed(compiled.decision_function, X, repeat=args.repeat)
+            exact = np.array_equal(decision, expected) and np.array_equal(compiled.predict(X), expected_labels)
+            report(f"compiled n_jobs={threads}", seconds, "yes" if exact else "NO")
+
+
+if __name__ == '__main__':
+    main()
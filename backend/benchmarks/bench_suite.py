@@ -0,0 +1,140 @@
+"""
+Benchmark suite: times find_anomalies, detect_multi_user_conflict and the
+/predict/ endpoint (in-process, through FastAPI's TestClient) on sessions
+from generate_data.py at several sizes, and reports throughput and peak
+memory. Results can be saved and compared against a saved baseline, so
+regressions show up as a non-zero exit code.
+
+Usage:
+    python backend/benchmarks/bench_suite.py --sizes 100000 1000000
+    python backend/benchmarks/bench_suite.py --sizes 1000000 --save baseline.json
+    python backend/benchmarks/bench_suite.py --sizes 1000000 --baseline baseline.json --tolerance 0.2
+
+/predict/ stores into mongomock when it is installed; otherwise MongoDB is
+treated as down and anomalies go to the in-memory fallback buffer. The
+result cache is reset before every upload so each one is really scored.
+Peak memory is measured with tracemalloc in a separate run of each case,
+so it doesn't slow down the timed runs (--no-memory skips it).
+"""
+import argparse
+import json
+import sys
+import tracemalloc
+
+from common import generated_sessions, quiet_logging, timed
+
+import anomaly_detector as ad
+import main as app_main
+from result_cache import ResultCache
+
+CASES = ['find_anomalies', 'detect_multi_user_conflict', 'predict']
+
+
+def use_mongomock():
+    """Points the app's MongoClient at mongomock, if it is installed."""
+    try:
+        import mongomock
+    except ImportError:
+        return False
+    app_main.pymongo.MongoClient = mongomock.MongoClient
+    return True
+
+
+def case_functions(df, client):
+    """Returns {case: zero-argument callable} for one dataset."""
+    standardized = app_main.standardize_columns(df.copy())
+    prepared = standardized.copy()
+    ad.prepare_frame(prepared)
+    upload = df.to_csv(index=False).encode('utf-8')
+
+    def predict():
+        # A fresh cache so every upload is scored, not served from the cache
+        app_main.result_cache = ResultCache(directory=None)
+        response = client.post('/predict/', files={'file': ('bench.csv', upload, 'text/csv')})
+        response.raise_for_status()
+        return response
+
+    return {
+        'find_anomalies': lambda: ad.find_anomalies(standardized.copy()),
+        'detect_multi_user_conflict': lambda: ad.detect_multi_user_conflict(prepared),
+        'predict': predict,
+    }
+
+
+def peak_memory_mb(func):
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1] / 2 ** 20
+    finally:
+        tracemalloc.stop()
+
+
+def compare(results, baseline, tolerance):
+    """Returns a message for every case/size that got slower or bigger than the baseline allows."""
+    regressions = []
+    for case, sizes in results.items():
+        for size, current in sizes.items():
+            previous = baseline.get(case, {}).get(size)
+            if previous is None:
+                continue
+            if current['rows_per_sec'] < previous['rows_per_sec'] * (1 - tolerance):
+                regressions.append(f"{case} @ {size} rows: {current['rows_per_sec']:,.0f} rows/s, "
+                                   f"baseline {previous['rows_per_sec']:,.0f}")
+            if current.get('peak_mb') and previous.get('peak_mb') and \
+                    current['peak_mb'] > previous['peak_mb'] * (1 + tolerance):
+                regressions.append(f"{case} @ {size} rows: peak {current['peak_mb']:,.0f} MB, "
+                                   f"baseline {previous['peak_mb']:,.0f} MB")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100_000, 1_000_000])
+    parser.add_argument('--cases', nargs='+', choices=CASES, default=CASES)
+    parser.add_argument('--repeat', type=int, default=3, help="Timed runs per case; the best is kept")
+    parser.add_argument('--seed', type=int, default=0, help="generate_data.py seed")
+    parser.add_argument('--no-memory', action='store_true', help="Skip the tracemalloc peak memory runs")
+    parser.add_argument('--save', help="Write the results to this JSON file")
+    parser.add_argument('--baseline', help="Compare against results saved with --save")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="Allowed slowdown / memory growth (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    quiet_logging()
+    mongo = "mongomock" if use_mongomock() else "in-memory fallback"
+    print(f"/predict/ storage: {mongo}")
+
+    from fastapi.testclient import TestClient
+    results = {case: {} for case in args.cases}
+    print(f"{'case':<28} {'rows':>12} {'seconds':>8} {'rows/s':>14} {'peak MB':>8}")
+    with TestClient(app_main.app) as client:
+        for rows in args.sizes:
+            df = generated_sessions(rows, seed=args.seed)
+            functions = case_functions(df, client)
+            for case in args.cases:
+                seconds, _ = timed(functions[case], repeat=args.repeat)
+                peak = None if args.no_memory else peak_memory_mb(functions[case])
+                results[case][str(rows)] = {
+                    'seconds': seconds, 'rows_per_sec': rows / seconds, 'peak_mb': peak,
+                }
+                peak_text = f"{peak:>8,.0f}" if peak is not None else f"{'-':>8}"
+                print(f"{case:<28} {rows:>12,} {seconds:>8.2f} {rows / seconds:>14,.0f} {peak_text}")
+            del df, functions
+
+    if args.save:
+        with open(args.save, 'w') as out:
+            json.dump(results, out, indent=2)
+        print(f"Saved results to {args.save}")
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.tolerance)
+        for message in regressions:
+            print(f"REGRESSION: {message}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions beyond {args.tolerance:.0%} of {args.baseline}.")
+
+
+if __name__ == '__main__':
+    main()
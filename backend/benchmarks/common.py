@@ -0,0 +1,64 @@
+"""Shared helpers for the backend benchmark scripts."""
+import logging
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# Make the backend modules importable the same way main.py does
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+SAMPLE_CSV = BACKEND_DIR.parent / 'ev-anomaly-detection' / 'data' / 'ev_charging_data.csv'
+GENERATOR_DIR = BACKEND_DIR.parent / 'ev-anomaly-detection'
+
+
+def quiet_logging():
+    """Keeps per-call INFO/DEBUG logs from dominating the timings."""
+    logging.disable(logging.INFO)
+
+
+def load_sessions(csv_path=None, rows=None):
+    """
+    Loads a session CSV (e.g. one written by generate_data.py). Without a
+    path, the bundled sample is tiled up to `rows` rows, with session and
+    user ids offset per copy so copies don't collide or overlap each other.
+    """
+    if csv_path:
+        if str(csv_path).endswith('.parquet'):
+            return pd.read_parquet(csv_path).head(rows) if rows else pd.read_parquet(csv_path)
+        df = pd.read_csv(csv_path, nrows=rows)
+        return df
+
+    sample = pd.read_csv(SAMPLE_CSV)
+    if not rows or rows <= len(sample):
+        return sample.head(rows) if rows else sample
+
+    copies = -(-rows // len(sample))
+    tiled = pd.concat([sample] * copies, ignore_index=True).head(rows)
+    copy_number = np.arange(len(tiled)) // len(sample)
+    tiled['session_id'] = tiled['session_id'] + '-' + copy_number.astype(str)
+    tiled['user_id'] = tiled['user_id'] + copy_number * 1000
+    return tiled
+
+
+def generated_sessions(rows, seed=0):
+    """`rows` fresh sessions from generate_data.py (same seed, same data)."""
+    if str(GENERATOR_DIR) not in sys.path:
+        sys.path.insert(0, str(GENERATOR_DIR))
+    import generate_data
+    return generate_data.generate(rows, seed=seed)
+
+
+def timed(func, *args, repeat=1, **kwargs):
+    """Returns (best wall time in seconds, result of the last call)."""
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        best = min(best, time.perf_counter() - start)
+    return best, result
@@ -0,0 +1,194 @@
+"""
+Resolves raw upload headers to the standard column names detection uses.
+
+The mapping is compiled once: exact aliases, plus the same aliases with all
+punctuation squashed out (so 'Session-ID' and 'session.id' match
+'sessionid'), plus extra aliases from an optional JSON config file of the form
+{"standard_name": ["alias", ...]}. Names that still don't match can be fuzzy
+matched against the known aliases. Resolved headers are cached by the raw
+header tuple, so repeated exports with the same layout resolve for free.
+
+COLUMN_MAPPING is the default mapping, and resolve_column_names and
+standardize_columns apply it for the API, the backfill and the training CLI.
+"""
+import difflib
+import json
+import logging
+import os
+import re
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+# JSON file of extra aliases: {"standard_name": ["alias", ...]}
+COLUMN_ALIASES_FILE = os.getenv("COLUMN_ALIASES_FILE")
+# Similarity (0-1) a header needs to be fuzzy matched to a known alias; 0 disables
+COLUMN_FUZZY_CUTOFF = float(os.getenv("COLUMN_FUZZY_CUTOFF", "0.85"))
+# Distinct header layouts kept resolved
+COLUMN_CACHE_SIZE = int(os.getenv("COLUMN_CACHE_SIZE", "256"))
+
+_NOT_ALPHANUMERIC = re.compile(r'[^a-z0-9%]')
+
+
+def normalize(name):
+    """Lower-cases a raw column name and snake_cases its spaces and dots."""
+    return str(name).lower().strip().replace(' ', '_').replace('.', '_')
+
+
+def squash(normalized):
+    """Drops everything but letters, digits and '%' from a normalized name."""
+    return _NOT_ALPHANUMERIC.sub('', normalized)
+
+
+def load_aliases(path):
+    """Reads an aliases config file; returns {} (with a warning) if it can't be used."""
+    try:
+        with open(path, encoding='utf-8') as aliases_file:
+            aliases = json.load(aliases_file)
+        if not isinstance(aliases, dict) or not all(isinstance(names, list) for names in aliases.values()):
+            raise ValueError("expected an object of standard name -> list of aliases")
+        logger.info(f"Loaded column aliases for {sorted(aliases)} from {path}")
+        return aliases
+    except (OSError, ValueError) as e:
+        logger.warning(f"⚠️ Ignoring column aliases file {path}: {e}")
+        return {}
+
+
+class ColumnResolver:
+    """A column mapping compiled for repeated header resolution."""
+
+    def __init__(self, column_mapping, aliases=None, fuzzy_cutoff=COLUMN_FUZZY_CUTOFF, cache_size=COLUMN_CACHE_SIZE):
+        self._exact = dict(column_mapping)
+        for standard, names in (aliases or {}).items():
+            for name in names:
+                self._exact[normalize(name)] = standard
+        self._squashed = {}
+        for alias, standard in self._exact.items():
+            self._squashed.setdefault(squash(alias), standard)
+        self._fuzzy_keys = list(self._squashed)
+        self.fuzzy_cutoff = fuzzy_cutoff
+        self._resolve_header = lru_cache(maxsize=cache_size)(self._resolve_header)
+
+    def _match(self, normalized):
+        """Returns (standard name, how it matched) or (None, None)."""
+        if normalized in self._exact:
+            return self._exact[normalized], 'exact'
+        squashed = squash(normalized)
+        if squashed in self._squashed:
+            return self._squashed[squashed], 'squashed'
+        if self.fuzzy_cutoff > 0 and squashed:
+            close = difflib.get_close_matches(squashed, self._fuzzy_keys, n=1, cutoff=self.fuzzy_cutoff)
+            if close:
+                return self._squashed[close[0]], 'fuzzy'
+        return None, None
+
+    def _resolve_header(self, header):
+        normalized = [normalize(orig) for orig in header]
+        matches = [self._match(name) for name in normalized]
+        # A fuzzy guess never takes a name another column matched for certain
+        certain = {standard for standard, how in matches if how in ('exact', 'squashed')}
+
+        resolved = []
+        mapped_cols = {}
+        for orig, name, (standard, how) in zip(header, normalized, matches):
+            if standard is None or (how == 'fuzzy' and standard in certain):
+                resolved.append(name)
+                continue
+            resolved.append(standard)
+            mapped_cols[orig] = standard if how != 'fuzzy' else f"{standard} (fuzzy)"
+
+        # Logged once per header layout, not once per chunk or upload
+        if mapped_cols:
+            logger.info(f"Standardized columns: {mapped_cols}")
+        return tuple(resolved)
+
+    def resolve(self, columns):
+        """Returns the standardized names for a list of raw column names."""
+        return list(self._resolve_header(tuple(columns)))
+
+    def cache_info(self):
+        return self._resolve_header.cache_info()
+
+
+# --- Default Mapping ---
+# Maps normalized (lower-cased, snake_cased) header names to the standard names.
+COLUMN_MAPPING = {
+    # Session ID variations
+    'sessionid': 'session_id', 'session id': 'session_id', 'session_id': 'session_id',
+    'session_guid': 'session_id',
+
+    # User ID variations
+    'userid': 'user_id', 'user id': 'user_id', 'user_id': 'user_id',
+    'customerid': 'user_id', 'customer id': 'user_id', 'customer_id': 'user_id',
+
+    # Charger ID variations
+    'chargerid': 'charger_id', 'charger id': 'charger_id', 'charger_id': 'charger_id',
+    'chargingstationid': 'charger_id', 'charging station id': 'charger_id', 'charging_station_id': 'charger_id',
+    'stationid': 'charger_id', 'station id': 'charger_id', 'station_id': 'charger_id',
+
+    # Start Time variations
+    'starttime': 'start_time', 'start time': 'start_time', 'start_time': 'start_time',
+    'starttimestamp': 'start_time', 'start timestamp': 'start_time', 'start_timestamp': 'start_time',
+    'timestamp': 'start_time',
+
+    # End Time variations
+    'endtime': 'end_time', 'end time': 'end_time', 'end_time': 'end_time',
+    'endtimestamp': 'end_time', 'end timestamp': 'end_time', 'end_timestamp': 'end_time',
+
+    # Duration variations
+    'duration': 'duration', 'duration(min)': 'duration', 'duration_min': 'duration',
+    'chargingtime': 'duration', 'charging time': 'duration', 'charging_time': 'duration',
+
+    # Energy variations
+    'energy': 'energy_kWh', 'energy(kwh)': 'energy_kWh', 'energy_kwh': 'energy_kWh',
+    'energyconsumed': 'energy_kWh', 'energy consumed': 'energy_kWh', 'energy_consumed': 'energy_kWh',
+    'kwh': 'energy_kWh', 'total kwh': 'energy_kWh', 'total_kwh': 'energy_kWh',
+
+    # Payment/Amount variations
+    'payment': 'amount_INR', 'amount': 'amount_INR', 'amountinr': 'amount_INR',
+    'amount_inr': 'amount_INR', 'cost': 'amount_INR', 'totalcost': 'amount_INR',
+    'total cost': 'amount_INR', 'total_cost': 'amount_INR',
+
+    # IP Address variations
+    'ipaddress': 'ip_address', 'ip address': 'ip_address', 'ip_address': 'ip_address',
+    'sourceip': 'ip_address', 'source ip': 'ip_address', 'source_ip': 'ip_address',
+
+    # CPU Usage variations
+    'cpuusagepercent': 'cpu_usage_percent', 'cpu usage percent': 'cpu_usage_percent', 'cpu_usage_percent': 'cpu_usage_percent',
+    'cpuusage': 'cpu_usage_percent', 'cpu usage': 'cpu_usage_percent', 'cpu_usage': 'cpu_usage_percent',
+    'cpu %': 'cpu_usage_percent', 'cpu%': 'cpu_usage_percent',
+
+    # Packets Per Second variations
+    'packetspersec': 'packets_per_sec', 'packets per sec': 'packets_per_sec', 'packets_per_sec': 'packets_per_sec',
+    'pps': 'packets_per_sec', 'packetrate': 'packets_per_sec', 'packet rate': 'packets_per_sec',
+    'packet_rate': 'packets_per_sec',
+
+    # Geolocation variations
+    'geolocation': 'geo_location', 'geo location': 'geo_location', 'geo_location': 'geo_location',
+    'location': 'geo_location', 'latlon': 'geo_location', 'lat/lon': 'geo_location',
+    'coordinates': 'geo_location'
+}
+
+
+# Compiled once; extra aliases come from COLUMN_ALIASES_FILE
+column_aliases = load_aliases(COLUMN_ALIASES_FILE) if COLUMN_ALIASES_FILE else None
+default_resolver = ColumnResolver(COLUMN_MAPPING, aliases=column_aliases)
+
+
+def resolve_column_names(columns, column_mapping=None):
+    """
+    Returns the standardized names for a list of raw column names. Headers
+    already seen resolve from the resolver's cache.
+    """
+    if column_mapping is None:
+        return default_resolver.resolve(columns)
+    return ColumnResolver(column_mapping).resolve(columns)
+
+
+def standardize_columns(df):
+    """
+    Converts common CSV column name variations to a standard snake_case format
+    required by the anomaly detection logic.
+    """
+    df.columns = resolve_column_names(df.columns)
+    return df
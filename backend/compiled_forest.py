@@ -0,0 +1,220 @@
+"""
+Fast, exact inference for the StandardScaler + IsolationForest pairs.
+
+Compiling a pair:
+1. Fuse the scaler into the trees. A split tests float32((x - mean) / scale)
+   <= threshold; that test is monotone in the raw value x, so it equals
+   x <= t for one raw-space double t, which is found exactly by bisecting
+   over the ordered bit patterns of doubles.
+2. Flatten every tree into contiguous node arrays (feature, fused threshold,
+   children, leaf path length) and walk them, vectorized, once per cell of
+   the grid that each tree's thresholds cut its features into. This leaves
+   one table per tree mapping a cell to the tree's path-length contribution.
+
+Scoring a batch is then a searchsorted per feature against all thresholds
+of the forest, plus a few table lookups per tree. There is no per-row tree
+walk and no scaled copy of the input. Contributions are added tree by tree
+in the same order as sklearn, so score_samples, decision_function and
+predict match the sklearn pair bit for bit.
+"""
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from sklearn.ensemble import IsolationForest
+from sklearn.preprocessing import StandardScaler
+
+logger = logging.getLogger(__name__)
+
+# Largest per-tree cell table; forests with more cells fall back to sklearn
+MAX_CELLS_PER_TREE = int(os.getenv("MAX_CELLS_PER_TREE", str(1 << 20)))
+# Rows scored per block (bounds the temporary arrays)
+SCORING_BLOCK_ROWS = int(os.getenv("SCORING_BLOCK_ROWS", "262144"))
+
+_SIGN = np.uint64(1 << 63)
+
+
+def _ordered(values):
+    """Maps doubles to uint64 keys whose order matches the doubles' order."""
+    bits = values.view(np.uint64)
+    return np.where(bits & _SIGN, ~bits, bits | _SIGN)
+
+
+def _from_ordered(keys):
+    bits = np.where(keys & _SIGN, keys & ~_SIGN, ~keys)
+    return bits.view(np.float64)
+
+
+def _fuse_thresholds(thresholds, mean, scale):
+    """
+    For each split, returns the largest raw double x with
+    float32((x - mean) / scale) <= threshold, matching StandardScaler.transform
+    followed by sklearn's float32 tree input.
+    """
+    def goes_left(x):
+        scaled = x
+        if mean is not None:
+            scaled = scaled - mean
+        if scale is not None:
+            scaled = scaled / scale
+        # Probes beyond float32 range overflow to +-inf, which is what sklearn sees too
+        with np.errstate(over='ignore', invalid='ignore'):
+            return scaled.astype(np.float32) <= thresholds
+
+    lo = _ordered(np.full(len(thresholds), -np.inf))
+    hi = _ordered(np.full(len(thresholds), np.inf))
+    fused = np.full(len(thresholds), np.inf)
+    bounded = ~goes_left(np.full(len(thresholds), np.inf))
+    # Invariant: lo goes left, hi goes right; 64 halvings pin the boundary
+    for _ in range(64):
+        mid = lo + (hi - lo) // np.uint64(2)
+        left = goes_left(_from_ordered(mid))
+        lo = np.where(left, mid, lo)
+        hi = np.where(left, hi, mid)
+    fused[bounded] = _from_ordered(lo)[bounded]
+    return fused
+
+
+def _average_path_length(n_samples):
+    """Same arithmetic as sklearn.ensemble._iforest._average_path_length."""
+    n_samples = np.asarray(n_samples, dtype=np.float64).reshape((1, -1))
+    average_path_length = np.zeros(n_samples.shape)
+    mask_1 = n_samples <= 1
+    mask_2 = n_samples == 2
+    not_mask = ~np.logical_or(mask_1, mask_2)
+    average_path_length[mask_2] = 1.0
+    average_path_length[not_mask] = (
+        2.0 * (np.log(n_samples[not_mask] - 1.0) + np.euler_gamma)
+        - 2.0 * (n_samples[not_mask] - 1.0) / n_samples[not_mask]
+    )
+    return average_path_length.reshape(-1)
+
+
+class CompiledIsolationForest:
+    """A StandardScaler + IsolationForest pair compiled for batch scoring on raw features."""
+
+    def __init__(self, model, scaler, n_jobs=1):
+        if not isinstance(model, IsolationForest) or not isinstance(scaler, StandardScaler):
+            raise TypeError("Only StandardScaler + IsolationForest pairs can be compiled.")
+        self.n_features = model.n_features_in_
+        self.offset = model.offset_
+        self.n_jobs = n_jobs
+        mean = scaler.mean_ if scaler.with_mean else None
+        scale = scaler.scale_ if scaler.with_std else None
+
+        n_trees = len(model.estimators_)
+        self._denominator = n_trees * _average_path_length([model._max_samples])
+
+        # --- Flatten the forest into contiguous node arrays (global node ids) ---
+        trees = [estimator.tree_ for estimator in model.estimators_]
+        offsets = np.concatenate([[0], np.cumsum([tree.node_count for tree in trees])])
+        is_leaf = np.concatenate([tree.children_left == -1 for tree in trees])
+        node_ids = np.arange(offsets[-1])
+        left = np.concatenate([tree.children_left + offset for tree, offset in zip(trees, offsets)])
+        right = np.concatenate([tree.children_right + offset for tree, offset in zip(trees, offsets)])
+        left[is_leaf] = node_ids[is_leaf]
+        right[is_leaf] = node_ids[is_leaf]
+
+        subsample_features = model._max_features != self.n_features
+        feature = np.concatenate([
+            np.asarray(features)[np.maximum(tree.feature, 0)] if subsample_features else np.maximum(tree.feature, 0)
+            for tree, features in zip(trees, model.estimators_features_)
+        ])
+        raw_threshold = np.concatenate([tree.threshold for tree in trees])
+        threshold = np.full(len(feature), np.inf)
+        for f in range(self.n_features):
+            splits = ~is_leaf & (feature == f)
+            threshold[splits] = _fuse_thresholds(
+                raw_threshold[splits],
+                None if mean is None else mean[f],
+                None if scale is None else scale[f],
+            )
+
+        if hasattr(model, "_decision_path_lengths"):
+            depth_per_tree = model._decision_path_lengths
+            avg_per_tree = model._average_path_length_per_tree
+        else:
+            depth_per_tree = [tree.compute_node_depths() for tree in trees]
+            avg_per_tree = [_average_path_length(tree.n_node_samples) for tree in trees]
+        # Per-leaf term sklearn adds for each tree: depth + average path length - 1
+        leaf_value = np.concatenate([(d + a) - 1.0 for d, a in zip(depth_per_tree, avg_per_tree)])
+        max_depth = max(tree.max_depth for tree in trees)
+
+        # --- Global bins: every fused threshold of the forest, per feature ---
+        self._bin_edges = [np.unique(threshold[~is_leaf & (feature == f)]) for f in range(self.n_features)]
+
+        # --- Per-tree cell tables ---
+        self._local_bins = []
+        self._strides = []
+        self._tables = []
+        for t in range(n_trees):
+            nodes = slice(offsets[t], offsets[t + 1])
+            tree_splits = ~is_leaf[nodes]
+            tree_feature = feature[nodes][tree_splits]
+            tree_threshold = threshold[nodes][tree_splits]
+            local_edges = [np.unique(tree_threshold[tree_feature == f]) for f in range(self.n_features)]
+            shape = [len(edges) + 1 for edges in local_edges]
+            if np.prod(shape, dtype=np.float64) > MAX_CELLS_PER_TREE:
+                raise ValueError(f"Tree {t} needs {np.prod(shape, dtype=np.float64):.0f} cells; too many to compile.")
+
+            # Global bin -> this tree's bin, for each feature
+            self._local_bins.append([
+                np.searchsorted(edges, np.append(global_edges, np.inf), side='left').astype(np.int32)
+                for edges, global_edges in zip(local_edges, self._bin_edges)
+            ])
+            self._strides.append(np.cumprod([1] + shape[:0:-1])[::-1].astype(np.int64))
+
+            # One representative raw value per bin: the bin's upper edge (+inf for the last)
+            grid = np.meshgrid(*[np.append(edges, np.inf) for edges in local_edges], indexing='ij')
+            points = np.stack([axis.ravel() for axis in grid], axis=1)
+            node = np.full(len(points), offsets[t], dtype=np.int64)
+            for _ in range(max_depth):
+                goes_left = points[np.arange(len(points)), feature[node]] <= threshold[node]
+                node = np.where(goes_left, left[node], right[node])
+            self._tables.append(leaf_value[node])
+
+        logger.info(f"Compiled IsolationForest: {n_trees} trees, {offsets[-1]} nodes, "
+                    f"{sum(len(table) for table in self._tables)} cells.")
+
+    def _depths(self, X):
+        global_bins = [np.searchsorted(edges, X[:, f], side='left') for f, edges in enumerate(self._bin_edges)]
+        depths = np.zeros(len(X))
+        for local_bins, strides, table in zip(self._local_bins, self._strides, self._tables):
+            cell = local_bins[0][global_bins[0]] * strides[0]
+            for f in range(1, self.n_features):
+                cell += local_bins[f][global_bins[f]] * strides[f]
+            depths += table[cell]
+        return depths
+
+    def score_samples(self, X):
+        """Same values as model.score_samples(scaler.transform(X))."""
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim != 2 or X.shape[1] != self.n_features:
+            raise ValueError(f"Expected {self.n_features} features, got shape {X.shape}.")
+        if not np.isfinite(X).all():
+            raise ValueError("Input X contains NaN or infinity.")
+        blocks = [slice(start, start + SCORING_BLOCK_ROWS) for start in range(0, len(X), SCORING_BLOCK_ROWS)]
+        if self.n_jobs > 1 and len(blocks) > 1:
+            # NumPy releases the GIL in searchsorted/take, so threads overlap
+            with ThreadPoolExecutor(max_workers=self.n_jobs) as pool:
+                parts = list(pool.map(lambda block: self._depths(X[block]), blocks))
+        else:
+            parts = [self._depths(X[block]) for block in blocks]
+        depths = np.concatenate(parts) if parts else np.zeros(0)
+
+        denominator = self._denominator
+        scores = 2 ** (
+            -np.divide(depths, denominator, out=np.ones_like(depths), where=denominator != 0)
+        )
+        return -scores
+
+    def decision_function(self, X):
+        return self.score_samples(X) - self.offset
+
+    def predict(self, X):
+        """+1 for inliers, -1 for anomalies, as IsolationForest.predict."""
+        decision_func = self.decision_function(X)
+        is_inlier = np.ones_like(decision_func, dtype=int)
+        is_inlier[decision_func < 0] = -1
+        return is_inlier
@@ -0,0 +1,129 @@
+"""
+Multi-user conflict detection on plain NumPy arrays.
+
+A session conflicts when it starts before the latest end_time of the same
+user's earlier sessions (a running max, so a short session inside an earlier
+long one is caught, not just overlap with the immediately preceding session).
+Only user_id, start_time and end_time are read; nothing else is copied.
+"""
+import logging
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# int64 value of NaT; every real timestamp compares greater than it
+NAT = np.iinfo(np.int64).min
+
+
+def time_values(series):
+    """Returns a time column as int64 nanoseconds (NaT for unparseable values)."""
+    if not pd.api.types.is_datetime64_any_dtype(series):
+        series = pd.to_datetime(series, errors='coerce')
+    if getattr(series.dt, 'tz', None) is not None:
+        series = series.dt.tz_convert(None)
+    return series.to_numpy(dtype='datetime64[ns]').view(np.int64)
+
+
+def _stable_sort_by_user(codes, order, user_count):
+    """
+    Stably reorders `order` (a permutation in start_time order) by user code.
+    Codes are sorted as 16-bit digits, which NumPy sorts with a linear-time
+    radix sort, instead of a comparison lexsort over (user, start).
+    """
+    if user_count > 2 ** 32:
+        return order[np.argsort(codes[order], kind='stable')]
+    if user_count > 2 ** 16:
+        low_digit = (codes[order] & 0xFFFF).astype(np.uint16)
+        order = order[np.argsort(low_digit, kind='stable')]
+        high_digit = (codes[order] >> 16).astype(np.uint16)
+        return order[np.argsort(high_digit, kind='stable')]
+    return order[np.argsort(codes[order].astype(np.uint16), kind='stable')]
+
+
+def user_time_order(codes, start, user_count):
+    """Returns the permutation that orders rows by user code, then by start_time."""
+    return _stable_sort_by_user(codes, np.argsort(start), user_count)
+
+
+def _flags(user_id, start, end, assume_sorted, initial_end=None):
+    """
+    Core of conflict_flags/ConflictTracker. Returns (flags, codes, uniques,
+    order, sorted_end) where flags is positional over the input rows.
+    `initial_end(uniques)` may return each user's latest end_time from
+    earlier data (NAT when unknown).
+    """
+    n = len(start)
+    flags = np.zeros(n, dtype=bool)
+    codes, uniques = pd.factorize(user_id)
+    rows = np.flatnonzero((codes >= 0) & (start != NAT) & (end != NAT))
+    if len(rows) == 0:
+        return flags, None, uniques, None, None
+
+    codes = codes[rows]
+    if assume_sorted:
+        # Rows already in start_time order: a stable sort by user keeps that order
+        order = _stable_sort_by_user(codes, np.arange(len(rows)), len(uniques))
+    else:
+        order = user_time_order(codes, start[rows], len(uniques))
+    codes = codes[order]
+    start = start[rows][order]
+    end = end[rows][order]
+
+    # Latest end_time among each row's earlier sessions of the same user
+    running_max = pd.Series(end).groupby(codes, sort=False).cummax().to_numpy()
+    previous_max = np.empty_like(running_max)
+    previous_max[1:] = running_max[:-1]
+    group_start = np.ones(len(codes), dtype=bool)
+    group_start[1:] = codes[1:] != codes[:-1]
+    previous_max[group_start] = NAT
+    if initial_end is not None:
+        # Earlier data counts for every row of the user, not only the first
+        previous_max = np.maximum(previous_max, initial_end(uniques)[codes])
+
+    flags[rows[order]] = start < previous_max
+    return flags, codes, uniques, group_start, end
+
+
+def conflict_flags(user_id, start_time, end_time, assume_sorted=False):
+    """
+    Returns a boolean array marking the rows that conflict with an earlier
+    session of the same user. Pass assume_sorted=True when the rows are
+    already ordered by start_time to skip the full sort.
+    """
+    flags, *_ = _flags(
+        np.asarray(user_id), time_values(start_time), time_values(end_time), assume_sorted
+    )
+    return flags
+
+
+class ConflictTracker:
+    """
+    Incremental conflict detection for data arriving in start_time order
+    (a stream, or the chunks of a time-sorted file). Keeps only the latest
+    end_time per user between calls.
+    """
+
+    def __init__(self):
+        self.last_end_time = {}
+
+    def __len__(self):
+        return len(self.last_end_time)
+
+    def update(self, user_id, start_time, end_time, assume_sorted=False):
+        """Returns conflict flags for a batch and folds its end times into the state."""
+        def initial_end(uniques):
+            return np.array([self.last_end_time.get(user, NAT) for user in uniques], dtype=np.int64)
+
+        flags, codes, uniques, group_start, end = _flags(
+            np.asarray(user_id), time_values(start_time), time_values(end_time), assume_sorted, initial_end
+        )
+        if codes is None:
+            return flags
+
+        group_max = np.maximum.reduceat(end, np.flatnonzero(group_start))
+        for user, latest in zip(uniques[codes[group_start]], group_max):
+            if latest > self.last_end_time.get(user, NAT):
+                self.last_end_time[user] = int(latest)
+        return flags
@@ -0,0 +1,113 @@
+import asyncio
+import logging
+import os
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from fastapi.concurrency import run_in_threadpool
+
+from anomaly_detector import score_chunk, combine_chunk_results
+from metrics import metrics, merge_timings, timed_chunks
+
+logger = logging.getLogger(__name__)
+
+# --- Pool Settings ---
+# Worker processes used for detection. 0 runs detection on the default
+# thread pool instead (still off the event loop, but sharing the GIL).
+DETECTION_WORKERS = int(os.getenv("DETECTION_WORKERS", str(os.cpu_count() or 1)))
+# Chunks scored ahead of the combine step; bounds the memory held per upload
+MAX_CHUNKS_IN_FLIGHT = int(os.getenv("MAX_CHUNKS_IN_FLIGHT", str(max(2, 2 * DETECTION_WORKERS))))
+
+executor = None
+
+
+def _init_worker():
+    """Runs once in each worker process so the first chunk doesn't pay the model load."""
+    from anomaly_detector import model_registry
+    model_registry.load_all()
+    logger.info(f"Detection worker {os.getpid()} ready with models loaded.")
+
+
+def start_pool():
+    """Starts the detection process pool (called from the app lifespan)."""
+    global executor
+    if DETECTION_WORKERS > 0:
+        executor = ProcessPoolExecutor(max_workers=DETECTION_WORKERS, initializer=_init_worker)
+        logger.info(f"Started detection pool with {DETECTION_WORKERS} worker processes.")
+    else:
+        logger.info("DETECTION_WORKERS=0, running detection on the thread pool.")
+
+
+def shutdown_pool():
+    """Stops the detection process pool, cancelling queued work."""
+    global executor
+    if executor is not None:
+        executor.shutdown(wait=True, cancel_futures=True)
+        executor = None
+        logger.info("Detection pool shut down.")
+
+
+async def run_detection(func, *args):
+    """Runs a CPU-bound detection function on the pool without blocking the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, func, *args)
+
+
+async def detect_in_chunks(chunks, on_chunk=None, timings=None) -> dict:
+    """
+    Async counterpart of find_anomalies_in_chunks. Chunks are pulled from the
+    (blocking) iterator on the thread pool and scored on the detection pool,
+    with at most MAX_CHUNKS_IN_FLIGHT chunks pending at a time.
+
+    `on_chunk(chunk_result)`, if given, is called on the thread pool as each
+    chunk's score_chunk result arrives (e.g. to report progress).
+
+    Stage timings (reading the chunks plus every detection stage) are
+    recorded in the metrics and returned in the result's "timings"; pass a
+    dict as `timings` to have the caller's own stages included.
+    """
+    timings = {} if timings is None else timings
+    iterator = iter(timed_chunks(chunks, timings, "read_upload"))
+    pending = deque()
+    chunk_results = []
+    offset = 0
+    # Workers spill each chunk's IDs here; the combine step reads back the flagged rows'
+    spill = tempfile.TemporaryDirectory(prefix="ev_ids_")
+    try:
+        while True:
+            chunk = await run_in_threadpool(next, iterator, None)
+            if chunk is None:
+                break
+            pending.append(asyncio.ensure_future(run_detection(score_chunk, chunk, offset, spill.name)))
+            offset += len(chunk)
+            if len(pending) >= MAX_CHUNKS_IN_FLIGHT:
+                chunk_results.append(await pending.popleft())
+                await _report(on_chunk, chunk_results[-1])
+        while pending:
+            chunk_results.append(await pending.popleft())
+            await _report(on_chunk, chunk_results[-1])
+        result = await run_detection(combine_chunk_results, chunk_results)
+    finally:
+        for future in pending:
+            future.cancel()
+        await run_in_threadpool(spill.cleanup)
+
+    result["timings"] = merge_timings(timings, result["timings"])
+    _record(result)
+    return result
+
+
+def _record(result):
+    metrics.observe_stages(result["timings"], rows=result["total_sessions"])
+    metrics.inc("ev_sessions_total", result["total_sessions"])
+    counts = {}
+    for anomaly in result["anomalies"]:
+        counts[anomaly["anomaly_type"]] = counts.get(anomaly["anomaly_type"], 0) + 1
+    for anomaly_type, count in counts.items():
+        metrics.inc("ev_anomalies_total", count, anomaly_type=anomaly_type)
+
+
+async def _report(on_chunk, chunk_result):
+    if on_chunk is not None:
+        await run_in_threadpool(on_chunk, chunk_result)
@@ -0,0 +1,231 @@
+"""
+Sliding time-window DoS features per IP address and per charger.
+
+A flood spread over many sessions from one ip_address, or against one
+charger_id, looks normal row by row. window_flags() sorts a file's sessions
+by key and start_time and, for each session, counts the sessions of the same
+key that started in each trailing DOS_WINDOWS window and sums their
+packets_per_sec. The counts come from searchsorted over the sorted keys and
+the sums from prefix sums, so there is no per-row Python. A session is
+flagged as part of a flood when at least DOS_WINDOW_MIN_SESSIONS sessions
+share its window and either their rate (sessions per minute) or their
+combined packets_per_sec is over the limit. Hits are reported as dos_attack,
+next to the per-row model's.
+
+Rows are processed in partitions of keys of about DOS_WINDOW_PARTITION_ROWS
+rows, which bounds the temporary arrays on files of tens of millions of rows.
+WindowTracker gives the same features for the live stream, keeping the
+recent sessions of each key in a bounded ring buffer.
+"""
+import logging
+import os
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+from conflict_engine import NAT, time_values, user_time_order
+from geo_detection import hash_ids
+
+logger = logging.getLogger(__name__)
+
+# --- Window Settings ---
+# 0 turns windowed DoS detection off
+DOS_WINDOW_DETECTION = os.getenv("DOS_WINDOW_DETECTION", "1") != "0"
+# Trailing window lengths, in minutes
+DOS_WINDOWS = [int(minutes) for minutes in os.getenv("DOS_WINDOWS", "5,60").split(",")]
+# Sessions that must share a window before it can be a flood
+DOS_WINDOW_MIN_SESSIONS = int(os.getenv("DOS_WINDOW_MIN_SESSIONS", "3"))
+# Limits on one key's window: new sessions per minute, and combined packets_per_sec
+DOS_WINDOW_MAX_SESSIONS_PER_MIN = float(os.getenv("DOS_WINDOW_MAX_SESSIONS_PER_MIN", "1"))
+DOS_WINDOW_MAX_PACKETS = float(os.getenv("DOS_WINDOW_MAX_PACKETS", "5000"))
+# Rows per key partition when computing the windows (bounds temporary memory)
+DOS_WINDOW_PARTITION_ROWS = int(os.getenv("DOS_WINDOW_PARTITION_ROWS", "1000000"))
+# Most recent sessions kept per key by the streaming tracker
+DOS_WINDOW_BUFFER = int(os.getenv("DOS_WINDOW_BUFFER", "10000"))
+
+# Window key -> hashed column from geo_detection.geo_columns(), its source column, and its name in details
+WINDOW_KEYS = {'ip': '_ip', 'charger': '_charger'}
+WINDOW_SOURCE_COLUMNS = {'ip': 'ip_address', 'charger': 'charger_id'}
+WINDOW_KEY_NAMES = {'ip': 'IP', 'charger': 'Charger'}
+# Columns of window_flags' result
+WINDOW_RESULT_COLUMNS = ['dos_window', 'window_key', 'window_minutes', 'window_sessions', 'window_packets']
+
+_NS_PER_SECOND = 10 ** 9
+
+
+def _window_counts(key, seconds, packets, windows):
+    """
+    window_counts for rows that all have a key and a start time. Returns the
+    rows' key/time order and the (sessions, packets) per window in that order.
+    """
+    codes, uniques = pd.factorize(key)
+    order = user_time_order(codes, seconds, len(uniques))
+    seconds = seconds[order] - seconds.min()
+    # One ascending value over all keys; the gap between keys is wider than any
+    # window, so no window reaches back into the previous key's sessions
+    stride = int(seconds.max()) + 60 * max(windows) + 1
+    ticks = codes[order].astype(np.int64) * stride + seconds
+    prefix = np.concatenate(([0.0], np.cumsum(packets[order])))
+    upper = np.searchsorted(ticks, ticks, side='right')
+    results = []
+    for minutes in windows:
+        lower = np.searchsorted(ticks, ticks - 60 * minutes, side='right')
+        results.append((upper - lower, prefix[upper] - prefix[lower]))
+    return order, results
+
+
+def window_counts(key, start, packets, windows=DOS_WINDOWS):
+    """
+    For every row, the sessions with the same key (a non-zero uint64 hash)
+    that started in (start - window, start], to the second, and the sum of
+    their packets_per_sec. Returns a (sessions, packets) pair of arrays per
+    window, positional over the rows (0 where the key or start is missing).
+    """
+    n = len(key)
+    results = [(np.zeros(n, dtype=np.int64), np.zeros(n)) for _ in windows]
+    rows = np.flatnonzero((key != 0) & (start != NAT))
+    if len(rows) == 0:
+        return results
+    seconds = start[rows] // _NS_PER_SECOND
+    packets = np.nan_to_num(packets[rows])
+    # Keys never span partitions, so each partition's windows are complete
+    partitions = -(-len(rows) // DOS_WINDOW_PARTITION_ROWS)
+    part = key[rows] % np.uint64(partitions) if partitions > 1 else np.zeros(len(rows), dtype=np.uint64)
+    for p in range(partitions):
+        members = np.flatnonzero(part == p) if partitions > 1 else np.arange(len(rows))
+        if len(members) == 0:
+            continue
+        order, counts = _window_counts(key[rows[members]], seconds[members], packets[members], windows)
+        target = rows[members[order]]
+        for (sessions, summed), (part_sessions, part_summed) in zip(results, counts):
+            sessions[target] = part_sessions
+            summed[target] = part_summed
+    return results
+
+
+def _empty_result(n):
+    return {
+        'dos_window': np.zeros(n, dtype=bool), 'window_key': np.full(n, '', dtype=object),
+        'window_minutes': np.zeros(n, dtype=np.int64), 'window_sessions': np.zeros(n, dtype=np.int64),
+        'window_packets': np.zeros(n),
+    }
+
+
+def _flag(result, kind, counts, rows=slice(None)):
+    """Flags the rows whose windows are floods; the first window and key to trip are reported."""
+    for minutes, (sessions, packets) in zip(DOS_WINDOWS, counts):
+        sessions, packets = sessions[rows], packets[rows]
+        hit = (sessions >= DOS_WINDOW_MIN_SESSIONS) & (
+            (sessions / minutes > DOS_WINDOW_MAX_SESSIONS_PER_MIN) | (packets > DOS_WINDOW_MAX_PACKETS)
+        ) & ~result['dos_window']
+        if hit.any():
+            result['dos_window'] |= hit
+            result['window_key'][hit] = WINDOW_KEY_NAMES[kind]
+            result['window_minutes'][hit] = minutes
+            result['window_sessions'][hit] = sessions[hit]
+            result['window_packets'][hit] = packets[hit]
+
+
+def window_columns(df):
+    """The start_time, hashed key and _pps columns window_flags uses, from a standardized frame."""
+    frame = df[['start_time']].copy()
+    for kind, source in WINDOW_SOURCE_COLUMNS.items():
+        if source in df.columns:
+            frame[WINDOW_KEYS[kind]] = hash_ids(df[source])
+    if 'packets_per_sec' in df.columns:
+        frame['_pps'] = pd.to_numeric(df['packets_per_sec'], errors='coerce').astype(np.float64)
+    return frame
+
+
+def _packets(df):
+    if '_pps' in df.columns:
+        return df['_pps'].to_numpy(np.float64)
+    return np.zeros(len(df))
+
+
+def window_flags(df, keys=WINDOW_KEYS):
+    """
+    Runs the windowed DoS check over a frame with start_time, _pps
+    (packets_per_sec) and any of the hashed key columns. Returns a DataFrame
+    aligned to df with the WINDOW_RESULT_COLUMNS: whether the session is part
+    of a flood, and for flagged sessions the key ('IP' or 'Charger'), the
+    window in minutes, and the sessions and combined packets_per_sec in it.
+    """
+    result = _empty_result(len(df))
+    start = time_values(df['start_time'])
+    packets = _packets(df)
+    for kind, column in WINDOW_KEYS.items():
+        if kind in keys and column in df.columns:
+            _flag(result, kind, window_counts(df[column].to_numpy(np.uint64), start, packets))
+    return pd.DataFrame(result, index=df.index)
+
+
+class WindowTracker:
+    """
+    Windowed DoS detection for data arriving in start_time order (the live
+    stream). Each key's sessions from the last max(DOS_WINDOWS) minutes are
+    kept in a ring buffer of at most DOS_WINDOW_BUFFER sessions; a batch is
+    checked together with the buffered sessions of its keys.
+    """
+
+    def __init__(self, capacity=DOS_WINDOW_BUFFER):
+        self.capacity = capacity
+        self.recent = {kind: {} for kind in WINDOW_KEYS}
+        self._horizon = 60 * max(DOS_WINDOWS) * _NS_PER_SECOND
+        self._latest = NAT
+        self._next_sweep = NAT
+
+    def __len__(self):
+        return sum(len(buffers) for buffers in self.recent.values())
+
+    def update(self, df):
+        """Returns window_flags for a standardized batch and buffers its sessions."""
+        frame = window_columns(df)
+        result = _empty_result(len(frame))
+        start = time_values(frame['start_time'])
+        packets = _packets(frame)
+        for kind, column in WINDOW_KEYS.items():
+            if column not in frame.columns:
+                continue
+            key = frame[column].to_numpy(np.uint64)
+            buffers = self.recent[kind]
+            history = [(k, s, p) for k in np.unique(key[key != 0]).tolist() for s, p in buffers.get(k, ())]
+            if history:
+                old_key, old_start, old_packets = (
+                    np.array(values, dtype=dtype) for values, dtype in zip(zip(*history), (np.uint64, np.int64, np.float64))
+                )
+                counts = window_counts(
+                    np.concatenate([old_key, key]), np.concatenate([old_start, start]), np.concatenate([old_packets, packets]),
+                )
+                _flag(result, kind, counts, rows=slice(len(history), None))
+            else:
+                _flag(result, kind, window_counts(key, start, packets))
+            self._buffer(buffers, key, start, packets)
+        self._sweep(start)
+        return pd.DataFrame(result, index=frame.index)
+
+    def _buffer(self, buffers, key, start, packets):
+        for k, s, p in zip(key.tolist(), start.tolist(), packets.tolist()):
+            if k == 0 or s == NAT:
+                continue
+            buffer = buffers.get(k)
+            if buffer is None:
+                buffer = buffers[k] = deque(maxlen=self.capacity)
+            buffer.append((s, p))
+            while buffer[0][0] <= s - self._horizon:
+                buffer.popleft()
+
+    def _sweep(self, start):
+        """Drops keys with no session in the last window, at most once per window of stream time."""
+        valid = start[start != NAT]
+        if len(valid) == 0:
+            return
+        self._latest = max(self._latest, int(valid.max()))
+        if self._latest < self._next_sweep:
+            return
+        cutoff = self._latest - self._horizon
+        for buffers in self.recent.values():
+            for k in [k for k, buffer in buffers.items() if buffer[-1][0] <= cutoff]:
+                del buffers[k]
+        self._next_sweep = self._latest + self._horizon
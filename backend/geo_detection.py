@@ -0,0 +1,283 @@
+"""
+Impossible-travel and IP/charger fan-out detection on plain NumPy arrays.
+
+geo_columns() turns a chunk's geo_location ("lat,lon" text) into float
+latitude/longitude arrays, parsed once for the whole chunk, and hashes
+ip_address and charger_id to uint64, so a file's worth of sessions is kept
+as a few flat columns. geo_flags() then runs both checks over the sessions
+sorted by user and start_time, with no per-row Python:
+
+- impossible_travel: the great-circle (haversine) distance from the user's
+  previous session, over the time between that session's end and this
+  one's start, is faster than TRAVEL_MAX_KMH.
+- ip_charger_fanout: in one FANOUT_WINDOW_MINUTES window, the user's
+  sessions came from more than FANOUT_MAX_IPS distinct IP addresses or
+  more than FANOUT_MAX_CHARGERS distinct chargers.
+"""
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:  # Parsing falls back to Python's float()
+    pa = None
+
+from conflict_engine import NAT, time_values, user_time_order
+
+logger = logging.getLogger(__name__)
+
+# --- Geo Detection Settings ---
+# 0 turns both checks off (uploads then skip reading the columns they use)
+GEO_DETECTION = os.getenv("GEO_DETECTION", "1") != "0"
+# Moving faster than an airliner between two sessions is impossible travel
+TRAVEL_MAX_KMH = float(os.getenv("TRAVEL_MAX_KMH", "900"))
+# Shorter hops are never flagged (location noise, neighbouring stations)
+TRAVEL_MIN_KM = float(os.getenv("TRAVEL_MIN_KM", "100"))
+# Gaps shorter than this, including overlapping sessions, count as this long
+TRAVEL_MIN_GAP_MINUTES = float(os.getenv("TRAVEL_MIN_GAP_MINUTES", "1"))
+# Fan-out windows (aligned to the epoch) and the most distinct IPs/chargers allowed in one
+FANOUT_WINDOW_MINUTES = int(os.getenv("FANOUT_WINDOW_MINUTES", "60"))
+FANOUT_MAX_IPS = int(os.getenv("FANOUT_MAX_IPS", "5"))
+FANOUT_MAX_CHARGERS = int(os.getenv("FANOUT_MAX_CHARGERS", "5"))
+
+# Standard columns the checks read from uploads
+GEO_SOURCE_COLUMNS = ['ip_address', 'geo_location', 'charger_id']
+# Columns geo_columns() makes from them: degrees, and uint64 hashes (0 when missing)
+GEO_COLUMNS = ['_lat', '_lon', '_ip', '_charger']
+# Check names, as they appear in anomaly_type
+GEO_CHECKS = ['impossible_travel', 'ip_charger_fanout']
+
+EARTH_RADIUS_KM = 6371.0088
+_NS_PER_MINUTE = 60 * 10 ** 9
+
+
+# --- Parsing ---
+def _parse_one(text):
+    try:
+        lat, lon = text.split(',')
+        return float(lat), float(lon)
+    except (AttributeError, ValueError):
+        return np.nan, np.nan
+
+
+def _parse_texts(texts):
+    """Parses a list of "lat,lon" strings into an (n, 2) float array."""
+    if not texts:
+        return np.empty((0, 2))
+    joined = '\n'.join(texts)
+    buffer = np.frombuffer(joined.encode('utf-8', 'replace'), dtype=np.uint8)
+    newlines = np.flatnonzero(buffer == ord('\n'))
+    commas = np.flatnonzero(buffer == ord(','))
+    if len(newlines) == len(texts) - 1 and len(commas) == len(texts):
+        # Exactly one comma per value: every comma lies between two consecutive newlines
+        if (commas[1:] > newlines).all() and (commas[:-1] < newlines).all():
+            try:
+                return np.array(joined.replace(',', '\n').split('\n'), dtype=np.float64).reshape(-1, 2)
+            except ValueError:
+                pass
+    # Malformed values somewhere: halve until they are found, then parse those one by one
+    if len(texts) > 64:
+        middle = len(texts) // 2
+        return np.concatenate([_parse_texts(texts[:middle]), _parse_texts(texts[middle:])])
+    return np.array([_parse_one(text) for text in texts], dtype=np.float64).reshape(-1, 2)
+
+
+def _parse_arrow(texts):
+    """pyarrow's split and cast of an object array of "lat,lon" strings; None unless all are well-formed."""
+    try:
+        parts = pc.split_pattern(pa.array(texts, type=pa.string()), ',')
+        if not pc.all(pc.equal(pc.list_value_length(parts), 2)).as_py():
+            return None
+        return pc.cast(pc.list_flatten(parts), pa.float64()).to_numpy().reshape(-1, 2)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return None
+
+
+def parse_lat_lon(values):
+    """
+    Parses "lat,lon" values into (latitude, longitude) float64 arrays, NaN
+    where a value is missing, malformed or out of range. Well-formed text is
+    converted in one call for all values (pyarrow's when it is installed).
+    """
+    values = values.to_numpy(dtype=object) if isinstance(values, pd.Series) else np.asarray(values, dtype=object)
+    latlon = np.full((len(values), 2), np.nan)
+    present = np.flatnonzero(pd.notna(values))
+    if len(present):
+        texts = values[present]
+        parsed = _parse_arrow(texts) if pa is not None else None
+        if parsed is None:
+            try:
+                parsed = _parse_texts(texts.tolist())
+            except TypeError:  # Not all text (e.g. numbers in an object column)
+                parsed = _parse_texts(texts.astype(str).tolist())
+        latlon[present] = parsed
+    lat, lon = latlon[:, 0], latlon[:, 1]
+    invalid = ~((np.abs(lat) <= 90) & (np.abs(lon) <= 180))
+    lat[invalid] = np.nan
+    lon[invalid] = np.nan
+    return np.ascontiguousarray(lat), np.ascontiguousarray(lon)
+
+
+def hash_ids(series):
+    """uint64 hashes of an ID column (0 where missing); 12 and 12.0 hash alike."""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        # Hash each category once
+        codes = series.cat.codes.to_numpy()
+        hashes = hash_ids(pd.Series(series.cat.categories))[codes]
+        hashes[codes < 0] = 0
+        return hashes
+    if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+        values = series.to_numpy(dtype=np.float64)
+    else:
+        values = series.to_numpy(dtype=object)
+    # IDs are mostly distinct, so hashing them directly beats factorizing first
+    hashes = pd.util.hash_array(values, categorize=False)
+    hashes[hashes == 0] = 1  # The hash of 0 is 0, which marks missing IDs
+    hashes[pd.isna(values)] = 0
+    return hashes
+
+
+def geo_columns(df, locations=True):
+    """
+    Returns the GEO_COLUMNS for whichever GEO_SOURCE_COLUMNS df has, or None
+    if it has none. locations=False hashes the IDs only, skipping the parse.
+    """
+    columns = {}
+    if locations and 'geo_location' in df.columns:
+        columns['_lat'], columns['_lon'] = parse_lat_lon(df['geo_location'])
+    if 'ip_address' in df.columns:
+        columns['_ip'] = hash_ids(df['ip_address'])
+    if 'charger_id' in df.columns:
+        columns['_charger'] = hash_ids(df['charger_id'])
+    return pd.DataFrame(columns, index=df.index) if columns else None
+
+
+# --- Checks ---
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance in km between arrays of points given in degrees."""
+    lat1, lon1, lat2, lon2 = (np.radians(values) for values in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def _travel(result, order, codes, uniques, start, end, lat, lon, last_session):
+    """Fills the travel columns of `result` (positional) from rows sorted by user and start_time."""
+    order = order[np.isfinite(lat[order])]
+    if len(order) == 0:
+        return
+    codes, start, end, lat, lon = codes[order], start[order], end[order], lat[order], lon[order]
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = codes[1:] != codes[:-1]
+
+    # Each session's previous one: the row before it, or the user's last known session
+    prev_end, prev_lat, prev_lon = np.roll(end, 1), np.roll(lat, 1), np.roll(lon, 1)
+    has_previous = ~first
+    if last_session:
+        known = [last_session.get(user, (NAT, np.nan, np.nan)) for user in uniques[codes[first]]]
+        prev_end[first] = [session[0] for session in known]
+        prev_lat[first] = [session[1] for session in known]
+        prev_lon[first] = [session[2] for session in known]
+        has_previous[first] = prev_end[first] != NAT
+    if last_session is not None:
+        last = np.flatnonzero(np.append(first[1:], True))
+        for user, row in zip(uniques[codes[last]], last):
+            last_session[user] = (int(end[row]), float(lat[row]), float(lon[row]))
+
+    km = haversine_km(prev_lat, prev_lon, lat, lon)
+    minutes = (start - prev_end) / _NS_PER_MINUTE
+    kmh = km / (np.maximum(minutes, TRAVEL_MIN_GAP_MINUTES) / 60)
+    flagged = has_previous & (km >= TRAVEL_MIN_KM) & (kmh > TRAVEL_MAX_KMH)
+    # Figures are kept for the flagged sessions only, which is all the details need
+    rows = order[flagged]
+    result['impossible_travel'][rows] = True
+    result['travel_km'][rows] = km[flagged]
+    result['travel_minutes'][rows] = minutes[flagged]
+    result['travel_kmh'][rows] = kmh[flagged]
+
+
+def _distinct_per_window(order, codes, window, ids):
+    """Distinct non-zero ids in each row's (user, window), for the rows in `order` (0 elsewhere)."""
+    counts = np.zeros(len(ids), dtype=np.int64)
+    order = order[ids[order] != 0]
+    if len(order) == 0:
+        return counts
+    # Rows are sorted by user then start_time, so each (user, window) is a contiguous run
+    codes, window, ids = codes[order], window[order], ids[order]
+    new_group = np.ones(len(order), dtype=bool)
+    new_group[1:] = (codes[1:] != codes[:-1]) | (window[1:] != window[:-1])
+    group = np.cumsum(new_group) - 1
+    # Mix the run into the id hash, so an id repeated within a run is a duplicate key
+    keys = ids ^ (group.astype(np.uint64) * np.uint64(0x9E3779B97F4A7C15))
+    first_seen = ~pd.Series(keys).duplicated().to_numpy()
+    counts[order] = np.bincount(group[first_seen], minlength=group[-1] + 1)[group]
+    return counts
+
+
+def _fanout(result, order, codes, start, ip, charger):
+    window = start // (FANOUT_WINDOW_MINUTES * _NS_PER_MINUTE)
+    flagged = np.zeros(len(start), dtype=bool)
+    if ip is not None:
+        result['fanout_ips'] = _distinct_per_window(order, codes, window, ip)
+        flagged |= result['fanout_ips'] > FANOUT_MAX_IPS
+    if charger is not None:
+        result['fanout_chargers'] = _distinct_per_window(order, codes, window, charger)
+        flagged |= result['fanout_chargers'] > FANOUT_MAX_CHARGERS
+    result['ip_charger_fanout'] = flagged
+
+
+def geo_flags(df, checks=GEO_CHECKS, last_session=None):
+    """
+    Runs the geo checks over a frame with user_id, start_time, end_time and
+    any of the GEO_COLUMNS. Returns a DataFrame aligned to df with a boolean
+    column per check and the figures behind it: travel_km, travel_minutes
+    and travel_kmh from the previous session (for flagged sessions), fanout_ips and fanout_chargers
+    in the session's window.
+
+    `last_session` (user -> (end_time ns, lat, lon)) supplies each user's
+    session before this data for the travel check, and is updated with the
+    last session of every user seen.
+    """
+    n = len(df)
+    result = {
+        'impossible_travel': np.zeros(n, dtype=bool), 'ip_charger_fanout': np.zeros(n, dtype=bool),
+        'travel_km': np.full(n, np.nan), 'travel_minutes': np.full(n, np.nan), 'travel_kmh': np.full(n, np.nan),
+        'fanout_ips': np.zeros(n, dtype=np.int64), 'fanout_chargers': np.zeros(n, dtype=np.int64),
+    }
+    codes, uniques = pd.factorize(df['user_id'])
+    start, end = time_values(df['start_time']), time_values(df['end_time'])
+    rows = np.flatnonzero((codes >= 0) & (start != NAT) & (end != NAT))
+    if len(rows):
+        order = rows[user_time_order(codes[rows], start[rows], len(uniques))]
+        if 'impossible_travel' in checks and '_lat' in df.columns and '_lon' in df.columns:
+            _travel(result, order, codes, uniques, start, end,
+                    df['_lat'].to_numpy(np.float64), df['_lon'].to_numpy(np.float64), last_session)
+        if 'ip_charger_fanout' in checks and ('_ip' in df.columns or '_charger' in df.columns):
+            ip, charger = (df[column].to_numpy(np.uint64) if column in df.columns else None for column in ('_ip', '_charger'))
+            _fanout(result, order, codes, start, ip, charger)
+    return pd.DataFrame(result, index=df.index)
+
+
+class GeoTracker:
+    """
+    Impossible-travel detection for data arriving in start_time order (the
+    live stream). Keeps each user's last session end and location between
+    calls. Fan-out needs whole windows of sessions, so it isn't run here.
+    """
+
+    def __init__(self):
+        self.last_session = {}
+
+    def __len__(self):
+        return len(self.last_session)
+
+    def update(self, df):
+        """Returns geo_flags for a standardized batch and folds its sessions into the state."""
+        geo = geo_columns(df)
+        frame = df[['user_id', 'start_time', 'end_time']]
+        if geo is not None:
+            frame = frame.join(geo)
+        return geo_flags(frame, checks=['impossible_travel'], last_session=self.last_session)
@@ -0,0 +1,243 @@
+import asyncio
+import logging
+import os
+import shutil
+import tempfile
+import uuid
+from collections import deque
+from contextlib import nullcontext
+from datetime import datetime
+from threading import Lock
+
+import pymongo
+from pymongo import UpdateOne
+from fastapi.concurrency import run_in_threadpool
+
+from anomaly_stats import update_rollups
+from anomaly_store import ensure_retention_index, upsert_anomalies
+from detection_pool import detect_in_chunks
+from upload_formats import upload_suffix
+
+logger = logging.getLogger(__name__)
+
+# --- Job Settings ---
+# Anomalies returned per page by GET /jobs/{id}/anomalies
+JOB_PAGE_SIZE = int(os.getenv("JOB_PAGE_SIZE", "1000"))
+# Anomalies per bulk upsert when a finished job is saved to Mongo
+JOB_INSERT_BATCH_SIZE = int(os.getenv("JOB_INSERT_BATCH_SIZE", "5000"))
+# Finished jobs (and their anomalies) InMemoryJobStore keeps; older ones are evicted
+MAX_FINISHED_JOBS = int(os.getenv("MAX_FINISHED_JOBS", "100"))
+# Days MongoJobStore keeps a job and its job_anomalies records; 0 keeps them forever
+JOB_RETENTION_DAYS = int(os.getenv("JOB_RETENTION_DAYS", "7"))
+
+FINISHED_STATUSES = ("completed", "failed")
+
+
+def new_job(filename):
+    """Returns the initial state document of a submitted job."""
+    return {
+        "job_id": uuid.uuid4().hex,
+        "filename": filename,
+        "status": "queued",
+        "rows_processed": 0,
+        "anomalies_so_far": 0,
+        "total_sessions": None,
+        "anomalies_found": None,
+        "info": [],
+        "error": None,
+        "created_at": datetime.now(),
+        "finished_at": None,
+    }
+
+
+# --- Job Stores ---
+class InMemoryJobStore:
+    """
+    Keeps jobs and their anomalies in process memory (tests, or no MongoDB).
+    Only the max_finished most recently finished jobs are kept; GET on an
+    evicted job answers 404 like an unknown one.
+    """
+
+    def __init__(self, max_finished=MAX_FINISHED_JOBS):
+        self._jobs = {}
+        self._anomalies = {}
+        self._finished = deque()
+        self.max_finished = max_finished
+        self._lock = Lock()
+
+    def create(self, job):
+        with self._lock:
+            self._jobs[job["job_id"]] = dict(job)
+            self._anomalies[job["job_id"]] = []
+
+    def update(self, job_id, **fields):
+        with self._lock:
+            job = self._jobs[job_id]
+            finishing = fields.get("status") in FINISHED_STATUSES and job["status"] not in FINISHED_STATUSES
+            job.update(fields)
+            if finishing:
+                self._finished.append(job_id)
+                while len(self._finished) > self.max_finished:
+                    evicted = self._finished.popleft()
+                    self._jobs.pop(evicted, None)
+                    self._anomalies.pop(evicted, None)
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def add_anomalies(self, job_id, anomalies):
+        with self._lock:
+            self._anomalies[job_id].extend(anomalies)
+
+    def page_anomalies(self, job_id, cursor, limit):
+        """Returns (anomalies, next_cursor); the cursor is a position in the job's results."""
+        with self._lock:
+            results = self._anomalies.get(job_id, [])
+            page = results[cursor:cursor + limit]
+            next_cursor = cursor + len(page) if cursor + len(page) < len(results) else None
+            return [dict(anomaly) for anomaly in page], next_cursor
+
+
+class MongoJobStore:
+    """
+    Keeps job state in the 'jobs' collection. A job's results are stored in
+    the shared 'anomalies' collection like any upload's, so resubmitting an
+    export stores (and counts towards the /stats/ rollups) only anomalies
+    that weren't stored before. Which anomalies a job found is recorded
+    separately in 'job_anomalies', by job_id and a per-job sequence number
+    (job_seq) that the page cursor points at; saving a job's results again
+    (a retry) records each of them once. Jobs and their job_anomalies
+    records expire JOB_RETENTION_DAYS after they were written (TTL indexes).
+    """
+
+    def __init__(self, db):
+        self.jobs = db["jobs"]
+        self.anomalies = db["anomalies"]
+        self.job_anomalies = db["job_anomalies"]
+        self.jobs.create_index("job_id", unique=True)
+        self.job_anomalies.create_index([("job_id", pymongo.ASCENDING), ("job_seq", pymongo.ASCENDING)], unique=True)
+        # Jobs and their per-job records expire; the anomalies themselves stay in 'anomalies'
+        ensure_retention_index(self.jobs, JOB_RETENTION_DAYS, field="created_at")
+        ensure_retention_index(self.job_anomalies, JOB_RETENTION_DAYS)
+
+    def create(self, job):
+        self.jobs.insert_one(dict(job))
+
+    def update(self, job_id, **fields):
+        self.jobs.update_one({"job_id": job_id}, {"$set": fields})
+
+    def get(self, job_id):
+        return self.jobs.find_one({"job_id": job_id}, {"_id": 0})
+
+    def add_anomalies(self, job_id, anomalies):
+        detection_timestamp = datetime.now()
+        for start in range(0, len(anomalies), JOB_INSERT_BATCH_SIZE):
+            batch = [
+                {**anomaly, "detection_timestamp": detection_timestamp}
+                for anomaly in anomalies[start:start + JOB_INSERT_BATCH_SIZE]
+            ]
+            self.job_anomalies.bulk_write([
+                UpdateOne({"job_id": job_id, "job_seq": start + i},
+                          {"$setOnInsert": {**anomaly, "job_id": job_id, "job_seq": start + i}}, upsert=True)
+                for i, anomaly in enumerate(batch)
+            ], ordered=False)
+            inserted = upsert_anomalies(self.anomalies, batch)
+            try:
+                update_rollups(self.anomalies, inserted)
+            except pymongo.errors.PyMongoError as e:
+                # The results are saved; only the dashboard stats are behind
+                logger.error(f"Failed to update stats rollups for job {job_id}: {e}")
+
+    def page_anomalies(self, job_id, cursor, limit):
+        """Returns (anomalies, next_cursor); the cursor is the job_seq of the next anomaly."""
+        query = {"job_id": job_id}
+        if cursor:
+            query["job_seq"] = {"$gte": cursor}
+        page = list(
+            self.job_anomalies.find(query, {"_id": 0})
+            .sort("job_seq", pymongo.ASCENDING)
+            .limit(limit + 1)
+        )
+        next_cursor = page[limit]["job_seq"] if len(page) > limit else None
+        return page[:limit], next_cursor
+
+
+# --- Job Runner ---
+# Keeps running job tasks referenced so they are not garbage collected
+_running_jobs = set()
+
+
+async def spool_upload(upload_file):
+    """Copies an upload to a temp file (with the upload's suffix) that outlives the request; returns its path."""
+    suffix = upload_suffix(upload_file.filename) or ""
+
+    def copy():
+        with tempfile.NamedTemporaryFile(prefix="ev_job_", suffix=suffix, delete=False) as spooled:
+            shutil.copyfileobj(upload_file.file, spooled)
+            return spooled.name
+    return await run_in_threadpool(copy)
+
+
+async def submit_job(store, filename, path, read_chunks, admission=None):
+    """
+    Registers a job for a spooled upload and starts it in the background.
+    `read_chunks(path)` must return an iterator of standardized DataFrame chunks.
+    With an AdmissionController, the job stays queued until a detection slot
+    is free, and admission.Saturated is raised (the upload deleted) when the
+    job queue is already full.
+    """
+    if admission is not None:
+        try:
+            admission.reserve_job()
+        except Exception:
+            os.unlink(path)
+            raise
+    job = new_job(filename)
+    try:
+        await run_in_threadpool(store.create, job)
+    except Exception:
+        if admission is not None:
+            admission.release_job()
+        os.unlink(path)
+        raise
+    task = asyncio.create_task(_run_job(store, job["job_id"], path, read_chunks, admission))
+    _running_jobs.add(task)
+    task.add_done_callback(_running_jobs.discard)
+    return job
+
+
+async def _run_job(store, job_id, path, read_chunks, admission=None):
+    """Scores a spooled upload chunk by chunk, recording progress in the store."""
+    progress = {"rows_processed": 0, "anomalies_so_far": 0}
+
+    def on_chunk(chunk_result):
+        progress["rows_processed"] += chunk_result["rows"]
+        if chunk_result["flagged_frame"] is not None:
+            progress["anomalies_so_far"] += len(chunk_result["flagged_frame"])
+        store.update(job_id, **progress)
+
+    try:
+        async with admission.slot("job", reserved=True) if admission is not None else nullcontext():
+            await run_in_threadpool(store.update, job_id, status="running")
+            result = await detect_in_chunks(read_chunks(path), on_chunk=on_chunk)
+        anomalies = result["anomalies"]
+        await run_in_threadpool(store.add_anomalies, job_id, anomalies)
+        await run_in_threadpool(
+            store.update, job_id,
+            status="completed",
+            rows_processed=result["total_sessions"],
+            anomalies_so_far=len(anomalies),
+            total_sessions=result["total_sessions"],
+            anomalies_found=len(anomalies),
+            info=result["info"],
+            timings=result["timings"],
+            finished_at=datetime.now(),
+        )
+        logger.info(f"Job {job_id} finished: {len(anomalies)} anomalies in {result['total_sessions']} sessions.")
+    except Exception as e:
+        logger.error(f"Job {job_id} failed: {e}", exc_info=True)
+        await run_in_threadpool(store.update, job_id, status="failed", error=str(e), finished_at=datetime.now())
+    finally:
+        os.unlink(path)
@@ -0,0 +1,119 @@
+"""
+Pre-encoded JSON responses.
+
+Payloads are serialized once, straight to bytes: ObjectIds, datetimes and
+NumPy scalars are handled by a `default` hook instead of a recursive
+jsonable_encoder pass. orjson is used when it is installed, json otherwise.
+The bytes are compressed with br or gzip when the client's Accept-Encoding
+allows it; streamed responses are compressed incrementally.
+"""
+import json
+import os
+import zlib
+from datetime import date, datetime
+
+import numpy as np
+from bson import ObjectId
+from fastapi import Response
+from fastapi.responses import StreamingResponse
+
+try:
+    import orjson
+except ImportError:  # Falls back to the standard library
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # br is only offered when brotli is installed
+    brotli = None
+
+# Bodies smaller than this are sent uncompressed
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "5"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))
+
+SUPPORTED_ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def json_default(obj):
+    """Encodes the BSON, datetime and NumPy values JSON doesn't know."""
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(obj):
+    """Serializes obj to compact UTF-8 JSON bytes."""
+    if orjson is not None:
+        return orjson.dumps(obj, default=json_default, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(obj, default=json_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def choose_encoding(accept_encoding):
+    """Picks br or gzip from an Accept-Encoding header (honouring q=0), or None."""
+    accepted = {}
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            accepted[name.lower()] = quality
+    for encoding in SUPPORTED_ENCODINGS:
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+
+def compress(body, encoding):
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return zlib.compress(body, GZIP_LEVEL, wbits=31)  # wbits=31 writes a gzip container
+
+
+def encoded_response(request, body, media_type="application/json", status_code=200):
+    """Returns pre-encoded bytes, compressed if the client accepts it and it's worth it."""
+    headers = {"Vary": "Accept-Encoding"}
+    encoding = choose_encoding(request.headers.get("accept-encoding")) if len(body) >= COMPRESS_MIN_BYTES else None
+    if encoding is not None:
+        body = compress(body, encoding)
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, status_code=status_code, media_type=media_type, headers=headers)
+
+
+def json_response(request, content, status_code=200):
+    """Serializes content once and returns it as a (possibly compressed) JSON response."""
+    return encoded_response(request, dumps(content), status_code=status_code)
+
+
+def _compressed_stream(chunks, encoding):
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        compress_chunk, finish = compressor.process, compressor.finish
+    else:
+        compressor = zlib.compressobj(GZIP_LEVEL, wbits=31)
+        compress_chunk, finish = compressor.compress, compressor.flush
+    for chunk in chunks:
+        data = compress_chunk(chunk)
+        if data:
+            yield data
+    yield finish()
+
+
+def streaming_response(request, chunks, media_type="application/json"):
+    """Streams byte chunks, compressing them on the fly if the client accepts it."""
+    headers = {"Vary": "Accept-Encoding"}
+    encoding = choose_encoding(request.headers.get("accept-encoding"))
+    if encoding is not None:
+        chunks = _compressed_stream(chunks, encoding)
+        headers["Content-Encoding"] = encoding
+    return StreamingResponse(chunks, media_type=media_type, headers=headers)
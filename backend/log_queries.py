@@ -0,0 +1,128 @@
+import base64
+import logging
+import os
+from datetime import datetime
+
+import pymongo
+from bson import ObjectId
+
+from anomaly_detector import anomaly_type_labels
+from json_responses import dumps
+
+logger = logging.getLogger(__name__)
+
+# Sort order of /logs/: newest first, _id breaks ties within one upload
+LOGS_SORT = [("detection_timestamp", pymongo.DESCENDING), ("_id", pymongo.DESCENDING)]
+
+# Bytes of serialized anomalies collected before each write to the client
+LOGS_STREAM_BLOCK_BYTES = int(os.getenv("LOGS_STREAM_BLOCK_BYTES", "65536"))
+
+# Indexes backing the /logs/ sort and filters, created at startup
+LOGS_INDEXES = [
+    LOGS_SORT,
+    [("anomaly_type", pymongo.ASCENDING)] + LOGS_SORT,
+    [("session_id", pymongo.ASCENDING)] + LOGS_SORT,
+    [("user_id", pymongo.ASCENDING)] + LOGS_SORT,
+]
+
+
+def ensure_log_indexes(collection):
+    """Creates the indexes used by /logs/ (no-op for ones that already exist)."""
+    for keys in LOGS_INDEXES:
+        collection.create_index(keys)
+    logger.info(f"Ensured {len(LOGS_INDEXES)} indexes on '{collection.name}'.")
+
+
+# --- Cursors ---
+def encode_cursor(doc):
+    """Encodes the sort key of the last returned anomaly as an opaque cursor."""
+    key = f"{doc['detection_timestamp'].isoformat()}|{doc['_id']}"
+    return base64.urlsafe_b64encode(key.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor; raises ValueError for a malformed cursor."""
+    try:
+        timestamp, object_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(timestamp), ObjectId(object_id)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def build_logs_query(cursor=None, anomaly_type=None, session_id=None, user_id=None, since=None, until=None):
+    """Builds the Mongo filter for one page of /logs/."""
+    clauses = []
+    if anomaly_type:
+        # Combined labels like 'dos_attack+billing_fraud' match each of their checks
+        labels = sorted({label for t in anomaly_type for label in anomaly_type_labels(t)})
+        clauses.append({"anomaly_type": {"$in": labels}})
+    if session_id:
+        clauses.append({"session_id": session_id})
+    if user_id:
+        # user_id is stored with the type it had in the upload, usually an int
+        candidates = [user_id] + ([int(user_id)] if user_id.lstrip('-').isdigit() else [])
+        clauses.append({"user_id": {"$in": candidates}})
+    if since or until:
+        time_range = {}
+        if since:
+            time_range["$gte"] = since
+        if until:
+            time_range["$lt"] = until
+        clauses.append({"detection_timestamp": time_range})
+    if cursor:
+        last_timestamp, last_id = decode_cursor(cursor)
+        clauses.append({"$or": [
+            {"detection_timestamp": {"$lt": last_timestamp}},
+            {"detection_timestamp": last_timestamp, "_id": {"$lt": last_id}},
+        ]})
+    if not clauses:
+        return {}
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+def _page(mongo_cursor, limit):
+    """Yields up to `limit` documents (without _id), then the next cursor or None."""
+    last = None
+    for count, doc in enumerate(mongo_cursor):
+        if count == limit:
+            yield encode_cursor(last)
+            return
+        last = {"detection_timestamp": doc.get("detection_timestamp"), "_id": doc.pop("_id")}
+        yield doc
+    yield None
+
+
+def stream_logs(collection, query, limit, fmt="json"):
+    """
+    Streams one page of anomalies straight from the Mongo cursor, so memory
+    stays bounded by the batch size. fmt="json" writes
+    {"anomalies": [...], "next_cursor": ...}; fmt="ndjson" writes one anomaly
+    per line followed by a final {"next_cursor": ...} line. Yields bytes in
+    blocks of about LOGS_STREAM_BLOCK_BYTES.
+    """
+    mongo_cursor = collection.find(query).sort(LOGS_SORT).limit(limit + 1)
+    items = _page(mongo_cursor, limit)
+    block = bytearray()
+    if fmt == "ndjson":
+        for item in items:
+            block += dumps(item if isinstance(item, dict) else {"next_cursor": item}) + b"\n"
+            if len(block) >= LOGS_STREAM_BLOCK_BYTES:
+                yield bytes(block)
+                block.clear()
+        yield bytes(block)
+        return
+
+    block += b'{"anomalies":['
+    first = True
+    for item in items:
+        if isinstance(item, dict):
+            if not first:
+                block += b","
+            block += dumps(item)
+            first = False
+            if len(block) >= LOGS_STREAM_BLOCK_BYTES:
+                yield bytes(block)
+                block.clear()
+        else:
+            block += b'],"next_cursor":' + dumps(item) + b"}"
+    yield bytes(block)
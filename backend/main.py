@@ -1,17 +1,14 @@
-import pandas as pd
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import FastAPI, UploadFile, File, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from io import StringIO
 import pymongo
 from contextlib import asynccontextmanager
+import asyncio
 import logging
 from datetime import datetime
-import io
-from fastapi.encoders import jsonable_encoder
-from bson import ObjectId
-import traceback
 import sys
 import os
+import time
 
 # Add backend directory to Python path to ensure imports work
 backend_dir = os.path.dirname(os.path.abspath(__file__))
@@ -19,34 +16,62 @@ if backend_dir not in sys.path:
     sys.path.insert(0, backend_dir)
 
 # Now import the anomaly detector at module level
-from anomaly_detector import find_anomalies
+from anomaly_detector import model_registry, detection_fingerprint
+from detection_pool import start_pool, shutdown_pool, detect_in_chunks
+from fastapi.concurrency import run_in_threadpool
+from log_queries import ensure_log_indexes, build_logs_query, stream_logs
+from anomaly_writer import AnomalyWriter, REPLAY_INTERVAL
+from anomaly_store import (
+    ensure_anomaly_indexes, archive_anomalies, MONGO_URI, ANOMALY_ARCHIVE_AFTER_DAYS, ARCHIVE_INTERVAL_SECONDS,
+)
+from anomaly_stats import (
+    MongoAnomalyStats, InMemoryAnomalyStats, ensure_rollups, prune_session_rollups, rebuild_rollups, update_rollups,
+    STATS_MAX_BUCKETS, STATS_MAX_TOP, STATS_PRUNE_INTERVAL_SECONDS,
+)
+from stream_detection import (
+    StreamDetector, AnomalyBroadcaster, parse_line, parse_message, STREAM_BATCH_SIZE, STREAM_MAX_REPORTED_ERRORS,
+)
+from result_cache import ResultCache, hash_file, cache_key
+from column_resolver import (
+    COLUMN_MAPPING, COLUMN_FUZZY_CUTOFF, column_aliases, default_resolver, resolve_column_names, standardize_columns,
+)
+from upload_formats import upload_format, read_upload_chunks, read_upload_file, PREDICT_CHUNK_SIZE, SUPPORTED_UPLOADS
+from metrics import metrics, stage, peak_rss_bytes
+from admission import AdmissionController, AdmissionMiddleware, Saturated, UploadLimitMiddleware, configure_spooling
+from json_responses import dumps, encoded_response, json_response, streaming_response
+from jobs import InMemoryJobStore, MongoJobStore, JOB_PAGE_SIZE, spool_upload, submit_job
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-logger.info("✅ Successfully imported find_anomalies from anomaly_detector.")
+logger.info("✅ Successfully imported anomaly_detector.")
 
 # --- Database Setup ---
-MONGO_URI = "mongodb://localhost:27017/"
 client = None
 db = None
 collection = None
 
+# --- Job Store ---
+# "memory" keeps background jobs in process memory even when MongoDB is up
+JOB_STORE = os.getenv("JOB_STORE", "mongo")
+job_store = None
+anomaly_writer = None
 
-# --- Custom JSON Encoder for ObjectId ---
-def custom_jsonable_encoder(obj, **kwargs):
-    """Encodes MongoDB ObjectIds and datetimes to strings."""
-    if isinstance(obj, ObjectId):
-        return str(obj)
-    if isinstance(obj, datetime):
-        return obj.isoformat()
-    return jsonable_encoder(obj, custom_encoder={ObjectId: str, datetime: lambda dt: dt.isoformat()}, **kwargs)
+# --- Result Cache ---
+result_cache = ResultCache()
 
+# --- Live Detection Subscribers ---
+anomaly_broadcaster = AnomalyBroadcaster()
 
-@asynccontextmanager
-async def lifespan(app: FastAPI):
-    # Code to run on startup
+# --- Logs Settings ---
+# Anomalies returned per /logs/ page by default, and the most a client may ask for
+LOGS_PAGE_SIZE = int(os.getenv("LOGS_PAGE_SIZE", "1000"))
+LOGS_MAX_PAGE_SIZE = int(os.getenv("LOGS_MAX_PAGE_SIZE", "10000"))
+
+
+def connect_mongo():
+    """Connects to MongoDB and sets the module-level client/db/collection."""
     global client, db, collection
     logger.info("Connecting to MongoDB...")
     try:
@@ -55,11 +80,75 @@ async def lifespan(app: FastAPI):
         db = client["ev_anomaly_db"]
         collection = db["anomalies"]
         logger.info("✅ Successfully connected to MongoDB.")
+        ensure_anomaly_indexes(collection)
+        ensure_log_indexes(collection)
+        ensure_rollups(collection)
     except pymongo.errors.ConnectionFailure as e:
         logger.error(f"❌ Could not connect to MongoDB: {e}")
         client = None
+
+
+_last_connect_attempt = 0.0
+
+
+def get_write_collection():
+    """
+    Returns the anomalies collection for the write-behind writer, retrying
+    the connection (at most every REPLAY_INTERVAL seconds) while it is down.
+    """
+    global _last_connect_attempt
+    if collection is None and time.monotonic() - _last_connect_attempt >= REPLAY_INTERVAL:
+        _last_connect_attempt = time.monotonic()
+        connect_mongo()
+    return collection
+
+
+async def archive_periodically():
+    """Moves old anomalies into the monthly archive collections every ARCHIVE_INTERVAL_SECONDS."""
+    while True:
+        if collection is not None:
+            try:
+                await run_in_threadpool(archive_anomalies, collection)
+            except pymongo.errors.PyMongoError as e:
+                logger.error(f"❌ Archiving anomalies failed: {e}")
+        await asyncio.sleep(ARCHIVE_INTERVAL_SECONDS)
+
+
+async def prune_rollups_periodically():
+    """Trims the session rollups back to their per-day top-K every STATS_PRUNE_INTERVAL_SECONDS."""
+    while True:
+        await asyncio.sleep(STATS_PRUNE_INTERVAL_SECONDS)
+        if collection is not None:
+            try:
+                await run_in_threadpool(prune_session_rollups, collection)
+            except pymongo.errors.PyMongoError as e:
+                logger.error(f"❌ Pruning session rollups failed: {e}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Code to run on startup
+    global job_store, anomaly_writer
+    global _last_connect_attempt
+    _last_connect_attempt = time.monotonic()
+    connect_mongo()
+    if collection is not None and JOB_STORE != "memory":
+        job_store = MongoJobStore(db)
+    else:
+        logger.warning("Using in-memory job store; job results will not survive a restart.")
+        job_store = InMemoryJobStore()
+    start_pool()
+    anomaly_writer = AnomalyWriter(get_write_collection, in_memory_log_store, on_insert=update_rollups)
+    anomaly_writer.start()
+    archiver = asyncio.create_task(archive_periodically()) if ANOMALY_ARCHIVE_AFTER_DAYS else None
+    pruner = asyncio.create_task(prune_rollups_periodically())
     yield
     # Code to run on shutdown
+    if archiver is not None:
+        archiver.cancel()
+    pruner.cancel()
+    await anomaly_writer.stop()
+    shutdown_pool()
     if client:
         logger.info("Closing MongoDB connection.")
         client.close()
@@ -69,6 +158,16 @@ async def lifespan(app: FastAPI):
 app = FastAPI(title="EV Anomaly Detection API", lifespan=lifespan)
 
 
+# --- Ingestion Guard ---
+# Large uploads spool to disk, oversized ones get 413, and detections wait for a
+# slot (429/503 with Retry-After when saturated). Added before CORS so the
+# rejections still carry CORS headers.
+configure_spooling()
+admission = AdmissionController()
+app.add_middleware(AdmissionMiddleware, controller=admission)
+app.add_middleware(UploadLimitMiddleware)
+
+
 # --- CORS ---
 app.add_middleware(
     CORSMiddleware,
@@ -87,147 +186,158 @@ app.add_middleware(
 
 
 # --- In-memory Log (Fallback if DB fails) ---
+# Filled by the anomaly writer while MongoDB is unreachable and replayed into it later
 in_memory_log_store = []
 
 
-# ✨ FLEXIBLE COLUMN MAPPER - Handles any CSV format
-def standardize_columns(df):
-    """
-    Converts common CSV column name variations to a standard snake_case format
-    required by the anomaly detection logic.
-    """
-    column_mapping = {
-        # Session ID variations
-        'sessionid': 'session_id', 'session id': 'session_id', 'session_id': 'session_id',
-        'session_guid': 'session_id',
-
-        # User ID variations
-        'userid': 'user_id', 'user id': 'user_id', 'user_id': 'user_id',
-        'customerid': 'user_id', 'customer id': 'user_id', 'customer_id': 'user_id',
-
-        # Charger ID variations
-        'chargerid': 'charger_id', 'charger id': 'charger_id', 'charger_id': 'charger_id',
-        'chargingstationid': 'charger_id', 'charging station id': 'charger_id', 'charging_station_id': 'charger_id',
-        'stationid': 'charger_id', 'station id': 'charger_id', 'station_id': 'charger_id',
-
-        # Start Time variations
-        'starttime': 'start_time', 'start time': 'start_time', 'start_time': 'start_time',
-        'starttimestamp': 'start_time', 'start timestamp': 'start_time', 'start_timestamp': 'start_time',
-        'timestamp': 'start_time',
-
-        # End Time variations
-        'endtime': 'end_time', 'end time': 'end_time', 'end_time': 'end_time',
-        'endtimestamp': 'end_time', 'end timestamp': 'end_time', 'end_timestamp': 'end_time',
-
-        # Duration variations
-        'duration': 'duration', 'duration(min)': 'duration', 'duration_min': 'duration',
-        'chargingtime': 'duration', 'charging time': 'duration', 'charging_time': 'duration',
-
-        # Energy variations
-        'energy': 'energy_kWh', 'energy(kwh)': 'energy_kWh', 'energy_kwh': 'energy_kWh',
-        'energyconsumed': 'energy_kWh', 'energy consumed': 'energy_kWh', 'energy_consumed': 'energy_kWh',
-        'kwh': 'energy_kWh', 'total kwh': 'energy_kWh', 'total_kwh': 'energy_kWh',
-
-        # Payment/Amount variations
-        'payment': 'amount_INR', 'amount': 'amount_INR', 'amountinr': 'amount_INR',
-        'amount_inr': 'amount_INR', 'cost': 'amount_INR', 'totalcost': 'amount_INR',
-        'total cost': 'amount_INR', 'total_cost': 'amount_INR',
-
-        # IP Address variations
-        'ipaddress': 'ip_address', 'ip address': 'ip_address', 'ip_address': 'ip_address',
-        'sourceip': 'ip_address', 'source ip': 'ip_address', 'source_ip': 'ip_address',
-
-        # CPU Usage variations
-        'cpuusagepercent': 'cpu_usage_percent', 'cpu usage percent': 'cpu_usage_percent', 'cpu_usage_percent': 'cpu_usage_percent',
-        'cpuusage': 'cpu_usage_percent', 'cpu usage': 'cpu_usage_percent', 'cpu_usage': 'cpu_usage_percent',
-        'cpu %': 'cpu_usage_percent', 'cpu%': 'cpu_usage_percent',
-
-        # Packets Per Second variations
-        'packetspersec': 'packets_per_sec', 'packets per sec': 'packets_per_sec', 'packets_per_sec': 'packets_per_sec',
-        'pps': 'packets_per_sec', 'packetrate': 'packets_per_sec', 'packet rate': 'packets_per_sec',
-        'packet_rate': 'packets_per_sec',
-
-        # Geolocation variations
-        'geolocation': 'geo_location', 'geo location': 'geo_location', 'geo_location': 'geo_location',
-        'location': 'geo_location', 'latlon': 'geo_location', 'lat/lon': 'geo_location',
-        'coordinates': 'geo_location'
-    }
+# Cached /predict/ results are keyed by this too, so a change to the detection
+# code, its settings or the column mapping never serves a stale result
+detection_version = detection_fingerprint(
+    column_mapping=COLUMN_MAPPING, column_aliases=column_aliases, column_fuzzy_cutoff=COLUMN_FUZZY_CUTOFF,
+)
+
+
+# --- Live Detection State (per-user end times for incremental conflict checks) ---
+stream_detector = StreamDetector(standardize_columns)
 
-    # Standardize column names
-    original_columns = df.columns
-    df.columns = df.columns.str.lower().str.strip().str.replace(' ', '_', regex=False).str.replace('.', '_', regex=False)
 
-    # Apply the mapping
-    df = df.rename(columns=column_mapping, errors='ignore')
+def _read_upload(file, fmt, timings=None):
+    """Yields standardized chunks of an upload, reading only the columns detection uses."""
+    def resolve(columns):
+        with stage(timings, "standardize_columns"):
+            return resolve_column_names(columns)
+    return read_upload_chunks(file, fmt, resolve, PREDICT_CHUNK_SIZE)
 
-    # Log mapped columns
-    mapped_cols = {orig: df.columns[i] for i, orig in enumerate(original_columns) 
-                   if orig.lower().strip().replace(' ', '_').replace('.', '_') in column_mapping 
-                   and i < len(df.columns) 
-                   and df.columns[i] == column_mapping[orig.lower().strip().replace(' ', '_').replace('.', '_')]}
-    if mapped_cols:
-        logger.info(f"Standardized columns: {mapped_cols}")
 
-    return df
+def _upload_format_or_400(filename):
+    fmt = upload_format(filename)
+    if fmt is None:
+        raise HTTPException(status_code=400, detail=f"Invalid file type. Please upload a {SUPPORTED_UPLOADS} file.")
+    return fmt
+
+
+async def store_anomalies(detected_anomalies):
+    """Stamps copies of the anomalies with a detection_timestamp and queues them for storage."""
+    detection_timestamp = datetime.now()
+    anomalies_to_insert = []
+    for anomaly in detected_anomalies:
+        if isinstance(anomaly, dict):
+            anomaly_copy = anomaly.copy()
+            anomaly_copy['detection_timestamp'] = detection_timestamp
+            anomalies_to_insert.append(anomaly_copy)
+        else:
+            logger.warning(f"Skipping non-dict item in detected_anomalies: {anomaly}")
+
+    if anomalies_to_insert:
+        # Written in the background; waits only if the write buffer is full
+        await anomaly_writer.enqueue(anomalies_to_insert)
+        logger.info(f"Queued {len(anomalies_to_insert)} anomalies for storage.")
 
 
 @app.post("/predict/")
-async def predict(file: UploadFile = File(...)):
+async def predict(request: Request, file: UploadFile = File(...), profile: bool = False):
     """
-    Accepts a CSV file, standardizes columns, runs detection, stores results,
-    and returns findings ensuring JSON serializability.
+    Accepts a CSV (optionally gzip/zstd compressed), Parquet or Arrow/Feather
+    file, standardizes columns, runs detection, stores results, and returns
+    findings as pre-encoded (and, if accepted, compressed) JSON.
+
+    With ?profile=1 the response also has a "profile" with the seconds spent
+    in each stage (detection stages summed over chunks), rows/sec and peak RSS.
     """
-    if not file.filename.endswith('.csv'):
-        raise HTTPException(status_code=400, detail="Invalid file type. Please upload a CSV.")
+    fmt = _upload_format_or_400(file.filename)
+    started = time.perf_counter()
+    timings = {}
 
     try:
-        contents = await file.read()
-        df = pd.read_csv(io.StringIO(contents.decode('utf-8')))
-        df_standardized = standardize_columns(df.copy())
-
-        # Call find_anomalies (already imported at module level)
-        detection_result = find_anomalies(df_standardized)
+        # Identical uploads scored by the same models and detection code reuse the earlier result
+        with stage(timings, "hash_upload"):
+            content_hash = await run_in_threadpool(hash_file, file.file)
+            model_version = await run_in_threadpool(lambda: model_registry.version)
+            result_key = cache_key(content_hash, model_version, detection_version)
+        with stage(timings, "cache_lookup"):
+            detection_result = await run_in_threadpool(result_cache.get, result_key)
+        cache_hit = detection_result is not None
+        # Timings recorded by detect_in_chunks (detection stages); the rest are recorded below
+        detection_stages = set()
+
+        if not cache_hit:
+            # Stream the spooled upload in bounded chunks instead of decoding it whole
+            # Parsing and scoring run off the event loop so other requests stay responsive
+            # The detection slot is taken only now that the upload is received
+            async with admission.slot("request"):
+                detection_result = await detect_in_chunks(_read_upload(file.file, fmt, timings), timings=timings)
+            detection_stages = set(timings)
+            if isinstance(detection_result, dict):
+                # Timings describe this request only; keep them out of the cached result
+                detection_result.pop("timings", None)
+                # Cached under the models the workers actually scored with, which
+                # a hot reload may have changed since the lookup
+                scored_version = detection_result.pop("model_version", None)
+                if scored_version is None:
+                    logger.info(f"Models changed while scoring {file.filename}; result not cached.")
+                else:
+                    result_key = cache_key(content_hash, scored_version, detection_version)
+                    with stage(timings, "cache_store"):
+                        await run_in_threadpool(result_cache.put, result_key, detection_result)
 
         # Ensure dict type and extract results safely
         if not isinstance(detection_result, dict):
             logger.error(f"Unexpected return type from find_anomalies: {type(detection_result)}. Expected dict.")
             detected_anomalies = []
             info_messages = ["Internal error: Anomaly detector returned unexpected format."]
+            total_sessions = 0
         else:
             detected_anomalies = detection_result.get("anomalies", [])
-            info_messages = detection_result.get("info", [])
-
-        # Store anomalies
-        if detected_anomalies:
-            detection_timestamp = datetime.now()
-            anomalies_to_insert = []
-            for anomaly in detected_anomalies:
-                if isinstance(anomaly, dict):
-                    anomaly_copy = anomaly.copy()
-                    anomaly_copy['detection_timestamp'] = detection_timestamp
-                    anomalies_to_insert.append(anomaly_copy)
-                else:
-                    logger.warning(f"Skipping non-dict item in detected_anomalies: {anomaly}")
+            info_messages = list(detection_result.get("info", []))
+            total_sessions = detection_result.get("total_sessions", 0)
+
+        if cache_hit:
+            logger.info(f"Result cache hit for {file.filename} ({result_key}).")
+            info_messages.append("Result cache hit: this file was already scored; reused the stored result.")
+        else:
+            info_messages.append("Result cache miss: file scored.")
 
-            if collection is not None and anomalies_to_insert:
-                try:
-                    collection.insert_many(anomalies_to_insert)
-                    logger.info(f"Inserted {len(anomalies_to_insert)} anomalies into MongoDB.")
-                except Exception as db_e:
-                    logger.error(f"Failed to insert anomalies into MongoDB: {db_e}")
-            elif collection is None:
-                logger.warning("DB not connected, skipping log storage.")
+        # Store anomalies (a cache hit's anomalies were stored by the first upload)
+        if detected_anomalies and not cache_hit:
+            with stage(timings, "queue_storage"):
+                await store_anomalies(detected_anomalies)
 
         # Prepare response
         response_data = {
             "filename": file.filename,
-            "total_sessions": len(df),
+            "total_sessions": total_sessions,
             "anomalies_found": len(detected_anomalies),
             "anomalies": detected_anomalies,
             "info": info_messages
         }
-        return custom_jsonable_encoder(response_data)
-
+        with stage(timings, "json_encoding"):
+            body = await run_in_threadpool(dumps, response_data)
+
+        if profile:
+            elapsed = time.perf_counter() - started
+            own_rss, workers_rss = peak_rss_bytes()
+            profile_data = {
+                "stages": {name: round(seconds, 6) for name, seconds in timings.items()},
+                "total_seconds": round(elapsed, 6),
+                "rows_per_second": round(total_sessions / elapsed, 1) if elapsed > 0 else None,
+                "peak_rss_bytes": own_rss,
+                "worker_peak_rss_bytes": workers_rss,
+                "cache_hit": cache_hit,
+            }
+            # Appended to the encoded object so the anomalies aren't serialized twice
+            body = body[:-1] + b',"profile":' + dumps(profile_data) + b"}"
+
+        with stage(timings, "compression"):
+            response = await run_in_threadpool(encoded_response, request, body)
+
+        metrics.observe_stages({name: seconds for name, seconds in timings.items() if name not in detection_stages})
+        metrics.observe("ev_request_seconds", time.perf_counter() - started, endpoint="predict")
+        metrics.inc("ev_requests_total", endpoint="predict", cache="hit" if cache_hit else "miss")
+        return response
+
+    except Saturated as saturated:
+        raise HTTPException(status_code=saturated.status_code, detail=saturated.detail,
+                            headers={"Retry-After": str(saturated.retry_after)})
     except ValueError as ve:
         logger.error(f"Value Error during prediction processing: {ve}")
         raise HTTPException(status_code=400, detail=str(ve))
@@ -236,21 +346,295 @@ async def predict(file: UploadFile = File(...)):
         raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {e}")
 
 
+@app.post("/jobs/", status_code=202)
+async def submit_detection_job(file: UploadFile = File(...)):
+    """
+    Accepts an upload in any /predict/ format and starts detection in the
+    background. Returns a job id at once; poll GET /jobs/{job_id} and page
+    GET /jobs/{job_id}/anomalies.
+    """
+    fmt = _upload_format_or_400(file.filename)
+
+    # The upload is closed when this request ends, so the job reads its own copy
+    path = await spool_upload(file)
+    read_chunks = lambda spooled: read_upload_file(spooled, fmt, resolve_column_names, PREDICT_CHUNK_SIZE)
+    try:
+        job = await submit_job(job_store, file.filename, path, read_chunks, admission=admission)
+    except Saturated as saturated:
+        # Jobs submitted while this upload was being received filled the queue
+        raise HTTPException(status_code=saturated.status_code, detail=saturated.detail,
+                            headers={"Retry-After": str(saturated.retry_after)})
+    logger.info(f"Submitted job {job['job_id']} for {file.filename}.")
+    return {"job_id": job["job_id"], "status": job["status"]}
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str, request: Request):
+    """Reports a job's status and progress (rows processed, anomalies so far)."""
+    job = await run_in_threadpool(job_store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found.")
+    return json_response(request, job)
+
+
+@app.get("/jobs/{job_id}/anomalies")
+async def get_job_anomalies(job_id: str, request: Request, cursor: int = 0, limit: int = JOB_PAGE_SIZE):
+    """Pages through a finished job's anomalies; pass next_cursor to get the next page."""
+    job = await run_in_threadpool(job_store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found.")
+    if job["status"] != "completed":
+        raise HTTPException(status_code=409, detail=f"Job {job_id} is {job['status']}; results are not ready.")
+
+    limit = max(1, min(limit, JOB_PAGE_SIZE))
+    anomalies, next_cursor = await run_in_threadpool(job_store.page_anomalies, job_id, cursor, limit)
+    page = {"job_id": job_id, "anomalies": anomalies, "next_cursor": next_cursor}
+    return await run_in_threadpool(json_response, request, page)
+
+
 @app.get("/logs/")
-async def get_logs():
-    """Fetches all detected anomalies from the database, ensuring JSON serializability."""
-    if collection is not None:
-        try:
-            logs_from_db = list(collection.find({}, {'_id': 0}).sort("detection_timestamp", pymongo.DESCENDING))
-            logger.info(f"Fetched {len(logs_from_db)} logs from MongoDB.")
-            serializable_logs = custom_jsonable_encoder(logs_from_db)
-            return {"anomalies": serializable_logs}
-        except Exception as db_e:
-            logger.error(f"Failed to fetch logs from MongoDB: {db_e}", exc_info=True)
-            raise HTTPException(status_code=500, detail="Failed to fetch logs from database.")
-    else:
-        logger.warning("DB not connected, cannot fetch historical logs.")
-        return {"anomalies": [], "info": "Database not connected."}
+async def get_logs(
+    request: Request,
+    cursor: str | None = None,
+    limit: int = Query(LOGS_PAGE_SIZE, ge=1, le=LOGS_MAX_PAGE_SIZE),
+    anomaly_type: list[str] | None = Query(None),
+    session_id: str | None = None,
+    user_id: str | None = None,
+    since: datetime | None = None,
+    until: datetime | None = None,
+    format: str = Query("json", pattern="^(json|ndjson)$"),
+):
+    """
+    Streams detected anomalies from the database, newest first, one page at a
+    time. Pass the returned next_cursor to get the following page. Optional
+    filters: anomaly_type (repeatable), session_id, user_id and a
+    detection_timestamp range [since, until). format=ndjson streams one
+    anomaly per line instead of a JSON object.
+    """
+    if collection is None:
+        logger.warning("DB not connected, serving anomalies buffered in memory.")
+        buffered = in_memory_log_store[::-1][:limit]
+        return await run_in_threadpool(json_response, request, {"anomalies": buffered, "info": "Database not connected."})
+
+    try:
+        query = build_logs_query(cursor, anomaly_type, session_id, user_id, since, until)
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
+
+    media_type = "application/x-ndjson" if format == "ndjson" else "application/json"
+    return streaming_response(request, stream_logs(collection, query, limit, format), media_type=media_type)
+
+
+# --- Dashboard Stats ---
+def _anomaly_stats():
+    """Stats over the rollups, or over the anomalies buffered in memory while the DB is down."""
+    if collection is None:
+        return InMemoryAnomalyStats(list(in_memory_log_store))
+    return MongoAnomalyStats(collection)
+
+
+async def _stats_response(request, query):
+    try:
+        result = await run_in_threadpool(query)
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
+    if collection is None:
+        result["info"] = "Database not connected; stats cover anomalies buffered in memory."
+    return json_response(request, result)
+
+
+@app.get("/stats/summary")
+async def get_stats_summary(request: Request, since: datetime | None = None, until: datetime | None = None):
+    """
+    Anomaly counts per anomaly_type and per check (a combined label like
+    'dos_attack+billing_fraud' counts for both checks). since/until limit
+    the counts to sessions that started in that range, in whole hours.
+    """
+    return await _stats_response(request, lambda: _anomaly_stats().summary(since, until))
+
+
+@app.get("/stats/histogram")
+async def get_stats_histogram(
+    request: Request,
+    bucket: str = Query("hour", pattern="^(hour|day)$"),
+    since: datetime | None = None,
+    until: datetime | None = None,
+    anomaly_type: str | None = None,
+    limit: int = Query(STATS_MAX_BUCKETS, ge=1, le=STATS_MAX_BUCKETS),
+):
+    """
+    Anomalies per hour or day of session start, oldest first. With
+    anomaly_type, each bucket's count covers only anomalies of that check.
+    """
+    return await _stats_response(request, lambda: _anomaly_stats().histogram(bucket, since, until, anomaly_type, limit))
+
+
+@app.get("/stats/top")
+async def get_stats_top(
+    request: Request,
+    by: str = Query("user", pattern="^(user|session)$"),
+    limit: int = Query(10, ge=1, le=STATS_MAX_TOP),
+):
+    """The users or sessions with the most anomalies."""
+    return await _stats_response(request, lambda: _anomaly_stats().top(by, limit))
+
+
+@app.post("/stats/rebuild")
+async def rebuild_stats():
+    """Recomputes the stats rollups from the stored anomalies (after manual edits to the collection)."""
+    if collection is None:
+        raise HTTPException(status_code=503, detail="Database not connected.")
+    # Queued anomalies are written (and rolled up) first so they aren't counted twice
+    await anomaly_writer.flush()
+    counted = await run_in_threadpool(rebuild_rollups, collection)
+    return {"anomalies_counted": counted}
+
+
+# --- Real-time Streaming Detection ---
+async def _score_stream_batch(records):
+    """Scores a micro-batch of live records, then stores and broadcasts its anomalies."""
+    anomalies = await run_in_threadpool(stream_detector.score_records, records)
+    if anomalies:
+        await store_anomalies(anomalies)
+        anomaly_broadcaster.publish(anomalies)
+    return anomalies
+
+
+@app.post("/stream/sessions")
+async def stream_sessions(request: Request):
+    """
+    Scores an NDJSON body of session records (one JSON object per line) in
+    micro-batches of STREAM_BATCH_SIZE as the body arrives. Multi-user
+    conflicts are checked against every session streamed so far. Lines that
+    aren't JSON objects are skipped and reported under "errors" by line number.
+    """
+    sessions_scored = 0
+    anomalies = []
+    batch = []
+    errors = []
+    invalid_lines = 0
+    line_number = 0
+    buffer = b''
+
+    def take(lines):
+        nonlocal invalid_lines, line_number
+        for line in lines:
+            line_number += 1
+            if not line.strip():
+                continue
+            try:
+                batch.append(parse_line(line))
+            except ValueError as ve:
+                invalid_lines += 1
+                if len(errors) < STREAM_MAX_REPORTED_ERRORS:
+                    errors.append({"line": line_number, "error": str(ve)})
+
+    try:
+        async for body_chunk in request.stream():
+            buffer += body_chunk
+            *lines, buffer = buffer.split(b'\n')
+            take(lines)
+            while len(batch) >= STREAM_BATCH_SIZE:
+                anomalies.extend(await _score_stream_batch(batch[:STREAM_BATCH_SIZE]))
+                sessions_scored += STREAM_BATCH_SIZE
+                batch = batch[STREAM_BATCH_SIZE:]
+        take([buffer])
+        if batch:
+            anomalies.extend(await _score_stream_batch(batch))
+            sessions_scored += len(batch)
+    except (ValueError, TypeError) as ve:
+        logger.error(f"Invalid streamed records: {ve}")
+        raise HTTPException(status_code=400, detail=str(ve))
+
+    if invalid_lines:
+        logger.warning(f"Skipped {invalid_lines} invalid streamed lines.")
+    return json_response(request, {
+        "sessions_scored": sessions_scored, "anomalies_found": len(anomalies), "anomalies": anomalies,
+        "invalid_lines": invalid_lines, "errors": errors,
+    })
+
+
+@app.websocket("/stream/ws")
+async def stream_ws(websocket: WebSocket):
+    """
+    Scores records sent over a WebSocket. Each message is one record object
+    or a list of them; the reply lists the anomalies found in that message,
+    or is an {"error": ...} frame for a message that isn't, and the
+    connection stays open.
+    """
+    await websocket.accept()
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
+            try:
+                records = parse_message(message.get("text") or message.get("bytes") or "")
+                anomalies = await _score_stream_batch(records)
+            except (ValueError, TypeError) as ve:
+                await websocket.send_json({"error": str(ve)})
+                continue
+            await websocket.send_json({"sessions_scored": len(records), "anomalies": anomalies})
+    except WebSocketDisconnect:
+        logger.info("Streaming client disconnected.")
+
+
+@app.websocket("/stream/subscribe")
+async def stream_subscribe(websocket: WebSocket):
+    """Pushes every anomaly detected by the streaming endpoints to the client as it happens."""
+    await websocket.accept()
+    queue = anomaly_broadcaster.subscribe()
+    try:
+        while True:
+            await websocket.send_json(await queue.get())
+    except WebSocketDisconnect:
+        logger.info("Anomaly subscriber disconnected.")
+    finally:
+        anomaly_broadcaster.unsubscribe(queue)
+
+
+@app.get("/models/")
+async def get_models():
+    """Reports the loaded model version and per-model load time and memory."""
+    return await run_in_threadpool(lambda: {"version": model_registry.version, **model_registry.load_stats})
+
+
+@app.post("/models/reload")
+async def reload_models():
+    """
+    Reloads the model files if they changed on disk. Detection workers pick
+    up new files on their own within MODEL_RELOAD_CHECK_SECONDS.
+    """
+    try:
+        reloaded = await run_in_threadpool(model_registry.reload_if_changed)
+    except RuntimeError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return {"reloaded": reloaded, "version": model_registry.version}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """
+    Prometheus-style metrics: per-stage latency histograms and rows/sec,
+    anomaly counts per type, peak RSS, result cache, writer and column
+    resolver counters, and detection slots, queue depth and rejections.
+    """
+    own_rss, workers_rss = peak_rss_bytes()
+    cache_stats = await run_in_threadpool(result_cache.stats)
+    resolver_cache = default_resolver.cache_info()
+    gauges = {
+        "ev_peak_rss_bytes": {(("process", "api"),): own_rss, (("process", "workers"),): workers_rss},
+        "ev_result_cache": {(("stat", name),): value for name, value in cache_stats.items()},
+        "ev_column_resolver_cache": {(("stat", "hits"),): resolver_cache.hits, (("stat", "misses"),): resolver_cache.misses},
+        "ev_in_memory_log_store_size": len(in_memory_log_store),
+        **admission.gauges(),
+    }
+    if anomaly_writer is not None:
+        gauges["ev_writer_written"] = anomaly_writer.written
+        gauges["ev_writer_duplicates"] = anomaly_writer.duplicates
+        gauges["ev_writer_dropped"] = anomaly_writer.dropped
+        gauges["ev_writer_pending_batches"] = anomaly_writer.pending_batches
+    return metrics.render(gauges)
 
 
 @app.get("/")
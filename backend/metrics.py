@@ -0,0 +1,177 @@
+"""
+Per-stage timings and Prometheus-style metrics for the detection pipeline.
+
+Pipeline code times its stages into a plain dict with `stage(timings, name)`.
+Dicts are picklable, so stages timed in detection worker processes travel
+back with the chunk results. The parent process then records each request's
+timings in `metrics`, which GET /metrics renders in the Prometheus text
+exposition format.
+"""
+import resource
+import sys
+import time
+from contextlib import contextmanager
+from threading import Lock
+
+# Upper bounds (seconds) of the stage latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+@contextmanager
+def stage(timings, name):
+    """Adds the wall time of the block to timings[name]; a no-op if timings is None."""
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = timings.get(name, 0.0) + time.perf_counter() - start
+
+
+def merge_timings(target, timings):
+    """Adds each stage of `timings` into `target` (e.g. the chunks of one upload)."""
+    for name, seconds in timings.items():
+        target[name] = target.get(name, 0.0) + seconds
+    return target
+
+
+def timed_chunks(chunks, timings, name):
+    """Yields from `chunks`, adding the time spent producing each one to timings[name]."""
+    iterator = iter(chunks)
+    while True:
+        with stage(timings, name):
+            chunk = next(iterator, None)
+        if chunk is None:
+            return
+        yield chunk
+
+
+def peak_rss_bytes():
+    """Peak resident memory of this process and of its (finished or waited-for) children."""
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    scale = 1 if sys.platform == 'darwin' else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale
+    return own, children
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in sorted(labels.items())) + '}'
+
+
+class _Histogram:
+    def __init__(self):
+        self.bucket_counts = [0] * len(LATENCY_BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if value <= bound:
+                self.bucket_counts[i] += 1
+        self.count += 1
+        self.sum += value
+
+
+class MetricsRegistry:
+    """Thread-safe counters, gauges and latency histograms keyed by (name, labels)."""
+
+    def __init__(self):
+        self._lock = Lock()
+        self._help = {}
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+
+    def describe(self, name, help_text):
+        self._help[name] = help_text
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        with self._lock:
+            self._gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram()
+            histogram.observe(value)
+
+    def observe_stages(self, timings, rows=None):
+        """Records one request's stage timings, and its rows/sec per stage if rows is known."""
+        for name, seconds in timings.items():
+            self.observe("ev_stage_seconds", seconds, stage=name)
+            if rows:
+                self.inc("ev_stage_rows_total", rows, stage=name)
+                if seconds > 0:
+                    self.set("ev_stage_rows_per_second", rows / seconds, stage=name)
+
+    def render(self, gauges=None):
+        """
+        Returns all metrics in the Prometheus text format. `gauges` adds
+        point-in-time values read at scrape time: {name: value or {labels: value}}.
+        """
+        lines = []
+
+        def header(name, kind):
+            if name in self._help:
+                lines.append(f"# HELP {name} {self._help[name]}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        with self._lock:
+            counters = sorted(self._counters.items())
+            gauge_items = sorted(self._gauges.items())
+            histograms = sorted((key, (list(h.bucket_counts), h.count, h.sum)) for key, h in self._histograms.items())
+
+        for kind, items in (("counter", counters), ("gauge", gauge_items)):
+            seen = set()
+            for (metric, labels), value in items:
+                if metric not in seen:
+                    header(metric, kind)
+                    seen.add(metric)
+                lines.append(f"{metric}{_labels(dict(labels))} {value}")
+
+        seen = set()
+        for (metric, labels), (bucket_counts, count, total) in histograms:
+            if metric not in seen:
+                header(metric, "histogram")
+                seen.add(metric)
+            labels = dict(labels)
+            for bound, bucket_count in zip(LATENCY_BUCKETS, bucket_counts):
+                lines.append(f"{metric}_bucket{_labels({**labels, 'le': bound})} {bucket_count}")
+            lines.append(f"{metric}_bucket{_labels({**labels, 'le': '+Inf'})} {count}")
+            lines.append(f"{metric}_sum{_labels(labels)} {total}")
+            lines.append(f"{metric}_count{_labels(labels)} {count}")
+
+        for metric, value in sorted((gauges or {}).items()):
+            header(metric, "gauge")
+            values = value if isinstance(value, dict) else {(): value}
+            for labels, sample in values.items():
+                lines.append(f"{metric}{_labels(dict(labels))} {sample}")
+
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+metrics.describe("ev_stage_seconds", "Wall time per pipeline stage per request (summed over chunks).")
+metrics.describe("ev_stage_rows_total", "Rows that went through each pipeline stage.")
+metrics.describe("ev_stage_rows_per_second", "Rows per second of each stage in the latest request.")
+metrics.describe("ev_sessions_total", "Sessions scored by batch detection.")
+metrics.describe("ev_anomalies_total", "Anomalies found by batch detection, per anomaly_type.")
+metrics.describe("ev_request_seconds", "Wall time of detection requests, per endpoint.")
+metrics.describe("ev_requests_total", "Detection requests by endpoint and result cache outcome.")
+metrics.describe("ev_admission_rejected_total", "Uploads turned away: queue_full (429), timeout (503) or too_large (413).")
+metrics.describe("ev_admission_wait_seconds", "Time detections waited for a slot, per kind (request or job).")
+metrics.describe("ev_admission_queue_depth", "Detections waiting for a slot, per kind.")
+metrics.describe("ev_admission_active", "Detections holding a slot.")
+metrics.describe("ev_admission_slots", "Detections allowed to run at once (MAX_CONCURRENT_DETECTIONS).")
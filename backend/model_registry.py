@@ -0,0 +1,169 @@
+import hashlib
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from threading import RLock
+
+import joblib
+
+logger = logging.getLogger(__name__)
+
+# Model/scaler artifacts, by the name they are looked up with
+MODEL_FILES = {
+    "dos_model": "dos_model.pkl",
+    "dos_scaler": "dos_scaler.pkl",
+    "fraud_model": "fraud_model.pkl",
+    "fraud_scaler": "fraud_scaler.pkl",
+}
+# Written by train_models.py; names the version's files (relative to the model dir) to load instead
+MANIFEST_FILE = "manifest.json"
+
+
+def _rss_bytes():
+    """Resident set size of this process, or None where /proc is unavailable."""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def model_files_version(paths):
+    """Returns a short content hash of the given model/scaler files."""
+    digest = hashlib.sha256()
+    for path in paths:
+        digest.update(Path(path).read_bytes())
+    return digest.hexdigest()[:16]
+
+
+class ModelRegistry:
+    """
+    Loads the detection models on first use instead of at import.
+
+    With mmap_mode='r', joblib memory-maps the numpy arrays stored in the
+    pickles, so processes forked after loading share those pages read-only.
+    When the files on disk change (checked at most every `check_interval`
+    seconds, on access), all four are reloaded together and swapped in at
+    once, so a model is never paired with another version's scaler.
+
+    If the directory has a MANIFEST_FILE, the files it lists are loaded
+    instead of the MODEL_FILES next to it; replacing the manifest switches
+    every model to another trained version at once.
+    """
+
+    def __init__(self, model_dir, mmap_mode=None, check_interval=30.0):
+        self.model_dir = Path(model_dir)
+        self.mmap_mode = mmap_mode
+        self.check_interval = check_interval
+        self._lock = RLock()
+        self._models = None
+        self._mtimes = None
+        self._version = None
+        self._last_check = 0.0
+        self.load_stats = {}
+
+    @property
+    def manifest_path(self):
+        return self.model_dir / MANIFEST_FILE
+
+    @property
+    def paths(self):
+        files = MODEL_FILES
+        if self.manifest_path.exists():
+            try:
+                files = json.loads(self.manifest_path.read_text())["files"]
+                files = {name: files[name] for name in MODEL_FILES}
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                raise RuntimeError(f"Invalid model manifest '{self.manifest_path}': {e!r}") from e
+        return {name: self.model_dir / filename for name, filename in files.items()}
+
+    def get(self, name):
+        """Returns a loaded model or scaler by name (e.g. 'dos_model')."""
+        return self.get_many(name)[0]
+
+    def get_many(self, *names):
+        """Returns several models from the same version (e.g. a model and its scaler)."""
+        return self.get_versioned(*names)[1]
+
+    def get_versioned(self, *names):
+        """Returns (version, models): the models by name and the version they belong to."""
+        with self._lock:
+            self._ensure_current()
+            return self._version, tuple(self._models[name] for name in names)
+
+    @property
+    def version(self):
+        """
+        Content hash of the current files, e.g. to key cached detection results.
+        Checks for changed files on the same interval as get_many, so a process
+        that never scores (the API process, with a worker pool) still follows
+        a hot reload.
+        """
+        with self._lock:
+            self._ensure_current()
+            return self._version
+
+    def _ensure_current(self):
+        if self._models is None:
+            self._load()
+        elif self.check_interval and time.monotonic() - self._last_check >= self.check_interval:
+            self.reload_if_changed()
+
+    def load_all(self):
+        """Loads every model now (e.g. in a worker initializer) rather than on first use."""
+        with self._lock:
+            if self._models is None:
+                self._load()
+
+    def reload_if_changed(self):
+        """Reloads the models if any file changed on disk; returns True if it did."""
+        with self._lock:
+            self._last_check = time.monotonic()
+            if self._models is not None and self._current_mtimes() == self._mtimes:
+                return False
+            logger.info(f"Model files in {self.model_dir} changed, reloading.")
+            self._load()
+            return True
+
+    def _current_mtimes(self, paths=None):
+        paths = dict(paths or self.paths)
+        if self.manifest_path.exists():
+            paths[MANIFEST_FILE] = self.manifest_path
+        return {name: path.stat().st_mtime_ns for name, path in paths.items()}
+
+    def _load(self):
+        # One snapshot of the manifest, so all four files come from the same version
+        paths = self.paths
+        missing = [str(path) for path in paths.values() if not path.exists()]
+        if missing:
+            logger.error(f"Missing required model/scaler files: {missing}")
+            raise RuntimeError(f"Models not found in '{self.model_dir}'. Please ensure the Jupyter notebook was run successfully and models exist there.")
+
+        mtimes = self._current_mtimes(paths)
+        models = {}
+        load_stats = {}
+        for name, path in paths.items():
+            rss_before = _rss_bytes()
+            start = time.perf_counter()
+            try:
+                models[name] = joblib.load(path, mmap_mode=self.mmap_mode)
+            except Exception as e:
+                logger.error(f"An unexpected error occurred loading {path}: {e}")
+                raise RuntimeError(f"Failed to load models from '{self.model_dir}'.") from e
+            rss_after = _rss_bytes()
+            load_stats[name] = {
+                "load_seconds": round(time.perf_counter() - start, 4),
+                "file_bytes": path.stat().st_size,
+                "rss_delta_bytes": rss_after - rss_before if rss_before is not None and rss_after is not None else None,
+                "mmap_mode": self.mmap_mode,
+            }
+            logger.info(f"Loaded {name} in {load_stats[name]['load_seconds']}s.")
+
+        # Swap in the complete set only once every file loaded
+        self._models = models
+        self._mtimes = mtimes
+        self._version = model_files_version(paths.values())
+        self._last_check = time.monotonic()
+        self.load_stats = {"version": self._version, "loaded_at": time.time(), "models": load_stats}
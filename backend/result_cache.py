@@ -0,0 +1,137 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+from collections import OrderedDict
+from pathlib import Path
+from threading import Lock
+
+logger = logging.getLogger(__name__)
+
+# --- Cache Settings ---
+# Most anomalies held across all in-memory entries; least recently used go first
+RESULT_CACHE_MAX_ANOMALIES = int(os.getenv("RESULT_CACHE_MAX_ANOMALIES", "500000"))
+# Most entries held in memory
+RESULT_CACHE_ENTRIES = int(os.getenv("RESULT_CACHE_ENTRIES", "32"))
+# Directory for the optional on-disk tier; unset disables it
+RESULT_CACHE_DIR = os.getenv("RESULT_CACHE_DIR")
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def hash_file(file_obj):
+    """Returns the sha256 hex digest of a binary file object, read in blocks."""
+    digest = hashlib.sha256()
+    file_obj.seek(0)
+    for block in iter(lambda: file_obj.read(HASH_BLOCK_SIZE), b''):
+        digest.update(block)
+    file_obj.seek(0)
+    return digest.hexdigest()
+
+
+def cache_key(content_hash, model_version, detection_version):
+    """
+    Results are only reusable for the same bytes scored by the same models
+    with the same detection code and settings (anomaly_detector.detection_fingerprint).
+    """
+    return f"{model_version}-{detection_version}-{content_hash}"
+
+
+class ResultCache:
+    """
+    Caches find_anomalies results by cache_key().
+
+    An in-memory LRU tier is bounded by entry count and total anomalies. An
+    optional on-disk tier (gzipped JSON files in `directory`) keeps results
+    across restarts; disk hits are promoted back into memory.
+    """
+
+    def __init__(self, max_entries=RESULT_CACHE_ENTRIES, max_anomalies=RESULT_CACHE_MAX_ANOMALIES,
+                 directory=RESULT_CACHE_DIR):
+        self.max_entries = max_entries
+        self.max_anomalies = max_anomalies
+        self.directory = Path(directory) if directory else None
+        if self.directory is not None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+        self._entries = OrderedDict()
+        self._anomalies = 0
+        self._lock = Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Returns the cached result for key, or None."""
+        with self._lock:
+            result = self._entries.get(key)
+            if result is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return result
+
+        result = self._read_disk(key)
+        with self._lock:
+            if result is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.disk_hits += 1
+        self._put_memory(key, result)
+        return result
+
+    def put(self, key, result):
+        """Stores a result in memory and, if enabled, on disk."""
+        self._put_memory(key, result)
+        self._write_disk(key, result)
+
+    def _put_memory(self, key, result):
+        size = len(result.get("anomalies", []))
+        if size > self.max_anomalies:
+            logger.info(f"Result with {size} anomalies is too large for the in-memory cache.")
+            return
+        with self._lock:
+            if key in self._entries:
+                self._anomalies -= len(self._entries.pop(key).get("anomalies", []))
+            self._entries[key] = result
+            self._anomalies += size
+            while len(self._entries) > self.max_entries or self._anomalies > self.max_anomalies:
+                _, evicted = self._entries.popitem(last=False)
+                self._anomalies -= len(evicted.get("anomalies", []))
+                self.evictions += 1
+
+    def _path(self, key):
+        return self.directory / f"{key}.json.gz"
+
+    def _read_disk(self, key):
+        if self.directory is None or not self._path(key).exists():
+            return None
+        try:
+            with gzip.open(self._path(key), 'rt', encoding='utf-8') as cached:
+                return json.load(cached)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable cache file {self._path(key)}: {e}")
+            return None
+
+    def _write_disk(self, key, result):
+        if self.directory is None:
+            return
+        tmp_path = self._path(key).with_suffix('.tmp')
+        try:
+            with gzip.open(tmp_path, 'wt', encoding='utf-8') as cached:
+                json.dump(result, cached)
+            os.replace(tmp_path, self._path(key))
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning(f"Could not write cache file {self._path(key)}: {e}")
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "anomalies": self._anomalies,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,134 @@
+import asyncio
+import json
+import logging
+import os
+from threading import Lock
+
+import pandas as pd
+
+from conflict_engine import ConflictTracker
+from dos_windows import DOS_WINDOW_DETECTION, WindowTracker
+from geo_detection import GEO_DETECTION, GeoTracker
+from anomaly_detector import prepare_frame, score_rows, assemble_anomalies
+
+logger = logging.getLogger(__name__)
+
+# --- Streaming Settings ---
+# Records scored together when a client sends a long NDJSON body
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", "500"))
+# Anomalies queued per subscriber before the oldest are dropped for a slow client
+SUBSCRIBER_QUEUE_SIZE = int(os.getenv("SUBSCRIBER_QUEUE_SIZE", "1000"))
+# Invalid NDJSON lines described in a /stream/sessions response (the rest are only counted)
+STREAM_MAX_REPORTED_ERRORS = int(os.getenv("STREAM_MAX_REPORTED_ERRORS", "100"))
+
+
+# JSON values a record field may hold; nested objects and arrays never reach the trackers
+_SCALAR_TYPES = (str, int, float, bool, type(None))
+
+
+def _check_record(record, what):
+    """
+    Returns record if it is a JSON object of scalar fields; raises ValueError
+    otherwise, before any of it reaches the shared per-user state (an
+    unhashable user_id would fail half-way through the tracker updates).
+    """
+    if not isinstance(record, dict):
+        raise ValueError(f"{what} is a JSON {type(record).__name__}, not an object.")
+    for field, value in record.items():
+        if not isinstance(value, _SCALAR_TYPES):
+            raise ValueError(f"{what}: field '{field}' is a JSON {type(value).__name__}, not a scalar.")
+    return record
+
+
+def parse_message(payload):
+    """
+    Parses one streamed message (str or bytes): a record object or a list of
+    them. Returns the list of records; raises ValueError for anything else.
+    """
+    message = json.loads(payload)
+    if isinstance(message, list):
+        return [_check_record(record, f"Record {position}") for position, record in enumerate(message)]
+    return [_check_record(message, "Message")]
+
+
+def parse_line(line):
+    """Parses one NDJSON line into a record; raises ValueError unless it is a JSON object."""
+    return _check_record(json.loads(line), "Line")
+
+
+class StreamDetector:
+    """
+    Scores session records as they arrive, one at a time or in micro-batches,
+    with the already-loaded models.
+
+    Conflict detection is incremental: the latest end_time seen for each user
+    is kept, and a new session conflicts when it starts before that time.
+    Records are expected in roughly start_time order per user (as chargers
+    report them); within a micro-batch they are ordered by start_time first.
+    Impossible travel is checked the same way, against each user's last
+    known session end and location, and IP/charger floods against the recent
+    sessions of each key.
+    """
+
+    def __init__(self, standardize):
+        self._standardize = standardize
+        self._conflicts = ConflictTracker()
+        self._geo = GeoTracker() if GEO_DETECTION else None
+        self._windows = WindowTracker() if DOS_WINDOW_DETECTION else None
+        self._lock = Lock()
+        self.sessions_scored = 0
+
+    @property
+    def tracked_users(self):
+        return len(self._conflicts)
+
+    def score_records(self, records):
+        """Scores a list of record dicts; returns the anomaly dicts for them."""
+        if not records:
+            return []
+        df = self._standardize(pd.DataFrame.from_records(records))
+        prepare_frame(df)
+        info_messages = []
+        dos_mask, fraud_mask = score_rows(df, info_messages)
+        if info_messages:
+            logger.debug(f"Stream scoring notes: {info_messages}")
+
+        # The end-time state is shared by every client, so updates are serialized
+        with self._lock:
+            conflict_mask = self._conflict_mask(df)
+            geo = self._geo.update(df) if self._geo is not None else None
+            windows = self._windows.update(df) if self._windows is not None else None
+            self.sessions_scored += len(df)
+        return assemble_anomalies(df, dos_mask, fraud_mask, conflict_mask, geo, windows)
+
+    def _conflict_mask(self, df):
+        """Flags sessions starting before their user's latest known end_time, then updates it."""
+        flags = self._conflicts.update(df['user_id'], df['start_time'], df['end_time'])
+        return pd.Series(flags, index=df.index)
+
+
+class AnomalyBroadcaster:
+    """Fans detected anomalies out to subscribed clients, each with its own bounded queue."""
+
+    def __init__(self):
+        self._subscribers = set()
+
+    @property
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+    def subscribe(self):
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        self._subscribers.discard(queue)
+
+    def publish(self, anomalies):
+        for queue in self._subscribers:
+            for anomaly in anomalies:
+                if queue.full():
+                    # A slow subscriber loses its oldest anomalies rather than stalling detection
+                    queue.get_nowait()
+                queue.put_nowait(anomaly)
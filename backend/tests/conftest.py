@@ -0,0 +1,31 @@
+import os
+import sys
+from pathlib import Path
+
+# Settings read at import time: score on the thread pool (tests start their
+# own pool where they need one) and keep background jobs in memory
+os.environ.setdefault("DETECTION_WORKERS", "0")
+os.environ.setdefault("JOB_STORE", "memory")
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+import pandas as pd
+import pytest
+
+SAMPLE_CSV = BACKEND_DIR.parent / 'ev-anomaly-detection' / 'data' / 'ev_charging_data.csv'
+
+
+@pytest.fixture
+def sessions():
+    """The first rows of the bundled sample, standardized."""
+    from column_resolver import standardize_columns
+    return standardize_columns(pd.read_csv(SAMPLE_CSV, nrows=200))
+
+
+@pytest.fixture
+def sample_csv():
+    """The header and first 300 rows of the bundled sample, as uploaded bytes."""
+    with open(SAMPLE_CSV, "rb") as sample:
+        return b"".join(sample.readline() for _ in range(301))
@@ -0,0 +1,83 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+from admission import AdmissionController, AdmissionMiddleware
+
+
+@pytest.fixture
+def client(monkeypatch):
+    """The API with MongoDB unreachable and one detection slot with a short queue and timeout."""
+    import main
+    monkeypatch.setattr(main, "connect_mongo", lambda: None)
+    # The middleware holds the same controller, so it is reset in place
+    for name, value in {"_semaphore": asyncio.Semaphore(1), "max_queued": 1, "timeout": 0.2,
+                        "waiting": {"request": 0, "job": 0}, "_hold_seconds": None}.items():
+        monkeypatch.setattr(main.admission, name, value)
+    with TestClient(main.app) as client:
+        yield client
+
+
+def _fill_slots(controller):
+    # A semaphore at zero reads as every slot taken
+    controller._semaphore = asyncio.Semaphore(0)
+
+
+def test_full_queue_is_429(client, sample_csv):
+    import main
+    _fill_slots(main.admission)
+    main.admission.waiting["request"] = main.admission.max_queued
+    response = client.post("/predict/", files={"file": ("sessions.csv", sample_csv)})
+    assert response.status_code == 429
+    assert int(response.headers["retry-after"]) >= 1
+
+
+def test_slot_wait_timeout_is_503(client, sample_csv):
+    import main
+    _fill_slots(main.admission)
+    response = client.post("/predict/", files={"file": ("sessions.csv", sample_csv)})
+    assert response.status_code == 503
+    assert int(response.headers["retry-after"]) >= 1
+    assert main.admission.waiting["request"] == 0
+
+
+def test_slot_is_held_for_detection_only(client, sample_csv):
+    import main
+    response = client.post("/predict/", files={"file": ("sessions.csv", sample_csv)})
+    assert response.status_code == 200, response.text
+    assert main.admission.active == 0
+    assert main.admission._hold_seconds is not None
+
+
+def _call_middleware(controller):
+    """Sends a POST /predict/ through the middleware; returns the active slot counts the app saw and the status sent."""
+    seen, sent = [], []
+
+    async def app(scope, receive, send):
+        seen.append(controller.active)
+        await receive()
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": "POST", "path": "/predict/", "headers": []}
+    asyncio.run(AdmissionMiddleware(app, controller)(scope, receive, send))
+    return seen, sent[0]["status"] if sent else None
+
+
+def test_middleware_holds_no_slot_while_the_body_is_received():
+    seen, status = _call_middleware(AdmissionController(slots=1))
+    assert seen == [0]
+    assert status is None
+
+
+def test_middleware_rejects_a_full_queue_without_reading_the_body():
+    controller = AdmissionController(slots=1, max_queued=0)
+    _fill_slots(controller)
+    seen, status = _call_middleware(controller)
+    assert seen == []
+    assert status == 429
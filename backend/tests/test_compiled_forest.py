@@ -0,0 +1,101 @@
+import numpy as np
+import pytest
+from sklearn.ensemble import IsolationForest
+from sklearn.preprocessing import StandardScaler
+
+from compiled_forest import CompiledIsolationForest
+
+RANDOM_ROWS = 200_000
+
+
+def _fitted_pair(n_features, seed, **forest):
+    rng = np.random.default_rng(seed)
+    train = rng.normal(loc=rng.uniform(-50, 50, n_features), scale=rng.uniform(0.1, 30, n_features),
+                       size=(2000, n_features))
+    scaler = StandardScaler().fit(train)
+    model = IsolationForest(random_state=seed, **forest).fit(scaler.transform(train))
+    return model, scaler, train
+
+
+PAIRS = {
+    "two_features": lambda: _fitted_pair(2, 0, n_estimators=100),
+    "subsampled_features": lambda: _fitted_pair(4, 1, n_estimators=50, max_features=2),
+    "small_samples": lambda: _fitted_pair(3, 2, n_estimators=30, max_samples=64, contamination=0.05),
+}
+
+
+@pytest.fixture(params=sorted(PAIRS))
+def pair(request):
+    model, scaler, train = PAIRS[request.param]()
+    return model, scaler, CompiledIsolationForest(model, scaler), train
+
+
+def _assert_same(model, scaler, compiled, X):
+    scaled = scaler.transform(X)
+    np.testing.assert_array_equal(compiled.score_samples(X), model.score_samples(scaled))
+    np.testing.assert_array_equal(compiled.decision_function(X), model.decision_function(scaled))
+    np.testing.assert_array_equal(compiled.predict(X), model.predict(scaled))
+
+
+def test_random_rows_match_sklearn(pair):
+    model, scaler, compiled, train = pair
+    rng = np.random.default_rng(42)
+    low, high = train.min(axis=0), train.max(axis=0)
+    span = high - low
+    X = rng.uniform(low - span, high + span, size=(RANDOM_ROWS, train.shape[1]))
+    _assert_same(model, scaler, compiled, X)
+
+
+def test_extreme_values_match_sklearn(pair):
+    model, scaler, compiled, train = pair
+    extremes = np.array([0.0, -0.0, 5e-324, -5e-324, 1e-300, -1e-300, 1e300, -1e300,
+                         np.finfo(np.float64).max / 1e10, -np.finfo(np.float64).max / 1e10])
+    n_features = train.shape[1]
+    grid = np.meshgrid(*[extremes] * min(n_features, 2), indexing='ij')
+    X = np.tile(train.mean(axis=0), (grid[0].size, 1))
+    for f, axis in enumerate(grid):
+        X[:, f] = axis.ravel()
+    _assert_same(model, scaler, compiled, X)
+
+
+def test_split_boundaries_match_sklearn(pair):
+    """Every fused threshold, and the doubles just below and above it, on each feature."""
+    model, scaler, compiled, train = pair
+    rng = np.random.default_rng(7)
+    for f, edges in enumerate(compiled._bin_edges):
+        edges = edges[np.isfinite(edges)]
+        values = np.concatenate([np.nextafter(edges, -np.inf), edges, np.nextafter(edges, np.inf)])
+        X = train[rng.integers(0, len(train), size=len(values))].copy()
+        X[:, f] = values
+        _assert_same(model, scaler, compiled, X)
+
+
+def test_decision_threshold_matches_sklearn(pair):
+    """With the offset set to a row's exact score (and to the next double above it)."""
+    model, scaler, compiled, train = pair
+    scores = np.sort(compiled.score_samples(train))
+    threshold = scores[len(scores) // 2]
+    for offset in (threshold, np.nextafter(threshold, np.inf)):
+        model.offset_ = compiled.offset = offset
+        assert (compiled.decision_function(train) == 0).any() == (offset == threshold)
+        _assert_same(model, scaler, compiled, train)
+
+
+def test_bundled_models_match_sklearn():
+    import anomaly_detector
+    registry = anomaly_detector.model_registry
+    rng = np.random.default_rng(0)
+    for prefix in ("dos", "fraud"):
+        scaler, model = registry.get_many(f"{prefix}_scaler", f"{prefix}_model")
+        compiled = CompiledIsolationForest(model, scaler)
+        spread = np.where(scaler.scale_ > 0, scaler.scale_, 1.0)
+        X = rng.normal(scaler.mean_, 3 * spread, size=(RANDOM_ROWS, model.n_features_in_))
+        _assert_same(model, scaler, compiled, X)
+
+
+def test_rejects_non_finite_input(pair):
+    _, _, compiled, train = pair
+    X = train[:3].copy()
+    X[1, 0] = np.nan
+    with pytest.raises(ValueError):
+        compiled.score_samples(X)
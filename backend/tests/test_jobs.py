@@ -0,0 +1,129 @@
+import asyncio
+import io
+import os
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+import jobs
+
+POLL_SECONDS = 30
+
+
+@pytest.fixture
+def client(monkeypatch):
+    """The API with MongoDB unreachable, so jobs run against the InMemoryJobStore."""
+    import main
+    monkeypatch.setattr(main, "connect_mongo", lambda: None)
+    with TestClient(main.app) as client:
+        assert isinstance(main.job_store, jobs.InMemoryJobStore)
+        yield client
+
+
+def _submit(client, content, filename="sessions.csv"):
+    response = client.post("/jobs/", files={"file": (filename, content)})
+    assert response.status_code == 202, response.text
+    return response.json()["job_id"]
+
+
+def _wait(client, job_id):
+    deadline = time.monotonic() + POLL_SECONDS
+    while time.monotonic() < deadline:
+        job = client.get(f"/jobs/{job_id}").json()
+        if job["status"] in jobs.FINISHED_STATUSES:
+            return job
+        time.sleep(0.05)
+    pytest.fail(f"Job {job_id} did not finish within {POLL_SECONDS}s")
+
+
+def _all_pages(client, job_id, limit):
+    anomalies, cursor, pages = [], 0, 0
+    while cursor is not None:
+        page = client.get(f"/jobs/{job_id}/anomalies", params={"cursor": cursor, "limit": limit}).json()
+        assert len(page["anomalies"]) <= limit
+        anomalies.extend(page["anomalies"])
+        cursor = page["next_cursor"]
+        pages += 1
+    return anomalies, pages
+
+
+def test_submit_poll_and_page(client, sample_csv):
+    job_id = _submit(client, sample_csv)
+    job = _wait(client, job_id)
+    assert job["status"] == "completed"
+    assert job["total_sessions"] == job["rows_processed"] == 300
+    assert job["anomalies_found"] > 7
+
+    anomalies, pages = _all_pages(client, job_id, limit=7)
+    assert len(anomalies) == job["anomalies_found"]
+    assert pages == -(-len(anomalies) // 7)
+    assert len({(a["session_id"], a["anomaly_type"]) for a in anomalies}) == len(anomalies)
+
+    # Same results as scoring the file synchronously
+    predicted = client.post("/predict/", files={"file": ("sessions.csv", sample_csv)}).json()
+    assert anomalies == predicted["anomalies"]
+
+
+def test_cursor_resumes_where_the_page_ended(client, sample_csv):
+    job_id = _submit(client, sample_csv)
+    _wait(client, job_id)
+    first = client.get(f"/jobs/{job_id}/anomalies", params={"limit": 5}).json()
+    rest = client.get(f"/jobs/{job_id}/anomalies", params={"cursor": first["next_cursor"], "limit": 5}).json()
+    everything, _ = _all_pages(client, job_id, limit=1000)
+    assert first["anomalies"] + rest["anomalies"] == everything[:10]
+
+
+def test_unknown_job_is_404(client):
+    assert client.get("/jobs/missing").status_code == 404
+    assert client.get("/jobs/missing/anomalies").status_code == 404
+
+
+def test_unsupported_format_is_400(client):
+    response = client.post("/jobs/", files={"file": ("sessions.txt", b"a,b\n1,2\n")})
+    assert response.status_code == 400
+
+
+def test_failed_job_reports_error_and_has_no_results(client):
+    job_id = _submit(client, b"\x00\x01 not a csv", filename="broken.parquet")
+    job = _wait(client, job_id)
+    assert job["status"] == "failed"
+    assert job["error"]
+    assert client.get(f"/jobs/{job_id}/anomalies").status_code == 409
+
+
+def test_full_job_queue_is_429(client, sample_csv, monkeypatch):
+    import main
+    monkeypatch.setattr(main.admission, "max_queued_jobs", 0)
+    response = client.post("/jobs/", files={"file": ("sessions.csv", sample_csv)})
+    assert response.status_code == 429
+    assert int(response.headers["retry-after"]) >= 1
+
+
+def test_spooled_upload_keeps_its_format_suffix(sample_csv):
+    class Upload:
+        filename = "export.CSV.GZ"
+        file = io.BytesIO(sample_csv)
+
+    path = asyncio.run(jobs.spool_upload(Upload))
+    try:
+        assert path.endswith(".csv.gz")
+        with open(path, "rb") as spooled:
+            assert spooled.read() == sample_csv
+    finally:
+        os.unlink(path)
+
+
+def test_in_memory_store_evicts_oldest_finished_jobs():
+    store = jobs.InMemoryJobStore(max_finished=2)
+    ids = []
+    for _ in range(4):
+        job = jobs.new_job("sessions.csv")
+        store.create(job)
+        store.add_anomalies(job["job_id"], [{"session_id": "s"}])
+        ids.append(job["job_id"])
+    for job_id in ids[:3]:
+        store.update(job_id, status="completed")
+    assert store.get(ids[0]) is None
+    assert store.page_anomalies(ids[0], 0, 10) == ([], None)
+    assert [store.get(job_id)["status"] for job_id in ids[1:]] == ["completed", "completed", "queued"]
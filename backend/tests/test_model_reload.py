@@ -0,0 +1,75 @@
+import asyncio
+import os
+import shutil
+import time
+
+import joblib
+import pytest
+
+import anomaly_detector
+import detection_pool
+from model_registry import MODEL_FILES, ModelRegistry
+
+CHECK_INTERVAL = 0.01
+
+
+@pytest.fixture
+def registry(tmp_path, monkeypatch):
+    """A registry over a private copy of the models, installed before any worker forks."""
+    models = tmp_path / "models"
+    shutil.copytree(anomaly_detector.model_dir, models)
+    registry = ModelRegistry(models, check_interval=CHECK_INTERVAL)
+    monkeypatch.setattr(anomaly_detector, "model_registry", registry)
+    return registry
+
+
+@pytest.fixture
+def pool(registry, monkeypatch):
+    monkeypatch.setattr(detection_pool, "DETECTION_WORKERS", 1)
+    detection_pool.start_pool()
+    yield
+    detection_pool.shutdown_pool()
+
+
+def _publish_new_version(registry):
+    """Rewrites one artifact with different bytes, as a retrain would."""
+    path = registry.model_dir / MODEL_FILES["dos_scaler"]
+    scaler = joblib.load(path)
+    scaler.retrained = True
+    joblib.dump(scaler, path)
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    time.sleep(2 * CHECK_INTERVAL)
+
+
+def _detect(frame):
+    return asyncio.run(detection_pool.detect_in_chunks(iter([frame.copy()])))
+
+
+def test_version_follows_hot_reload_without_scoring(registry):
+    before = registry.version
+    _publish_new_version(registry)
+    assert registry.version != before
+
+
+def test_pool_reports_the_version_it_scored_with(registry, pool, sessions):
+    before = registry.version
+    assert _detect(sessions)["model_version"] == before
+
+    _publish_new_version(registry)
+    after = registry.version
+    assert after != before
+    result = _detect(sessions)
+    assert result["model_version"] == after
+    assert result["total_sessions"] == len(sessions)
+
+
+def test_mixed_versions_are_not_attributed(registry, sessions):
+    half = len(sessions) // 2
+    chunks = [
+        anomaly_detector.score_chunk(sessions.iloc[:half].copy(), 0),
+        anomaly_detector.score_chunk(sessions.iloc[half:].copy(), half),
+    ]
+    assert anomaly_detector.combine_chunk_results(chunks)["model_version"] == registry.version
+    chunks[1]["model_version"] = "another-version"
+    assert anomaly_detector.combine_chunk_results(chunks)["model_version"] is None
@@ -0,0 +1,382 @@
+"""
+Retrains the DoS and fraud models on the full session history.
+
+    python backend/train_models.py exports/2024/ "exports/2025/*.parquet"
+    python backend/train_models.py --mongo --collection sessions --workers 8
+    python backend/train_models.py exports/ --sample-size 500000 --no-activate
+
+Sessions are streamed from upload files (any /predict/ upload format;
+directories and globs are expanded) or from a MongoDB collection of raw
+session documents, in chunks of --chunk-size rows, so the history never has
+to fit in one DataFrame. Files are read on a process pool, one file per
+task. For each model:
+
+1. Scale: a StandardScaler is fitted incrementally with partial_fit over
+   every row that has numeric values for the model's features. The scalers
+   of the workers are merged into one, as if a single scaler had seen all
+   the rows.
+2. Sample: a uniform reservoir sample of --sample-size rows is kept
+   alongside. Worker samples are merged in proportion to the rows each saw.
+3. Fit: the IsolationForest is fitted on the scaled sample with the
+   notebook's parameters, building its trees on --jobs cores.
+
+Artifacts are written to a new version directory, <models>/versions/<version>/,
+with a manifest.json describing the data, parameters and file hashes. Unless
+--no-activate is given, <models>/manifest.json is then replaced by a copy of
+it, which points the backend's ModelRegistry at the new files; running
+instances pick them up on their next reload check. Rolling back means
+copying an older version's manifest.json over it.
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timezone
+from pathlib import Path
+
+import joblib
+import numpy as np
+import pandas as pd
+import sklearn
+from sklearn.ensemble import IsolationForest
+from sklearn.preprocessing import StandardScaler
+
+# Make the backend modules importable the same way main.py does
+backend_dir = os.path.dirname(os.path.abspath(__file__))
+if backend_dir not in sys.path:
+    sys.path.insert(0, backend_dir)
+
+from anomaly_detector import DOS_FEATURES, FRAUD_FEATURES, model_dir
+from anomaly_store import MONGO_URI
+from column_resolver import resolve_column_names
+from detection_pool import DETECTION_WORKERS
+from metrics import peak_rss_bytes
+from model_registry import MANIFEST_FILE, MODEL_FILES
+from upload_formats import PREDICT_CHUNK_SIZE, SUPPORTED_UPLOADS, expand_inputs, read_upload_file, upload_format
+
+logger = logging.getLogger(__name__)
+
+# --- Training Settings ---
+# Rows each IsolationForest is fitted on, sampled uniformly from the whole history
+TRAIN_SAMPLE_SIZE = int(os.getenv("TRAIN_SAMPLE_SIZE", "200000"))
+# Trees and expected anomaly share, as in the exploration notebook
+TRAIN_N_ESTIMATORS = int(os.getenv("TRAIN_N_ESTIMATORS", "100"))
+TRAIN_CONTAMINATION = float(os.getenv("TRAIN_CONTAMINATION", "0.16"))
+TRAIN_RANDOM_STATE = int(os.getenv("TRAIN_RANDOM_STATE", "42"))
+# Cores used to build the trees; -1 uses all of them
+TRAIN_JOBS = int(os.getenv("TRAIN_JOBS", "-1"))
+
+# Model -> the features it is trained on, in the order the backend scores them
+MODELS = {'dos': DOS_FEATURES, 'fraud': FRAUD_FEATURES}
+
+
+# --- Inputs ---
+def mongo_chunks(uri, database, collection, chunk_size):
+    """Yields standardized chunks of the session documents in a Mongo collection."""
+    import pymongo
+
+    client = pymongo.MongoClient(uri, serverSelectionTimeoutMS=5000)
+    try:
+        rows = []
+        for doc in client[database][collection].find({}, {"_id": 0}, batch_size=chunk_size):
+            rows.append(doc)
+            if len(rows) >= chunk_size:
+                yield _standardized(rows)
+                rows = []
+        if rows:
+            yield _standardized(rows)
+    finally:
+        client.close()
+
+
+def _standardized(rows):
+    df = pd.DataFrame(rows)
+    df.columns = resolve_column_names(df.columns)
+    return df
+
+
+# --- Sampling ---
+class Reservoir:
+    """
+    A uniform sample without replacement of at most `size` rows from a stream
+    of 2-D blocks (Algorithm R, one vectorized draw per block).
+    """
+
+    def __init__(self, size, n_features, rng):
+        self.size = size
+        self.rng = rng
+        self.rows = np.empty((0, n_features))
+        self.seen = 0
+
+    def add(self, block):
+        fill = min(self.size - len(self.rows), len(block))
+        if fill > 0:
+            self.rows = np.concatenate([self.rows, block[:fill]])
+        rest = block[fill:]
+        if len(rest):
+            # Row i of the stream replaces a random slot with probability size / (i + 1)
+            positions = self.seen + fill + np.arange(len(rest))
+            slots = self.rng.integers(0, positions + 1)
+            keep = slots < self.size
+            # Later rows win when two draw the same slot, as they would one at a time
+            self.rows[slots[keep]] = rest[keep]
+        self.seen += len(block)
+
+    @classmethod
+    def merge(cls, reservoirs, size, rng):
+        """
+        One reservoir over the union of the streams: how many rows come from
+        each is drawn from a multivariate hypergeometric over the rows each saw.
+        """
+        n_features = reservoirs[0].rows.shape[1]
+        merged = cls(size, n_features, rng)
+        seen = np.array([reservoir.seen for reservoir in reservoirs], dtype=np.int64)
+        merged.seen = int(seen.sum())
+        if merged.seen == 0:
+            return merged
+        counts = rng.multivariate_hypergeometric(seen, min(size, merged.seen))
+        parts = [reservoir.rows[rng.choice(len(reservoir.rows), count, replace=False)]
+                 for reservoir, count in zip(reservoirs, counts) if count]
+        merged.rows = np.concatenate(parts)
+        return merged
+
+
+def merge_scalers(scalers):
+    """
+    Combines StandardScalers fitted on disjoint data into the one partial_fit
+    would have produced on all of it (parallel mean/variance update).
+    """
+    fitted = [scaler for scaler in scalers if getattr(scaler, 'n_samples_seen_', 0)]
+    if len(fitted) <= 1:
+        return fitted[0] if fitted else scalers[0]
+    merged = fitted[0]
+    n, mean, var = merged.n_samples_seen_, merged.mean_, merged.var_
+    for scaler in fitted[1:]:
+        m = scaler.n_samples_seen_
+        total = n + m
+        delta = scaler.mean_ - mean
+        mean = mean + delta * m / total
+        var = (n * var + m * scaler.var_) / total + delta ** 2 * n * m / total ** 2
+        n = total
+    merged.n_samples_seen_ = n
+    merged.mean_ = mean
+    merged.var_ = var
+    # As partial_fit does: constant features are left unscaled
+    merged.scale_ = np.where(var > 10 * np.finfo(var.dtype).eps, np.sqrt(var), 1.0)
+    return merged
+
+
+# --- Accumulation ---
+class TrainingData:
+    """Per model: an incrementally fitted scaler and a reservoir sample of the raw feature rows."""
+
+    def __init__(self, sample_size, seed):
+        rng = np.random.default_rng(seed)
+        self.scalers = {name: StandardScaler() for name in MODELS}
+        self.samples = {name: Reservoir(sample_size, len(features), rng) for name, features in MODELS.items()}
+        self.chunks = 0
+
+    def add(self, df):
+        self.chunks += 1
+        for name, features in MODELS.items():
+            if not all(col in df.columns for col in features):
+                continue
+            # The same rows _score_model scores: numeric values for every feature
+            X = df[features].apply(pd.to_numeric, errors='coerce').dropna().astype(np.float64)
+            if X.empty:
+                continue
+            # A DataFrame keeps the feature names on the scaler, as in the notebook
+            self.scalers[name].partial_fit(X)
+            self.samples[name].add(X.to_numpy())
+
+    def rows(self, name):
+        return int(getattr(self.scalers[name], 'n_samples_seen_', 0))
+
+    @classmethod
+    def merge(cls, parts, sample_size, seed):
+        merged = cls(sample_size, seed)
+        rng = np.random.default_rng(seed)
+        for name in MODELS:
+            merged.scalers[name] = merge_scalers([part.scalers[name] for part in parts])
+            merged.samples[name] = Reservoir.merge([part.samples[name] for part in parts], sample_size, rng)
+        merged.chunks = sum(part.chunks for part in parts)
+        return merged
+
+
+def scan_file(path, chunk_size, sample_size, seed):
+    """Worker task: the TrainingData of one upload file."""
+    data = TrainingData(sample_size, seed)
+    for chunk in read_upload_file(path, upload_format(path), resolve_column_names, chunk_size):
+        data.add(chunk)
+    return data
+
+
+def scan_files(paths, workers, chunk_size, sample_size, seed):
+    """Scans the files on a process pool (in-process for one worker) and merges their data."""
+    parts = []
+    if workers <= 1 or len(paths) == 1:
+        for i, path in enumerate(paths):
+            parts.append(scan_file(path, chunk_size, sample_size, seed + i))
+            print(f"  scanned {path}")
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(paths))) as pool:
+            futures = {pool.submit(scan_file, path, chunk_size, sample_size, seed + i): path
+                       for i, path in enumerate(paths)}
+            for future in as_completed(futures):
+                parts.append(future.result())
+                print(f"  scanned {futures[future]}")
+    return TrainingData.merge(parts, sample_size, seed)
+
+
+# --- Fitting ---
+def fit_models(data, n_estimators, contamination, n_jobs, seed):
+    """Fits each model's IsolationForest on its scaled sample; returns the artifacts by MODEL_FILES name."""
+    artifacts = {}
+    for name, features in MODELS.items():
+        sample = data.samples[name]
+        if sample.seen == 0:
+            raise ValueError(f"No rows with numeric {features} to train the {name} model on.")
+        scaler = data.scalers[name]
+        X = scaler.transform(pd.DataFrame(sample.rows, columns=features))
+        model = IsolationForest(n_estimators=n_estimators, contamination=contamination,
+                                random_state=seed, n_jobs=n_jobs)
+        model.fit(X)
+        artifacts[f"{name}_model"] = model
+        artifacts[f"{name}_scaler"] = scaler
+    return artifacts
+
+
+# --- Artifacts ---
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _write_json(path, data):
+    tmp = path.with_name(path.name + '.tmp')
+    tmp.write_text(json.dumps(data, indent=2))
+    os.replace(tmp, path)
+
+
+def _new_version_dir(models_dir):
+    """
+    Creates the directory of a new version named after the current UTC second,
+    with a -2, -3, ... suffix when runs finish within the same second. mkdir
+    claims the name atomically, so concurrent runs never share a directory.
+    """
+    base = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+    (models_dir / 'versions').mkdir(parents=True, exist_ok=True)
+    for attempt in range(1, 1000):
+        version = base if attempt == 1 else f"{base}-{attempt}"
+        version_dir = models_dir / 'versions' / version
+        try:
+            version_dir.mkdir()
+        except FileExistsError:
+            continue
+        return version, version_dir
+    raise FileExistsError(f"No free version directory for {base} in {models_dir / 'versions'}")
+
+
+def write_version(artifacts, models_dir, manifest, activate=True):
+    """
+    Writes the artifacts and their manifest to a new version directory and,
+    if activate, makes it the one the backend loads. Returns the manifest.
+    """
+    models_dir = Path(models_dir)
+    version, version_dir = _new_version_dir(models_dir)
+    files, hashes = {}, {}
+    for name, filename in MODEL_FILES.items():
+        path = version_dir / filename
+        joblib.dump(artifacts[name], path)
+        files[name] = path.relative_to(models_dir).as_posix()
+        hashes[name] = _sha256(path)
+    manifest = {"version": version, "files": files, "sha256": hashes, **manifest}
+    _write_json(version_dir / MANIFEST_FILE, manifest)
+    if activate:
+        # Written under a temporary name and renamed, so the registry never reads half a manifest
+        _write_json(models_dir / MANIFEST_FILE, manifest)
+    return manifest
+
+
+def _mb(value):
+    return round(value / 2 ** 20, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('inputs', nargs='*', help=f"Files, directories or globs of {SUPPORTED_UPLOADS} files")
+    parser.add_argument('--mongo', action='store_true', help="Train on session documents in MongoDB instead of files")
+    parser.add_argument('--mongo-uri', default=MONGO_URI)
+    parser.add_argument('--database', default="ev_anomaly_db")
+    parser.add_argument('--collection', default="sessions", help="Collection of raw session documents")
+    parser.add_argument('--models-dir', default=str(model_dir), help="Where versions and the active manifest.json go")
+    parser.add_argument('--workers', type=int, default=DETECTION_WORKERS or 1, help="Processes reading files")
+    parser.add_argument('--jobs', type=int, default=TRAIN_JOBS, help="Cores per IsolationForest fit (-1: all)")
+    parser.add_argument('--chunk-size', type=int, default=PREDICT_CHUNK_SIZE)
+    parser.add_argument('--sample-size', type=int, default=TRAIN_SAMPLE_SIZE)
+    parser.add_argument('--n-estimators', type=int, default=TRAIN_N_ESTIMATORS)
+    parser.add_argument('--contamination', type=float, default=TRAIN_CONTAMINATION)
+    parser.add_argument('--seed', type=int, default=TRAIN_RANDOM_STATE)
+    parser.add_argument('--no-activate', action='store_true', help="Write the version without switching the backend to it")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    if args.mongo == bool(args.inputs):
+        parser.error("give either input files or --mongo")
+
+    timings = {}
+    start = time.perf_counter()
+    if args.mongo:
+        sources = [f"mongodb:{args.database}.{args.collection}"]
+        print(f"Scanning {sources[0]}...")
+        data = TrainingData(args.sample_size, args.seed)
+        for chunk in mongo_chunks(args.mongo_uri, args.database, args.collection, args.chunk_size):
+            data.add(chunk)
+    else:
+        sources = expand_inputs(args.inputs)
+        if not sources:
+            raise SystemExit(f"No {SUPPORTED_UPLOADS} files found in {args.inputs}.")
+        print(f"Scanning {len(sources)} file(s) on {min(args.workers, len(sources))} worker(s)...")
+        data = scan_files(sources, args.workers, args.chunk_size, args.sample_size, args.seed)
+    timings["scan"] = time.perf_counter() - start
+    for name in MODELS:
+        print(f"  {name}: {data.rows(name):,} rows, {len(data.samples[name].rows):,} sampled")
+
+    start = time.perf_counter()
+    artifacts = fit_models(data, args.n_estimators, args.contamination, args.jobs, args.seed)
+    timings["fit"] = time.perf_counter() - start
+
+    own, children = peak_rss_bytes()
+    manifest = {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "sources": sources,
+        "models": {
+            name: {"features": features, "rows": data.rows(name), "sample_rows": len(data.samples[name].rows)}
+            for name, features in MODELS.items()
+        },
+        "params": {
+            "n_estimators": args.n_estimators, "contamination": args.contamination,
+            "sample_size": args.sample_size, "random_state": args.seed,
+        },
+        "sklearn_version": sklearn.__version__,
+        "training": {
+            "scan_seconds": round(timings["scan"], 2), "fit_seconds": round(timings["fit"], 2),
+            "peak_rss_mb": _mb(own), "peak_worker_rss_mb": _mb(children),
+        },
+    }
+    manifest = write_version(artifacts, args.models_dir, manifest, activate=not args.no_activate)
+    print(f"Scan {timings['scan']:.1f}s, fit {timings['fit']:.1f}s; "
+          f"peak memory {_mb(own):,.0f} MB (workers {_mb(children):,.0f} MB).")
+    state = "written" if args.no_activate else "written and activated"
+    print(f"Version {manifest['version']} {state} in {args.models_dir}.")
+
+
+if __name__ == '__main__':
+    main()
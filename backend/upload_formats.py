@@ -0,0 +1,193 @@
+"""
+Readers for the upload formats /predict/ and /jobs/ accept: CSV (plain,
+gzip or zstd compressed), Parquet and Arrow IPC/Feather.
+
+Each reader resolves the file's header to the standard column names first
+and then reads only the columns detection uses, so wide exports never
+materialize columns like duration or anomaly_type. Parquet and Arrow
+carry typed columns, so their timestamps and numbers arrive already parsed.
+"""
+import glob
+import logging
+import os
+from pathlib import Path
+
+import pandas as pd
+
+from dos_windows import DOS_WINDOW_DETECTION
+from geo_detection import GEO_DETECTION, GEO_SOURCE_COLUMNS
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet as pq
+except ImportError:  # Columnar uploads are optional
+    pa = None
+
+logger = logging.getLogger(__name__)
+
+# Read user_id as categorical and integer metrics in the smallest integer type; 0 keeps pandas' defaults
+COMPACT_DTYPES = os.getenv("COMPACT_DTYPES", "1") != "0"
+# Rows per chunk when streaming an upload through detection
+PREDICT_CHUNK_SIZE = int(os.getenv("PREDICT_CHUNK_SIZE", "100000"))
+
+# Standard columns read from uploads; everything else is skipped
+DETECTION_COLUMNS = [
+    'session_id', 'user_id', 'start_time', 'end_time',
+    'cpu_usage_percent', 'packets_per_sec', 'energy_kWh', 'amount_INR',
+] + (GEO_SOURCE_COLUMNS if GEO_DETECTION else ['ip_address', 'charger_id'] if DOS_WINDOW_DETECTION else [])
+
+# File name suffix -> (format, compression)
+UPLOAD_FORMATS = {
+    '.csv': ('csv', None),
+    '.csv.gz': ('csv', 'gzip'),
+    '.csv.gzip': ('csv', 'gzip'),
+    '.csv.zst': ('csv', 'zstd'),
+    '.csv.zstd': ('csv', 'zstd'),
+    '.parquet': ('parquet', None),
+    '.pq': ('parquet', None),
+    '.arrow': ('arrow', None),
+    '.feather': ('arrow', None),
+    '.ipc': ('arrow', None),
+}
+
+SUPPORTED_UPLOADS = "CSV (optionally .gz/.zst compressed), Parquet or Arrow/Feather"
+
+
+def upload_suffix(filename):
+    """Returns the UPLOAD_FORMATS suffix an upload's file name ends with, or None if unsupported."""
+    name = (filename or '').lower()
+    # Longest suffix first so '.csv.gz' wins over a bare extension
+    for suffix in sorted(UPLOAD_FORMATS, key=len, reverse=True):
+        if name.endswith(suffix):
+            return suffix
+    return None
+
+
+def upload_format(filename):
+    """Returns (format, compression) for an upload's file name, or None if unsupported."""
+    suffix = upload_suffix(filename)
+    return UPLOAD_FORMATS[suffix] if suffix is not None else None
+
+
+def expand_inputs(inputs):
+    """Returns the sorted, de-duplicated upload files named by paths, directories and globs."""
+    paths = set()
+    for item in inputs:
+        if os.path.isdir(item):
+            candidates = [str(path) for path in Path(item).iterdir() if path.is_file()]
+        elif os.path.isfile(item):
+            candidates = [item]
+        else:
+            candidates = glob.glob(item, recursive=True)
+        paths.update(os.path.abspath(path) for path in candidates if upload_format(path) is not None)
+    return sorted(paths)
+
+
+def _projection(raw_columns, resolve_column_names):
+    """Returns [(raw name, standard name)] for the raw columns detection uses."""
+    standard = resolve_column_names(raw_columns)
+    return [(raw, name) for raw, name in zip(raw_columns, standard) if name in DETECTION_COLUMNS]
+
+
+def _require_pyarrow(fmt):
+    if pa is None:
+        raise ValueError(f"{fmt.capitalize()} uploads need the pyarrow package, which is not installed.")
+
+
+def compact_dtypes(chunk):
+    """
+    Shrinks a chunk's columns without changing any value: user_id becomes
+    categorical and integer columns are downcast. Float metrics stay float64,
+    since float32 would change both the model inputs and the reported values.
+    """
+    for column in chunk.columns:
+        values = chunk[column]
+        if column == 'user_id':
+            if not isinstance(values.dtype, pd.CategoricalDtype):
+                chunk[column] = values.astype('category')
+        elif pd.api.types.is_integer_dtype(values) and not isinstance(values.dtype, pd.CategoricalDtype):
+            chunk[column] = pd.to_numeric(values, downcast='integer')
+    return chunk
+
+
+def _csv_chunks(file, compression, resolve_column_names, chunk_size):
+    header = pd.read_csv(file, encoding='utf-8', compression=compression, nrows=0).columns
+    file.seek(0)
+    projection = _projection(list(header), resolve_column_names)
+    keep = {raw for raw, _ in projection}
+    # Timestamps are parsed while reading instead of being held as strings first
+    times = [raw for raw, name in projection if name in ('start_time', 'end_time')] if COMPACT_DTYPES else []
+    reader = pd.read_csv(
+        file, encoding='utf-8', compression=compression, chunksize=chunk_size,
+        usecols=lambda column: column in keep, parse_dates=times,
+    )
+    standard_columns = None
+    for chunk in reader:
+        if standard_columns is None:
+            # usecols keeps the file's column order
+            names = dict(projection)
+            standard_columns = [names[raw] for raw in chunk.columns]
+        chunk.columns = standard_columns
+        yield chunk
+
+
+def _batches_to_frames(batches, projection):
+    for batch in batches:
+        chunk = batch.to_pandas()
+        chunk.columns = [name for _, name in projection]
+        yield chunk
+
+
+def _parquet_chunks(file, resolve_column_names, chunk_size):
+    _require_pyarrow('parquet')
+    parquet_file = pq.ParquetFile(file)
+    projection = _projection(parquet_file.schema_arrow.names, resolve_column_names)
+    batches = parquet_file.iter_batches(batch_size=chunk_size, columns=[raw for raw, _ in projection])
+    yield from _batches_to_frames(batches, projection)
+
+
+def _arrow_chunks(file, resolve_column_names, chunk_size):
+    _require_pyarrow('arrow')
+    try:
+        reader = pa.ipc.open_file(file)
+        batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+    except pa.ArrowInvalid:
+        # Not the file (Feather v2) layout; try the streaming IPC layout
+        file.seek(0)
+        reader = pa.ipc.open_stream(file)
+        batches = iter(reader)
+    projection = _projection(reader.schema.names, resolve_column_names)
+    indices = [reader.schema.get_field_index(raw) for raw, _ in projection]
+    # Writers choose the batch size; split oversized batches to bound chunk memory
+    sliced = (
+        batch.select(indices).slice(start, chunk_size)
+        for batch in batches
+        for start in range(0, max(batch.num_rows, 1), chunk_size)
+    )
+    yield from _batches_to_frames(sliced, projection)
+
+
+def read_upload_chunks(file, fmt, resolve_column_names, chunk_size):
+    """
+    Yields standardized DataFrame chunks of an upload holding only the
+    DETECTION_COLUMNS it has. `file` is a seekable binary file and `fmt`
+    the (format, compression) pair from upload_format.
+    """
+    kind, compression = fmt
+    if kind == 'csv':
+        chunks = _csv_chunks(file, compression, resolve_column_names, chunk_size)
+    elif kind == 'parquet':
+        chunks = _parquet_chunks(file, resolve_column_names, chunk_size)
+    elif kind == 'arrow':
+        chunks = _arrow_chunks(file, resolve_column_names, chunk_size)
+    else:
+        raise ValueError(f"Unsupported upload format: {kind}")
+    for chunk in chunks:
+        yield compact_dtypes(chunk) if COMPACT_DTYPES else chunk
+
+
+def read_upload_file(path, fmt, resolve_column_names, chunk_size):
+    """read_upload_chunks for an upload spooled to disk."""
+    with open(path, 'rb') as upload:
+        yield from read_upload_chunks(upload, fmt, resolve_column_names, chunk_size)
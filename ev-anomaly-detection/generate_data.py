@@ -1,61 +1,227 @@
-import pandas as pd
-import numpy as np
-from faker import Faker
-import random
-from datetime import datetime, timedelta
+"""
+Generates synthetic EV charging sessions with injected anomalies.
+
+    python generate_data.py                                   # 10,000 rows -> data/ev_charging_data.csv
+    python generate_data.py --rows 10000000 --output data/sessions_10m.parquet
+    python generate_data.py --rows 100000000 --output data/sessions_100m.csv.gz --chunk-size 2000000
 
-fake = Faker()
+Rows are built with vectorized NumPy in chunks of --chunk-size and appended
+to the output, so memory stays bounded at any row count. The same --seed
+(and --chunk-size) always gives the same file. The format follows the output
+name: .csv, .csv.gz or .parquet (Parquet needs pyarrow).
+"""
+import argparse
+import gzip
+import time
+
+import numpy as np
+import pandas as pd
 
 # Configuration
-NUM_ROWS = 10000      # Changed from 100000
-ANOMALY_RATE = 0.16   # Changed to 16%
-# Generate base data
-data = {
-    'session_id': [fake.uuid4() for _ in range(NUM_ROWS)],
-    'user_id': [random.randint(1000, 1050) for _ in range(NUM_ROWS)],
-    'start_time': [fake.date_time_between(start_date='-1y', end_date='now') for _ in range(NUM_ROWS)],
-    'energy_kWh': np.random.uniform(5.0, 75.0, NUM_ROWS).round(2),
-    'ip_address': [fake.ipv4() for _ in range(NUM_ROWS)],
-    'geo_location': [f"{fake.latitude()},{fake.longitude()}" for _ in range(NUM_ROWS)],
-    'cpu_usage_percent': np.random.uniform(10, 40, NUM_ROWS).round(2),
-    'packets_per_sec': np.random.randint(50, 200, NUM_ROWS)
-}
-df = pd.DataFrame(data)
-df['end_time'] = df['start_time'] + df['energy_kWh'].apply(lambda x: timedelta(minutes=x * 1.5))
-df['amount_INR'] = (df['energy_kWh'] * 18.5).round(2) # Assume a rate of ₹18.5/kWh
-df['anomaly_type'] = 'none'
-
-# --- Inject Anomalies ---
-num_anomalies = int(NUM_ROWS * ANOMALY_RATE)
-anomaly_indices = np.random.choice(df.index, num_anomalies, replace=False)
-
-anomaly_types = ['payment_fraud', 'multi_user_conflict', 'dos_attack']
-for i in anomaly_indices:
-    anomaly = random.choice(anomaly_types)
-    df.loc[i, 'anomaly_type'] = anomaly
-    
-    if anomaly == 'payment_fraud':
-        # Unauthorized free charging
-        df.loc[i, 'amount_INR'] = 0.0
-    elif anomaly == 'dos_attack':
-        # Simulate DoS attack with high CPU and packet rates
-        df.loc[i, 'cpu_usage_percent'] = np.random.uniform(90, 100)
-        df.loc[i, 'packets_per_sec'] = np.random.randint(1000, 5000)
-    elif anomaly == 'multi_user_conflict':
-        # Make another session for the same user overlap in time
-        conflict_user_id = df.loc[i, 'user_id']
-        conflict_start_time = df.loc[i, 'start_time'] + timedelta(minutes=5)
-        # Find a different, non-anomaly row to inject the conflict
-        potential_conflict_indices = df[(df.index != i) & (df['anomaly_type'] == 'none')].index
-        if len(potential_conflict_indices) > 0:
-            conflict_row_idx = np.random.choice(potential_conflict_indices)
-            df.loc[conflict_row_idx, 'user_id'] = conflict_user_id
-            df.loc[conflict_row_idx, 'start_time'] = conflict_start_time
-            df.loc[conflict_row_idx, 'geo_location'] = f"{fake.latitude()},{fake.longitude()}" # Different location
-            df.loc[conflict_row_idx, 'anomaly_type'] = 'multi_user_conflict'
-
-
-# Save to CSV
-df.to_csv('data/ev_charging_data.csv', index=False)
-print(f"Generated data/ev_charging_data.csv with {NUM_ROWS} rows.")
-print("Anomaly distribution:\n", df['anomaly_type'].value_counts())
+NUM_ROWS = 10000
+ANOMALY_RATE = 0.16   # 16% of rows get an injected anomaly
+CHUNK_SIZE = 1_000_000
+USER_ID_MIN, USER_ID_MAX = 1000, 1050
+TARIFF_INR_PER_KWH = 18.5
+# Sessions start at most one year before --end
+PERIOD = pd.Timedelta(days=365)
+DEFAULT_END = '2025-10-01'
+# Speed over size for .csv.gz output
+GZIP_LEVEL = 3
+
+ANOMALY_TYPES = np.array(['payment_fraud', 'multi_user_conflict', 'dos_attack'], dtype=object)
+COLUMNS = ['session_id', 'user_id', 'start_time', 'energy_kWh', 'ip_address', 'geo_location',
+           'cpu_usage_percent', 'packets_per_sec', 'end_time', 'amount_INR', 'anomaly_type']
+
+_HEX = np.frombuffer(b'0123456789abcdef', dtype=np.uint8)
+
+
+def uuid4_strings(rng, rows):
+    """Random version-4 UUID strings, built from one block of random bytes."""
+    raw = rng.integers(0, 256, size=(rows, 16), dtype=np.uint8)
+    raw[:, 6] = (raw[:, 6] & 0x0F) | 0x40  # version 4
+    raw[:, 8] = (raw[:, 8] & 0x3F) | 0x80  # RFC 4122 variant
+    digits = np.empty((rows, 32), dtype=np.uint8)
+    digits[:, 0::2] = _HEX[raw >> 4]
+    digits[:, 1::2] = _HEX[raw & 0x0F]
+    text = np.full((rows, 36), ord('-'), dtype=np.uint8)
+    for start, end, out in ((0, 8, 0), (8, 12, 9), (12, 16, 14), (16, 20, 19), (20, 32, 24)):
+        text[:, out:out + end - start] = digits[:, start:end]
+    return text.view('S36').ravel().astype(str)
+
+
+def _digits(values, pad=1):
+    """Decimal text of non-negative ints as a bytes array, zero-padded to `pad` digits."""
+    values = np.asarray(values, dtype=np.int64)
+    width = max(pad, len(str(int(values.max()))) if len(values) else 1)
+    lengths = np.maximum(np.searchsorted(10 ** np.arange(width, dtype=np.int64), values, side='right'), pad)
+    exponent = lengths[:, None] - 1 - np.arange(width)
+    digit = values[:, None] // 10 ** np.clip(exponent, 0, None) % 10
+    # Positions past each number's length stay NUL, which the 'S' dtype drops
+    text = np.where(exponent >= 0, digit + ord('0'), 0).astype(np.uint8)
+    return text.view(f'S{width}').ravel()
+
+
+def _join(*parts):
+    text = parts[0]
+    for part in parts[1:]:
+        text = np.char.add(text, part)
+    return text.astype(str)
+
+
+def ipv4_strings(rng, rows):
+    octets = [_digits(octet) for octet in rng.integers(1, 255, size=(4, rows))]
+    return _join(octets[0], b'.', octets[1], b'.', octets[2], b'.', octets[3])
+
+
+def _fixed6(values):
+    """'%.6f' text of floats already rounded to 6 decimals."""
+    micro = np.round(np.abs(values) * 1_000_000).astype(np.int64)
+    sign = np.where(values < 0, b'-', b'')
+    return np.char.add(np.char.add(np.char.add(sign, _digits(micro // 1_000_000)), b'.'), _digits(micro % 1_000_000, pad=6))
+
+
+def geo_strings(rng, rows):
+    latitude = _fixed6(rng.uniform(-90, 90, rows).round(6))
+    longitude = _fixed6(rng.uniform(-180, 180, rows).round(6))
+    return _join(latitude, b',', longitude)
+
+
+def session_end(start_time, energy_kwh):
+    """Charging takes 1.5 minutes per kWh (millisecond resolution, like the original data)."""
+    return start_time + pd.to_timedelta(np.round(energy_kwh * 90_000).astype(np.int64), unit='ms')
+
+
+def generate_chunk(rng, rows, anomaly_rate=ANOMALY_RATE, end=DEFAULT_END,
+                   user_ids=(USER_ID_MIN, USER_ID_MAX)):
+    """Returns one DataFrame of `rows` sessions, with anomalies injected in place."""
+    end = pd.Timestamp(end)
+    offsets = rng.integers(0, int(PERIOD.total_seconds()), rows)
+    energy = rng.uniform(5.0, 75.0, rows).round(2)
+    start_time = end - pd.to_timedelta(offsets, unit='s')
+    df = pd.DataFrame({
+        'session_id': uuid4_strings(rng, rows),
+        'user_id': rng.integers(user_ids[0], user_ids[1] + 1, rows),
+        'start_time': start_time,
+        'energy_kWh': energy,
+        'ip_address': ipv4_strings(rng, rows),
+        'geo_location': geo_strings(rng, rows),
+        'cpu_usage_percent': rng.uniform(10, 40, rows).round(2),
+        'packets_per_sec': rng.integers(50, 200, rows),
+    })
+    df['end_time'] = session_end(df['start_time'], energy)
+    df['amount_INR'] = (df['energy_kWh'] * TARIFF_INR_PER_KWH).round(2)
+    anomaly_type = np.full(rows, 'none', dtype=object)
+
+    # --- Inject Anomalies ---
+    num_anomalies = int(rows * anomaly_rate)
+    anomaly_indices = rng.choice(rows, num_anomalies, replace=False)
+    kinds = ANOMALY_TYPES[rng.integers(0, len(ANOMALY_TYPES), num_anomalies)]
+    anomaly_type[anomaly_indices] = kinds
+
+    # Unauthorized free charging
+    fraud = anomaly_indices[kinds == 'payment_fraud']
+    df.loc[fraud, 'amount_INR'] = 0.0
+
+    # DoS attack: high CPU and packet rates
+    dos = anomaly_indices[kinds == 'dos_attack']
+    df.loc[dos, 'cpu_usage_percent'] = rng.uniform(90, 100, len(dos))
+    df.loc[dos, 'packets_per_sec'] = rng.integers(1000, 5000, len(dos))
+
+    # Multi-user conflict: another, unflagged session of the same user starts
+    # 5 minutes after this one, from a different location
+    conflict = anomaly_indices[kinds == 'multi_user_conflict']
+    unflagged = np.flatnonzero(anomaly_type == 'none')
+    partners = rng.choice(unflagged, min(len(conflict), len(unflagged)), replace=False)
+    conflict = conflict[:len(partners)]
+    df.loc[partners, 'user_id'] = df['user_id'].to_numpy()[conflict]
+    df.loc[partners, 'start_time'] = df['start_time'].to_numpy()[conflict] + np.timedelta64(5, 'm')
+    df.loc[partners, 'end_time'] = session_end(df.loc[partners, 'start_time'], df.loc[partners, 'energy_kWh'])
+    df.loc[partners, 'geo_location'] = geo_strings(rng, len(partners))
+    anomaly_type[partners] = 'multi_user_conflict'
+
+    df['anomaly_type'] = anomaly_type
+    return df[COLUMNS]
+
+
+def generate_chunks(rows, seed=None, chunk_size=CHUNK_SIZE, **kwargs):
+    """Yields DataFrames totalling `rows` sessions; each chunk has its own anomalies."""
+    rng = np.random.default_rng(seed)
+    for start in range(0, rows, chunk_size):
+        yield generate_chunk(rng, min(chunk_size, rows - start), **kwargs)
+
+
+def generate(rows, seed=None, chunk_size=CHUNK_SIZE, **kwargs):
+    """All `rows` sessions as one DataFrame (for benchmarks and tests)."""
+    return pd.concat(list(generate_chunks(rows, seed, chunk_size, **kwargs)), ignore_index=True)
+
+
+def write_chunks(chunks, output):
+    """
+    Appends chunks to a .csv, .csv.gz or .parquet file; returns (rows, anomaly
+    counts). CSV is written with pyarrow's much faster writer when installed.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.csv as pa_csv
+        import pyarrow.parquet as pq
+    except ImportError:
+        pa = None
+    name = str(output).lower()
+    if name.endswith('.parquet') and pa is None:
+        raise SystemExit("Parquet output needs pyarrow (pip install pyarrow).")
+
+    rows = 0
+    counts = pd.Series(dtype='int64')
+    parquet_writer = None
+    handle = None
+    if name.endswith('.gz'):
+        handle = gzip.open(output, 'wb', compresslevel=GZIP_LEVEL)
+    elif not name.endswith('.parquet'):
+        handle = open(output, 'wb')
+    try:
+        for chunk in chunks:
+            if handle is None:
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                if parquet_writer is None:
+                    parquet_writer = pq.ParquetWriter(output, table.schema)
+                parquet_writer.write_table(table)
+            elif pa is not None:
+                options = pa_csv.WriteOptions(include_header=rows == 0, quoting_style='needed')
+                pa_csv.write_csv(pa.Table.from_pandas(chunk, preserve_index=False), handle, options)
+            else:
+                handle.write(chunk.to_csv(header=rows == 0, index=False).encode('utf-8'))
+            rows += len(chunk)
+            counts = counts.add(chunk['anomaly_type'].value_counts(), fill_value=0)
+    finally:
+        if handle is not None:
+            handle.close()
+        if parquet_writer is not None:
+            parquet_writer.close()
+    return rows, counts.astype('int64')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=NUM_ROWS)
+    parser.add_argument('--output', default='data/ev_charging_data.csv', help=".csv, .csv.gz or .parquet")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help="Rows generated and written at a time")
+    parser.add_argument('--anomaly-rate', type=float, default=ANOMALY_RATE)
+    parser.add_argument('--users', type=int, default=USER_ID_MAX - USER_ID_MIN + 1, help="Distinct user ids")
+    parser.add_argument('--end', default=DEFAULT_END, help="Latest session start; sessions span the year before it")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    chunks = generate_chunks(
+        args.rows, seed=args.seed, chunk_size=args.chunk_size, anomaly_rate=args.anomaly_rate,
+        end=args.end, user_ids=(USER_ID_MIN, USER_ID_MIN + args.users - 1),
+    )
+    rows, counts = write_chunks(chunks, args.output)
+    elapsed = time.perf_counter() - started
+    print(f"Generated {args.output} with {rows} rows in {elapsed:.1f}s ({rows / elapsed:,.0f} rows/s).")
+    print("Anomaly distribution:\n", counts.sort_values(ascending=False).to_string())
+
+
+if __name__ == '__main__':
+    main()
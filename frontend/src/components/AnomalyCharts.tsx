@@ -1,23 +1,42 @@
 import { Card } from "./ui/card";
 import { BarChart, Bar, PieChart, Pie, Cell, XAxis, YAxis, CartesianGrid, Tooltip, Legend, ResponsiveContainer } from "recharts";
-import type { EVSession } from "./EVDashboard";
+import type { EVSession, DashboardStats } from "./EVDashboard";
 
 interface AnomalyChartsProps {
   sessions: EVSession[];
+  // Server-side stats over every stored anomaly; null falls back to the loaded sessions
+  stats?: DashboardStats | null;
 }
 
-export function AnomalyCharts({ sessions }: AnomalyChartsProps) {
-  const fraudCount = sessions.filter(s => s.anomalyType === "fraud").length;
-  const dosCount = sessions.filter(s => s.anomalyType === "dos").length;
-  const multiuserCount = sessions.filter(s => s.anomalyType === "multiuser").length;
-  const normalCount = sessions.filter(s => !s.anomalyType).length;
+const tooltipStyle = {
+  backgroundColor: '#1e293b',
+  border: '1px solid #475569',
+  borderRadius: '6px'
+};
 
-  const pieData = [
-    { name: "Normal", value: normalCount, color: "#10b981" },
-    { name: "Bill Fraud", value: fraudCount, color: "#ef4444" },
-    { name: "DoS Attack", value: dosCount, color: "#8b5cf6" },
-    { name: "Multi-User", value: multiuserCount, color: "#f59e0b" },
-  ].filter(item => item.value > 0);
+export function AnomalyCharts({ sessions, stats }: AnomalyChartsProps) {
+  const byCheck = stats?.summary.by_check;
+  const pieData = (byCheck
+    ? [
+        { name: "Bill Fraud", value: byCheck.billing_fraud ?? 0, color: "#ef4444" },
+        { name: "DoS Attack", value: byCheck.dos_attack ?? 0, color: "#8b5cf6" },
+        { name: "Multi-User", value: byCheck.multi_user_conflict ?? 0, color: "#f59e0b" },
+        { name: "Impossible Travel", value: byCheck.impossible_travel ?? 0, color: "#06b6d4" },
+        { name: "IP/Charger Fan-out", value: byCheck.ip_charger_fanout ?? 0, color: "#ec4899" },
+      ]
+    : [
+        { name: "Normal", value: sessions.filter(s => !s.anomalyType).length, color: "#10b981" },
+        { name: "Bill Fraud", value: sessions.filter(s => s.anomalyType === "fraud").length, color: "#ef4444" },
+        { name: "DoS Attack", value: sessions.filter(s => s.anomalyType === "dos").length, color: "#8b5cf6" },
+        { name: "Multi-User", value: sessions.filter(s => s.anomalyType === "multiuser").length, color: "#f59e0b" },
+      ]
+  ).filter(item => item.value > 0);
+
+  const dailyData = (stats?.daily.buckets ?? []).map(bucket => ({
+    day: new Date(bucket.start).toLocaleDateString(),
+    anomalies: bucket.count
+  }));
+  const topUsers = stats?.topUsers.top ?? [];
 
   const barData = [
     {
@@ -40,7 +59,9 @@ export function AnomalyCharts({ sessions }: AnomalyChartsProps) {
   return (
     <div className="grid grid-cols-1 md:grid-cols-2 gap-6">
       <Card className="bg-slate-900 border-slate-800 p-6">
-        <h3 className="text-xl mb-4 text-white font-bold tracking-wide">Anomaly Distribution</h3>
+        <h3 className="text-xl mb-4 text-white font-bold tracking-wide">
+          Anomaly Distribution{stats ? " (all stored)" : ""}
+        </h3>
         <ResponsiveContainer width="100%" height={300}>
           <PieChart>
             <Pie
@@ -57,13 +78,7 @@ export function AnomalyCharts({ sessions }: AnomalyChartsProps) {
                 <Cell key={`cell-${index}`} fill={entry.color} />
               ))}
             </Pie>
-            <Tooltip 
-              contentStyle={{ 
-                backgroundColor: '#1e293b', 
-                border: '1px solid #475569',
-                borderRadius: '6px'
-              }}
-            />
+            <Tooltip contentStyle={tooltipStyle} />
           </PieChart>
         </ResponsiveContainer>
       </Card>
@@ -75,13 +90,7 @@ export function AnomalyCharts({ sessions }: AnomalyChartsProps) {
             <CartesianGrid strokeDasharray="3 3" stroke="#334155" />
             <XAxis dataKey="name" stroke="#64748b" />
             <YAxis stroke="#64748b" />
-            <Tooltip 
-              contentStyle={{ 
-                backgroundColor: '#1e293b', 
-                border: '1px solid #475569',
-                borderRadius: '6px'
-              }}
-            />
+            <Tooltip contentStyle={tooltipStyle} />
             <Legend />
             <Bar dataKey="energy" fill="#3b82f6" name="Total Energy (kWh)" />
             <Bar dataKey="sessions" fill="#8b5cf6" name="Session Count" />
@@ -89,6 +98,42 @@ export function AnomalyCharts({ sessions }: AnomalyChartsProps) {
         </ResponsiveContainer>
       </Card>
 
+      {stats && (
+        <Card className="bg-slate-900 border-slate-800 p-6">
+          <h3 className="text-xl mb-4 text-white font-bold tracking-wide">Anomalies per Day</h3>
+          <ResponsiveContainer width="100%" height={300}>
+            <BarChart data={dailyData}>
+              <CartesianGrid strokeDasharray="3 3" stroke="#334155" />
+              <XAxis dataKey="day" stroke="#64748b" />
+              <YAxis stroke="#64748b" allowDecimals={false} />
+              <Tooltip contentStyle={tooltipStyle} />
+              <Bar dataKey="anomalies" fill="#ef4444" name="Anomalies" />
+            </BarChart>
+          </ResponsiveContainer>
+        </Card>
+      )}
+
+      {stats && (
+        <Card className="bg-slate-900 border-slate-800 p-6">
+          <h3 className="text-xl mb-4 text-white font-bold tracking-wide">Top Users by Anomalies</h3>
+          {topUsers.length === 0 ? (
+            <p className="text-slate-500">No stored anomalies yet</p>
+          ) : (
+            <div className="space-y-2">
+              {topUsers.map(row => (
+                <div
+                  key={String(row.user_id)}
+                  className="flex items-center justify-between bg-slate-800 rounded-lg px-4 py-3 border border-slate-700"
+                >
+                  <span className="text-white font-semibold">User {row.user_id}</span>
+                  <span className="text-red-400 font-bold">{row.count}</span>
+                </div>
+              ))}
+            </div>
+          )}
+        </Card>
+      )}
+
       <Card className="bg-slate-900 border-slate-800 p-6 md:col-span-2">
         <h3 className="text-xl mb-4 text-white font-bold tracking-wide">Session Statistics</h3>
         <div className="grid grid-cols-2 md:grid-cols-4 gap-4">
@@ -1,4 +1,4 @@
-import { useState, useCallback } from "react";
+import { useState, useCallback, useEffect } from "react";
 import { StatsCards } from "./StatsCards";
 import { FileUpload } from "./FileUpload";
 import { AnomalyTable } from "./AnomalyTable";
@@ -9,6 +9,7 @@ import { Tabs, TabsContent, TabsList, TabsTrigger } from "./ui/tabs";
 import { Activity, FileText, DollarSign, Shield, Users, Database } from "lucide-react";
 import { Button } from "./ui/button";
 import { Dialog, DialogContent, DialogHeader, DialogTitle, DialogTrigger } from "./ui/dialog";
+import { api, type StatsSummary, type StatsHistogram, type StatsTop } from "../lib/api";
 
 export interface EVSession {
   sessionId: string;
@@ -24,17 +25,49 @@ export interface EVSession {
   payment?: number;
 }
 
+// Counts over every stored anomaly, from the backend's /stats/ rollups
+export interface DashboardStats {
+  summary: StatsSummary;
+  daily: StatsHistogram;
+  topUsers: StatsTop;
+}
+
+const STATS_DAYS = 30;
+const STATS_TOP_USERS = 5;
+
 export function EVDashboard() {
   const [sessions, setSessions] = useState<EVSession[]>([]);
   const [selectedAlert, setSelectedAlert] = useState<EVSession | null>(null);
+  const [stats, setStats] = useState<DashboardStats | null>(null);
+
+  const refreshStats = useCallback(async () => {
+    try {
+      const since = new Date(Date.now() - STATS_DAYS * 24 * 60 * 60 * 1000).toISOString();
+      const [summary, daily, topUsers] = await Promise.all([
+        api.fetchStatsSummary(),
+        api.fetchStatsHistogram({ bucket: 'day', since }),
+        api.fetchStatsTop({ by: 'user', limit: STATS_TOP_USERS }),
+      ]);
+      setStats({ summary, daily, topUsers });
+    } catch (error: any) {
+      // Without the backend the cards and charts fall back to the loaded sessions
+      console.error('Failed to fetch stats:', error);
+      setStats(null);
+    }
+  }, []);
+
+  useEffect(() => {
+    refreshStats();
+  }, [refreshStats]);
 
   const handleFileUpload = useCallback((parsedSessions: EVSession[]) => {
     setSessions(parsedSessions);
+    refreshStats();
     const firstCritical = parsedSessions.find(s => s.status === "critical");
     if (firstCritical) {
       setSelectedAlert(firstCritical);
     }
-  }, []);
+  }, [refreshStats]);
 
   const criticalCount = sessions.filter(s => s.status === "critical").length;
   const warningCount = sessions.filter(s => s.status === "warning").length;
@@ -83,6 +116,7 @@ export function EVDashboard() {
           fraudCount={fraudSessions.length}
           dosCount={dosSessions.length}
           multiuserCount={multiuserSessions.length}
+          summary={stats?.summary}
         />
 
         <div className="grid grid-cols-1 lg:grid-cols-3 gap-6">
@@ -150,7 +184,7 @@ export function EVDashboard() {
               </TabsContent>
               
               <TabsContent value="analytics" className="mt-4">
-                <AnomalyCharts sessions={sessions} />
+                <AnomalyCharts sessions={sessions} stats={stats} />
               </TabsContent>
             </Tabs>
           </div>
@@ -6,6 +6,12 @@ import { api } from "../lib/api";
 import { transformBackendAnomalyToSession } from "../lib/transformers";
 import type { EVSession } from "./EVDashboard";
 
+// Formats accepted by the backend's /predict/ endpoint
+const UPLOAD_EXTENSIONS = [
+  ".csv", ".csv.gz", ".csv.gzip", ".csv.zst", ".csv.zstd",
+  ".parquet", ".pq", ".arrow", ".feather", ".ipc",
+];
+
 interface FileUploadProps {
   onFileUpload: (sessions: EVSession[]) => void;
 }
@@ -18,8 +24,8 @@ export function FileUpload({ onFileUpload }: FileUploadProps) {
     const file = event.target.files?.[0];
     if (!file) return;
 
-    if (!file.name.endsWith('.csv')) {
-      toast.error("Please upload a CSV file");
+    if (!UPLOAD_EXTENSIONS.some((ext) => file.name.toLowerCase().endsWith(ext))) {
+      toast.error("Please upload a CSV, Parquet or Arrow/Feather file");
       return;
     }
 
@@ -75,7 +81,7 @@ export function FileUpload({ onFileUpload }: FileUploadProps) {
       <input
         ref={fileInputRef}
         type="file"
-        accept=".csv"
+        accept={UPLOAD_EXTENSIONS.join(",")}
         onChange={handleFileChange}
         className="hidden"
         disabled={isUploading}
@@ -20,13 +20,34 @@ interface LogEntry {
   sessionCount: number;
   anomalyCount: number;
   sessions: EVSession[];
+  // Cursor of the next (older) page, or null once every stored anomaly is loaded
+  nextCursor: string | null;
 }
 
 export function LogsViewer({ onLoadLog }: LogsViewerProps) {
   const [logs, setLogs] = useState<LogEntry[]>([]);
   const [isLoading, setIsLoading] = useState(false);
+  const [loadingMoreId, setLoadingMoreId] = useState<string | null>(null);
   const [searchQuery, setSearchQuery] = useState("");
 
+  const showFetchError = (error: any) => {
+    console.error('Failed to fetch logs:', error);
+
+    if (error.response) {
+      toast.error(
+        `Failed to fetch logs: ${error.response.data.detail || 'Server error'}`,
+        { description: 'Check if your backend server is running' }
+      );
+    } else if (error.request) {
+      toast.error(
+        'Cannot connect to backend server',
+        { description: 'Make sure your FastAPI server is running on http://localhost:8000' }
+      );
+    } else {
+      toast.error('Failed to fetch logs', { description: error.message });
+    }
+  };
+
   const fetchLogsFromMongoDB = async () => {
     setIsLoading(true);
     
@@ -37,39 +58,53 @@ export function LogsViewer({ onLoadLog }: LogsViewerProps) {
       // Transform backend data to frontend format
       const transformedSessions = response.anomalies.map(transformBackendAnomalyToSession);
       
-      // Create a single log entry with all the data
+      // Create a log entry with the first (newest) page; older pages are loaded on demand
       const logEntry: LogEntry = {
         _id: `log_${Date.now()}`,
         timestamp: new Date().toLocaleString(),
         sessionCount: transformedSessions.length,
         anomalyCount: transformedSessions.filter(s => s.anomalyType !== null).length,
-        sessions: transformedSessions
+        sessions: transformedSessions,
+        nextCursor: response.next_cursor ?? null
       };
       
       setLogs([logEntry, ...logs]);
       
-      toast.success(`Fetched ${transformedSessions.length} sessions from MongoDB`);
+      toast.success(
+        `Fetched ${transformedSessions.length} sessions from MongoDB`,
+        logEntry.nextCursor ? { description: 'Newest page only; use "Load older" for more' } : undefined
+      );
     } catch (error: any) {
-      console.error('Failed to fetch logs:', error);
-      
-      if (error.response) {
-        toast.error(
-          `Failed to fetch logs: ${error.response.data.detail || 'Server error'}`,
-          { description: 'Check if your backend server is running' }
-        );
-      } else if (error.request) {
-        toast.error(
-          'Cannot connect to backend server',
-          { description: 'Make sure your FastAPI server is running on http://localhost:8000' }
-        );
-      } else {
-        toast.error('Failed to fetch logs', { description: error.message });
-      }
+      showFetchError(error);
     } finally {
       setIsLoading(false);
     }
   };
 
+  const fetchOlderPage = async (log: LogEntry) => {
+    if (!log.nextCursor) return;
+    setLoadingMoreId(log._id);
+
+    try {
+      const response = await api.fetchLogs({ cursor: log.nextCursor });
+      const olderSessions = response.anomalies.map(transformBackendAnomalyToSession);
+
+      setLogs(current => current.map(entry => entry._id !== log._id ? entry : {
+        ...entry,
+        sessions: [...entry.sessions, ...olderSessions],
+        sessionCount: entry.sessionCount + olderSessions.length,
+        anomalyCount: entry.anomalyCount + olderSessions.filter(s => s.anomalyType !== null).length,
+        nextCursor: response.next_cursor ?? null
+      }));
+
+      toast.success(`Fetched ${olderSessions.length} older sessions from MongoDB`);
+    } catch (error: any) {
+      showFetchError(error);
+    } finally {
+      setLoadingMoreId(null);
+    }
+  };
+
   const filteredLogs = logs.filter(log => 
     log._id.toLowerCase().includes(searchQuery.toLowerCase()) ||
     log.timestamp.toLowerCase().includes(searchQuery.toLowerCase())
@@ -157,10 +192,27 @@ export function LogsViewer({ onLoadLog }: LogsViewerProps) {
                     </div>
                   </div>
 
-                  <div className="mt-3 pt-3 border-t border-slate-700">
+                  <div className="mt-3 pt-3 border-t border-slate-700 flex items-center justify-between">
                     <p className="text-sm text-blue-400 group-hover:text-blue-300">
                       Click to load this log →
                     </p>
+                    {log.nextCursor && (
+                      <Button
+                        size="sm"
+                        variant="outline"
+                        disabled={loadingMoreId === log._id}
+                        onClick={(e) => {
+                          e.stopPropagation();
+                          fetchOlderPage(log);
+                        }}
+                        className="border-slate-600 text-slate-300"
+                      >
+                        {loadingMoreId === log._id ? (
+                          <Loader2 className="w-4 h-4 mr-2 animate-spin" />
+                        ) : null}
+                        Load older
+                      </Button>
+                    )}
                   </div>
                 </Card>
               ))}
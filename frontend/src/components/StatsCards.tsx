@@ -1,5 +1,6 @@
 import { Activity, Zap, IndianRupee, Shield, Users, Bell, AlertTriangle } from "lucide-react";
 import { Card } from "./ui/card";
+import type { StatsSummary } from "../lib/api";
 
 interface StatsCardsProps {
   activeSessions: number;
@@ -9,6 +10,8 @@ interface StatsCardsProps {
   fraudCount?: number;
   dosCount?: number;
   multiuserCount?: number;
+  // Server-side totals; when present they replace the per-check counts of the loaded sessions
+  summary?: StatsSummary | null;
 }
 
 export function StatsCards({ 
@@ -18,8 +21,16 @@ export function StatsCards({
   totalSessions,
   fraudCount = 0,
   dosCount = 0,
-  multiuserCount = 0
+  multiuserCount = 0,
+  summary
 }: StatsCardsProps) {
+  if (summary) {
+    fraudCount = summary.by_check.billing_fraud ?? 0;
+    dosCount = summary.by_check.dos_attack ?? 0;
+    multiuserCount = summary.by_check.multi_user_conflict ?? 0;
+  }
+  const scope = summary ? "All stored anomalies" : "Loaded sessions";
+
   return (
     <div className="space-y-4">
       <div className="grid grid-cols-1 md:grid-cols-2 lg:grid-cols-4 gap-4">
@@ -73,7 +84,7 @@ export function StatsCards({
                 <p className="text-white text-base font-bold tracking-wide">Bill Fraud Detected</p>
               </div>
               <p className="text-3xl text-red-400 font-bold">{fraudCount}</p>
-              <p className="text-xs text-red-300 mt-1 font-medium">High Energy / Low Payment</p>
+              <p className="text-xs text-red-300 mt-1 font-medium">High Energy / Low Payment · {scope}</p>
             </div>
           </div>
         </Card>
@@ -86,7 +97,7 @@ export function StatsCards({
                 <p className="text-white text-base font-bold tracking-wide">DoS Attacks Detected</p>
               </div>
               <p className="text-3xl text-purple-400 font-bold">{dosCount}</p>
-              <p className="text-xs text-purple-300 mt-1 font-medium">System Abuse Attempts</p>
+              <p className="text-xs text-purple-300 mt-1 font-medium">System Abuse Attempts · {scope}</p>
             </div>
           </div>
         </Card>
@@ -99,7 +110,7 @@ export function StatsCards({
                 <p className="text-white text-base font-bold tracking-wide">Multi-User Conflicts</p>
               </div>
               <p className="text-3xl text-amber-400 font-bold">{multiuserCount}</p>
-              <p className="text-xs text-amber-300 mt-1 font-medium">Overlapping Sessions</p>
+              <p className="text-xs text-amber-300 mt-1 font-medium">Overlapping Sessions · {scope}</p>
             </div>
           </div>
         </Card>
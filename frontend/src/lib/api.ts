@@ -22,6 +22,29 @@ export interface PredictResponse {
 
 export interface LogsResponse {
   anomalies: BackendAnomaly[];
+  next_cursor?: string | null;
+}
+
+export interface StatsSummary {
+  total: number;
+  by_type: Record<string, number>;
+  by_check: Record<string, number>;
+}
+
+export interface StatsBucket {
+  start: string;
+  count: number;
+  by_type: Record<string, number>;
+}
+
+export interface StatsHistogram {
+  bucket: 'hour' | 'day';
+  buckets: StatsBucket[];
+}
+
+export interface StatsTop {
+  by: 'user' | 'session';
+  top: Array<{ user_id?: string | number; session_id?: string; count: number; by_type: Record<string, number> }>;
 }
 
 export const api = {
@@ -43,9 +66,27 @@ export const api = {
     return response.data;
   },
 
-  // Fetch all logs from MongoDB
-  fetchLogs: async (): Promise<LogsResponse> => {
-    const response = await axios.get<LogsResponse>(`${API_BASE_URL}/logs/`);
+  // Fetch one page of logs from MongoDB, newest first; pass next_cursor for the following page
+  fetchLogs: async (params?: { cursor?: string; limit?: number }): Promise<LogsResponse> => {
+    const response = await axios.get<LogsResponse>(`${API_BASE_URL}/logs/`, { params });
+    return response.data;
+  },
+
+  // Dashboard stats, aggregated server-side from the rollups
+  fetchStatsSummary: async (params?: { since?: string; until?: string }): Promise<StatsSummary> => {
+    const response = await axios.get<StatsSummary>(`${API_BASE_URL}/stats/summary`, { params });
+    return response.data;
+  },
+
+  fetchStatsHistogram: async (
+    params?: { bucket?: 'hour' | 'day'; since?: string; until?: string; anomaly_type?: string; limit?: number }
+  ): Promise<StatsHistogram> => {
+    const response = await axios.get<StatsHistogram>(`${API_BASE_URL}/stats/histogram`, { params });
+    return response.data;
+  },
+
+  fetchStatsTop: async (params?: { by?: 'user' | 'session'; limit?: number }): Promise<StatsTop> => {
+    const response = await axios.get<StatsTop>(`${API_BASE_URL}/stats/top`, { params });
     return response.data;
   },
 };
\ No newline at end of file